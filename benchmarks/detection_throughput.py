@@ -0,0 +1,59 @@
+"""
+Layout-detection throughput: per-image calls vs. BatchedDetector.
+
+Usage (from the repo root):
+    python -m benchmarks.detection_throughput [--pdf-folder input_pdfs] [--batch-sizes 1 4 8 16]
+"""
+import argparse
+import os
+import time
+
+from config import PDF_FOLDER, DETECT_IMGSZ, get_model_detect
+from pipeline.inference import BatchedDetector
+from pipeline.rendering import render_pages
+
+
+def load_pages(pdf_folder, max_pages):
+    pages = []
+    for pdf_file in sorted(os.listdir(pdf_folder)):
+        if pdf_file.lower().endswith(".pdf"):
+            pages.extend(img for _, img in render_pages(os.path.join(pdf_folder, pdf_file)))
+        if len(pages) >= max_pages:
+            break
+    return pages[:max_pages]
+
+
+def per_image_pages_per_sec(pages):
+    """The pre-batching path: one model_detect call per page at its native size."""
+    model_detect = get_model_detect()
+    model_detect(pages[0], save=False, verbose=False)  # warm-up
+    start = time.perf_counter()
+    for img in pages:
+        model_detect(img, save=False, verbose=False)
+    return len(pages) / (time.perf_counter() - start)
+
+
+def batched_pages_per_sec(pages, batch_size):
+    detector = BatchedDetector(get_model_detect(), DETECT_IMGSZ, batch_size)
+    detector.predict(pages[:batch_size])  # warm-up
+    start = time.perf_counter()
+    detector.predict(pages)
+    return len(pages) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf-folder", default=PDF_FOLDER)
+    parser.add_argument("--max-pages", type=int, default=64)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    pages = load_pages(args.pdf_folder, args.max_pages)
+    print(f"📄 {len(pages)} pages rendered")
+    print(f"per-image       : {per_image_pages_per_sec(pages):7.2f} pages/s")
+    for batch_size in args.batch_sizes:
+        print(f"batched (n={batch_size:>3}): {batched_pages_per_sec(pages, batch_size):7.2f} pages/s")
+
+
+if __name__ == "__main__":
+    main()
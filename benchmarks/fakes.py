@@ -0,0 +1,152 @@
+"""
+Local stand-ins for Gemini and the layout models, for offline benchmarks.
+
+FakeGeminiClient has the parts of google.genai.Client that the pipeline uses:
+client.models.generate_content / generate_content_stream / embed_content.
+Each call sleeps `latency + per_token * tokens` (time.sleep releases the GIL,
+like a blocking HTTP call) and returns deterministic output. Embeddings are
+hashed bags of words, so chunks and queries that share terms end up close.
+
+FakeLayoutDetector / FakeChartClassifier replace BatchedDetector /
+BatchedClassifier: fixed chart and table boxes per page (as fractions of the
+page, matching benchmarks.pipeline_latency's synthetic PDFs) and a
+per-image latency in place of YOLO.
+"""
+import re
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+
+from pipeline.ratelimit import estimate_tokens
+from pipeline.pdf_processing import FIGURE_CLASS, FIGURE_CAPTION_CLASS, TABLE_CLASS
+
+_WORD = re.compile(r"[A-Za-z0-9]+")
+
+# (x1, y1, x2, y2) as fractions of the page; the synthetic PDFs draw their figures here
+CHART_BOX = (0.10, 0.40, 0.55, 0.58)
+CHART_CAPTION_BOX = (0.10, 0.58, 0.55, 0.61)
+TABLE_BOX = (0.45, 0.66, 0.90, 0.86)
+
+
+def hashed_embedding(text, dim):
+    """Unit-norm hashed bag of words (float32)."""
+    vec = np.zeros(dim, dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        vec[zlib.crc32(word.encode()) % dim] += 1.0
+    vec[zlib.crc32(text.encode()) % dim] += 0.5  # identical texts stay distinguishable from near-duplicates
+    return vec / np.linalg.norm(vec)
+
+
+class _FakeModels:
+    def __init__(self, client):
+        self.client = client
+
+    def _sleep(self, latency, tokens):
+        self.client._record(latency + self.client.per_token * tokens)
+
+    @staticmethod
+    def _prompt_text(contents):
+        parts = contents if isinstance(contents, list) else [contents]
+        return " ".join(p for p in parts if isinstance(p, str))
+
+    def _answer(self, contents):
+        prompt = self._prompt_text(contents)
+        words = _WORD.findall(prompt)[-40:] or ["nothing"]
+        sentences = [f"Point {i + 1}: " + " ".join(words[i::self.client.answer_sentences]) + "."
+                     for i in range(self.client.answer_sentences)]
+        return prompt, " ".join(sentences)
+
+    def generate_content(self, model, contents, **kwargs):
+        prompt, text = self._answer(contents)
+        self._sleep(self.client.generate_latency, estimate_tokens(prompt) + estimate_tokens(text))
+        return SimpleNamespace(text=text)
+
+    def generate_content_stream(self, model, contents, **kwargs):
+        prompt, text = self._answer(contents)
+        # Time to first token, then the rest of the answer in a few pieces
+        self._sleep(self.client.generate_latency, estimate_tokens(prompt))
+        pieces = re.findall(r"\S+\s*", text)
+        step = max(1, len(pieces) // self.client.stream_chunks)
+        for i in range(0, len(pieces), step):
+            piece = "".join(pieces[i:i+step])
+            self._sleep(0.0, estimate_tokens(piece))
+            yield SimpleNamespace(text=piece)
+
+    def embed_content(self, model, contents, config=None, **kwargs):
+        contents = contents if isinstance(contents, list) else [contents]
+        dim = getattr(config, "output_dimensionality", None) or self.client.embedding_dim
+        self._sleep(self.client.embed_latency, sum(estimate_tokens(t) for t in contents))
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=hashed_embedding(t, dim).tolist())
+                                           for t in contents])
+
+
+class FakeGeminiClient:
+    def __init__(self, generate_latency=0.3, embed_latency=0.1, per_token=0.0, embedding_dim=768,
+                 answer_sentences=6, stream_chunks=8):
+        """
+        Args:
+            generate_latency (float): Seconds per generate_content call (time to first token when streaming).
+            embed_latency (float): Seconds per embed_content call (one call embeds a whole batch).
+            per_token (float): Extra seconds per estimated input + output token.
+        """
+        self.generate_latency = generate_latency
+        self.embed_latency = embed_latency
+        self.per_token = per_token
+        self.embedding_dim = embedding_dim
+        self.answer_sentences = answer_sentences
+        self.stream_chunks = stream_chunks
+        self.models = _FakeModels(self)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.simulated_seconds = 0.0
+
+    def _record(self, seconds):
+        with self._lock:
+            self.calls += 1
+            self.simulated_seconds += seconds
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def stats(self):
+        return {"calls": self.calls, "simulated_seconds": round(self.simulated_seconds, 3)}
+
+
+def _pixels(box, shape):
+    h, w = shape[:2]
+    x1, y1, x2, y2 = box
+    return np.array([int(x1 * w), int(y1 * h), int(x2 * w), int(y2 * h)])
+
+
+class FakeLayoutDetector:
+    """BatchedDetector stand-in: one chart (with caption) and one table per page."""
+
+    def __init__(self, batch_size=8, latency_per_image=0.0):
+        self.batch_size = batch_size
+        self.latency_per_image = latency_per_image
+        self.images = 0
+
+    def predict(self, images):
+        if self.latency_per_image:
+            time.sleep(self.latency_per_image * len(images))
+        self.images += len(images)
+        return [[(_pixels(CHART_BOX, img.shape), 0.9, FIGURE_CLASS),
+                 (_pixels(CHART_CAPTION_BOX, img.shape), 0.8, FIGURE_CAPTION_CLASS),
+                 (_pixels(TABLE_BOX, img.shape), 0.9, TABLE_CLASS)] for img in images]
+
+
+class FakeChartClassifier:
+    """BatchedClassifier stand-in: every crop is a chart (class 0)."""
+
+    def __init__(self, batch_size=32, latency_per_image=0.0):
+        self.batch_size = batch_size
+        self.latency_per_image = latency_per_image
+        self.images = 0
+
+    def predict(self, images):
+        if self.latency_per_image:
+            time.sleep(self.latency_per_image * len(images))
+        self.images += len(images)
+        return [(0, 0.95) for _ in images]
@@ -0,0 +1,172 @@
+"""
+Filtered ANN retrieval on a corpus large enough for the planner to use the index.
+
+Loads N synthetic chunks (clustered random embeddings, no Gemini needed) spread over
+report dates and documents into the `rag_bench` schema of a scratch Postgres,
+builds the configured ANN index, then runs fetch_chunks with the filters the
+chatbot uses: none, one report date, LATEST (the newest date holds ~1% of the
+rows) and one document. For each it reports how many rows the bare index scan
+returns, how many fetch_chunks returns (iterative scan on pgvector >= 0.8,
+exact re-scan below that) and their recall against an exact scan, the latency,
+and whether the plan uses the ANN index.
+
+Usage (from the repo root):
+    python -m benchmarks.filtered_retrieval [--rows 50000] [--dates 20] [--top-k 50] [--json filtered.json]
+    python -m benchmarks.filtered_retrieval --dsn postgresql://... --rows 200000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.pipeline_latency import BENCH_SCHEMA, CHUNK_TABLE_DDL, _local_server, open_bench_pool
+from config import EMBEDDING_DIM, VECTOR_INDEX_METHOD, VECTOR_METRIC, HNSW_EF_SEARCH, IVFFLAT_PROBES
+from pipeline.insert_chunks_pgvector import copy_chunks_into_pgvector
+from pipeline.retrieval import DEFAULT_TABLE, build_retrieval_query, fetch_chunks, format_vector
+from pipeline.schema import (
+    apply_search_params, ensure_vector_index, exact_search, get_vector_indexes, pgvector_version,
+)
+
+LATEST_SHARE = 0.01
+N_TOPICS = 100
+TOPIC_SPREAD = 0.6
+
+
+def synthetic_corpus(n_rows, n_dates, n_docs, dim, seed=0, topic_seed=0):
+    """
+    Chunks with unit-norm embeddings around N_TOPICS random topic centers. The
+    newest date gets LATEST_SHARE of the rows and the other dates split the rest
+    evenly. Queries come from the same topic_seed with another seed.
+
+    Returns:
+        tuple[list[dict], np.ndarray, list[str]]: chunks, embeddings, report dates (oldest first).
+    """
+    rng = np.random.default_rng(seed)
+    dates = [f"{2020 + i // 12}-{i % 12 + 1:02d}" for i in range(n_dates)]
+    weights = np.full(n_dates, (1 - LATEST_SHARE) / max(n_dates - 1, 1))
+    weights[-1] = LATEST_SHARE if n_dates > 1 else 1.0
+    row_dates = rng.choice(n_dates, size=n_rows, p=weights / weights.sum())
+    row_docs = rng.integers(0, n_docs, size=n_rows)
+    # Clustered like real chunk embeddings (topics), independent of date and document
+    centers = np.random.default_rng(topic_seed).standard_normal((N_TOPICS, dim), dtype=np.float32)
+    embeddings = centers[rng.integers(0, N_TOPICS, size=n_rows)] + TOPIC_SPREAD * rng.standard_normal(
+        (n_rows, dim), dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    chunks = [{"chunk_id": f"Vendor{doc}_Report_page{i // 10 + 1}_chunk{i}", "chunk_text": f"chunk {i}",
+               "report_date": dates[date], "page_num": i // 10 + 1, "type": "text", "placeholder": None}
+              for i, (date, doc) in enumerate(zip(row_dates, row_docs))]
+    return chunks, embeddings, dates
+
+
+def load_corpus(pool, chunks, embeddings):
+    """Fresh rag_bench schema with the chunk table, loaded first and indexed afterwards."""
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE;")
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS vector SCHEMA public;")
+        cursor.execute(f"CREATE SCHEMA {BENCH_SCHEMA};")
+        cursor.execute(CHUNK_TABLE_DDL)
+        conn.commit()
+        copy_chunks_into_pgvector(conn, chunks, embeddings)
+        cursor.execute(f"CREATE INDEX ON {DEFAULT_TABLE} (report_date);")
+        conn.commit()
+        start = time.perf_counter()
+        ensure_vector_index(conn, method=VECTOR_INDEX_METHOD, metric=VECTOR_METRIC)
+        build_seconds = time.perf_counter() - start
+        cursor.execute(f"ANALYZE {DEFAULT_TABLE};")
+        conn.commit()
+    return build_seconds
+
+
+def _uses_index(cursor, sql, params, index_names):
+    cursor.execute("EXPLAIN " + sql, params)
+    plan = "\n".join(row[0] for row in cursor.fetchall())
+    return any(name in plan for name in index_names)
+
+
+def run_filter(cursor, name, report_dates, matched_docs, queries, top_k, index_names):
+    """Bare index scan and fetch_chunks under one filter, compared with an exact scan."""
+    sql, params = build_retrieval_query(report_dates, matched_docs, top_k=top_k)
+    ann_rows, rows, recalls, latencies = [], [], [], []
+    uses_index = None
+    for query_embedding in queries:
+        query_params = dict(params, query_vec=format_vector(query_embedding))
+        with exact_search(cursor):
+            cursor.execute(sql, query_params)
+            exact = {row[0] for row in cursor.fetchall()}
+
+        # What the index alone returns: no iterative scan, no re-scan
+        apply_search_params(cursor, VECTOR_INDEX_METHOD, ef_search=HNSW_EF_SEARCH, probes=IVFFLAT_PROBES,
+                            top_k=top_k)
+        cursor.execute(sql, query_params)
+        ann_rows.append(len(cursor.fetchall()))
+        if uses_index is None:
+            uses_index = _uses_index(cursor, sql, query_params, index_names)
+
+        start = time.perf_counter()
+        got = fetch_chunks(cursor, query_embedding, report_dates, matched_docs, top_k=top_k, mode="vector")
+        latencies.append(time.perf_counter() - start)
+        rows.append(len(got))
+        recalls.append(len({row[0] for row in got} & exact) / len(exact) if exact else 1.0)
+    ms = np.array(latencies) * 1000
+    return {
+        "filter": name,
+        "index_only_rows_min": int(min(ann_rows)),
+        "rows_min": int(min(rows)),
+        "rows_mean": float(np.mean(rows)),
+        "recall": float(np.mean(recalls)),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "ann_plan": bool(uses_index),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dates", type=int, default=20)
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--dsn", help="Scratch Postgres with pgvector (default: a temporary pgserver instance)")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    chunks, embeddings, dates = synthetic_corpus(args.rows, args.dates, args.docs, EMBEDDING_DIM)
+    queries = synthetic_corpus(args.queries, 1, 1, EMBEDDING_DIM, seed=1)[1]
+    pool = open_bench_pool(args.dsn or _local_server())
+    try:
+        print(f"🚀 Loading {args.rows} chunks over {args.dates} report dates...")
+        build_seconds = load_corpus(pool, chunks, embeddings)
+        filters = [
+            ("none", [], []),
+            ("one date", [dates[len(dates) // 2]], []),
+            ("LATEST", ["LATEST"], []),
+            ("one doc", [], ["Vendor0_Report"]),
+        ]
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            version = ".".join(map(str, pgvector_version(cursor)))
+            index_names = [name for name, _, _ in get_vector_indexes(cursor, DEFAULT_TABLE)]
+            results = [run_filter(cursor, name, report_dates, docs, queries, args.top_k, index_names)
+                       for name, report_dates, docs in filters]
+            conn.rollback()
+    finally:
+        pool.close()
+
+    print(f"\n📊 {args.rows} rows, pgvector {version}, {VECTOR_INDEX_METHOD} built in {build_seconds:.1f}s, "
+          f"top_k={args.top_k}")
+    for r in results:
+        print(f"  {r['filter']:<9} index-only min={r['index_only_rows_min']:<4} "
+              f"rows min/mean={r['rows_min']}/{r['rows_mean']:.1f}  recall={r['recall']:.3f}  "
+              f"p50={r['p50_ms']:.1f}ms p95={r['p95_ms']:.1f}ms  ann_plan={r['ann_plan']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"pgvector": version, "index_build_seconds": build_seconds, "results": results,
+                       "args": vars(args)}, f, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
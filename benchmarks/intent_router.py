@@ -0,0 +1,51 @@
+"""
+Intent router accuracy and latency on a labeled sample.
+
+The sample (benchmarks/intent_sample.json, [[message, intent], ...]) is held
+out from the router's exemplars in pipeline/intent.py.
+
+Usage (from the repo root):
+    python -m benchmarks.intent_router [--sample benchmarks/intent_sample.json] [--margins 0 0.03 0.05]
+"""
+import argparse
+import json
+import os
+
+from pipeline.intent import IntentRouter
+from config import INTENT_MIN_MARGIN
+
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(__file__), "intent_sample.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sample", default=DEFAULT_SAMPLE)
+    parser.add_argument("--margins", type=float, nargs="+", default=[0.0, INTENT_MIN_MARGIN, 0.05, 0.1])
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    with open(args.sample) as f:
+        samples = [tuple(s) for s in json.load(f)]
+
+    results = []
+    for margin in args.margins:
+        router = IntentRouter(min_margin=margin)
+        result = router.evaluate(samples)
+        result["min_margin"] = margin
+        results.append(result)
+        lat = result["latency_ms"]
+        print(f"margin={margin:<5} accuracy={result['accuracy']:.1%}  coverage={result['coverage']:.1%}  "
+              f"accuracy_routed={result['accuracy_routed']:.1%}  "
+              f"latency p50={lat['p50']:.3f}ms p99={lat['p99']:.3f}ms")
+
+    print(f"\nConfusion at margin={args.margins[-1]} (rows: true, columns: routed; None = abstained)")
+    for label, row in results[-1]["confusion"].items():
+        print(f"  {label:<9} " + "  ".join(f"{str(p)}={n}" for p, n in row.items()))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
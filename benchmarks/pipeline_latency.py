@@ -0,0 +1,350 @@
+"""
+Offline ingestion + query latency on synthetic corpora of increasing size.
+
+No Gemini key, YOLO weights or RDS needed. Gemini and the layout models are
+replaced by benchmarks.fakes (with configurable latency). Postgres is a local
+server: pgserver (`pip install pgserver`, Postgres + pgvector in a temp dir)
+or any scratch database given with --dsn. Everything is created in a
+`rag_bench` schema, which is dropped first, so nothing outside it is touched.
+
+For each corpus size (in pages) it times, with the real pipeline code:
+    ingestion: process_pdfs (render + detect + text), summarize, chunk_full_json,
+               embed, insert (COPY into pgvector, HNSW + full-text indexes present)
+    queries:   query embedding, retrieve_chunks, match_figures, build_prompt (p50/p95/mean)
+
+Results are written as JSON with the git commit, so runs can be compared:
+    python -m benchmarks.pipeline_latency --sizes 20 100 400 --json bench.json
+    python -m benchmarks.pipeline_latency --sizes 20 100 400 --compare bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import fitz
+import numpy as np
+
+from benchmarks.fakes import FakeGeminiClient, FakeLayoutDetector, FakeChartClassifier, CHART_BOX, TABLE_BOX
+from config import (
+    EMBEDDING_DIM, VECTOR_INDEX_METHOD, VECTOR_METRIC, TEXT_SEARCH_CONFIG, RENDER_WORKERS, DETECT_BATCH_SIZE,
+    CLASSIFY_BATCH_SIZE,
+)
+from pipeline.catalog import ensure_documents_table
+from pipeline.database import PgPool
+from pipeline.dates import extract_report_dates
+from pipeline.embeddings import chunk_full_json, get_google_embeddings_raw
+from pipeline.figure_store import FigureStore
+from pipeline.insert_chunks_pgvector import insert_chunks_into_pgvector
+from pipeline.pdf_processing import process_pdfs
+from pipeline.ratelimit import RateLimiter
+from pipeline.run_query import retrieve_chunks, match_figures, build_prompt
+from pipeline.schema import ensure_vector_index, ensure_text_search
+from pipeline.summarization import summarize_all_table_chart_nodes_in_memory, merge_text_and_table_charts
+
+BENCH_SCHEMA = "rag_bench"
+CHUNK_TABLE_DDL = f"""
+CREATE TABLE {BENCH_SCHEMA}.pdf_chunks_768 (
+    id TEXT PRIMARY KEY,
+    content TEXT,
+    embedding vector({EMBEDDING_DIM}),
+    report_date TEXT,
+    page_num INT,
+    type TEXT,
+    placeholder TEXT
+);
+"""
+
+VENDORS = ["TrendForce", "Edgewater", "Gartner", "IDC", "Omdia", "Yole"]
+TOPICS = ["ServerDRAM", "MobileDRAM", "NANDFlash", "EnterpriseSSD", "HBM", "Foundry"]
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+TERMS = ["DDR5", "DDR4", "HBM3e", "HBM3", "LPDDR5X", "QLC", "TLC", "176L", "232L", "GDDR7",
+         "C1Q24", "C2Q24", "C3Q24", "C4Q24", "PCIe5", "CXL"]
+WORDS = ("contract price inventory demand supply shipments revenue capacity utilization outlook forecast "
+         "quarter growth decline server mobile module wafer bit output margin suppliers buyers "
+         "hyperscaler AI training inference enterprise consumer channel spot").split()
+
+
+# --------------------------
+# Synthetic corpus
+# --------------------------
+def _sentence(rng):
+    words = rng.sample(WORDS, 9)
+    words.insert(rng.randrange(len(words)), rng.choice(TERMS))
+    return " ".join(words).capitalize() + "."
+
+
+def write_synthetic_pdfs(folder, n_pages, pages_per_pdf=10, lines_per_page=34, seed=0):
+    """
+    PDFs named like real reports (`<Vendor>_<Topic>_<Mon><YYYY>.pdf`). Each page has
+    text lines around a drawn chart (CHART_BOX) and table (TABLE_BOX).
+
+    Returns:
+        list[str]: Report dates ('YYYY-MM') in the corpus.
+    """
+    rng = random.Random(seed)
+    dates = []
+    for doc_idx in range(-(-n_pages // pages_per_pdf)):
+        year, month = 2022 + doc_idx // 12 % 4, doc_idx % 12
+        name = f"{VENDORS[doc_idx % len(VENDORS)]}_{TOPICS[doc_idx // len(VENDORS) % len(TOPICS)]}{doc_idx}_{MONTHS[month]}{year}.pdf"
+        dates.append(f"{year}-{month + 1:02d}")
+        doc = fitz.open()
+        for _ in range(min(pages_per_pdf, n_pages - doc_idx * pages_per_pdf)):
+            page = doc.new_page()
+            w, h = page.rect.width, page.rect.height
+            for box in (CHART_BOX, TABLE_BOX):
+                page.draw_rect(fitz.Rect(box[0] * w, box[1] * h, box[2] * w, box[3] * h), color=(0, 0, 0.6),
+                               fill=(0.85, 0.9, 1.0))
+            y = 40
+            for _ in range(lines_per_page):
+                page.insert_text((36, y), _sentence(rng), fontsize=8)
+                y += (h - 80) / lines_per_page
+        doc.save(os.path.join(folder, name))
+        doc.close()
+    return sorted(set(dates))
+
+
+def synthetic_figure_store(text_nodes):
+    """Llama-style figures (a small table each) for every placeholder in the corpus."""
+    nodes = []
+    for node in text_nodes:
+        for placeholder in node["placeholder"]:
+            rows = [{"quarter": q, "value": round(random.Random(placeholder + q).uniform(1, 100), 1)}
+                    for q in ("C1Q24", "C2Q24", "C3Q24", "C4Q24")]
+            nodes.append({"placeholder": placeholder, "figures": [{"title": placeholder, "rows": rows}]})
+    return FigureStore.from_nodes(nodes)
+
+
+def synthetic_queries(dates, n, seed=1):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        year, month = rng.choice(dates).split("-")
+        queries.append(f"{' '.join(rng.sample(WORDS, 3))} {rng.choice(TERMS)} {MONTHS[int(month) - 1]} {year}")
+    return queries
+
+
+# --------------------------
+# Postgres fixture
+# --------------------------
+def _local_server():
+    try:
+        import pgserver
+    except ImportError:
+        raise SystemExit("pgserver is not installed: `pip install pgserver`, or pass --dsn / --no-db") from None
+    server = pgserver.get_server(tempfile.mkdtemp(prefix="rag_bench_pg_"), cleanup_mode="delete")
+    return server.get_uri()
+
+
+def open_bench_pool(dsn):
+    """Pool on the scratch database with a fresh rag_bench schema first on the search_path."""
+    return PgPool(minconn=1, maxconn=4, dsn=dsn, options=f"-c search_path={BENCH_SCHEMA},public")
+
+
+def reset_bench_schema(pool):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE;")
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS vector SCHEMA public;")
+        cursor.execute(f"CREATE SCHEMA {BENCH_SCHEMA};")
+        cursor.execute(CHUNK_TABLE_DDL)
+    with pool.connection() as conn:
+        ensure_vector_index(conn, method=VECTOR_INDEX_METHOD, metric=VECTOR_METRIC)
+        ensure_text_search(conn, config=TEXT_SEARCH_CONFIG)
+        ensure_documents_table(conn)
+
+
+# --------------------------
+# Timing
+# --------------------------
+@contextlib.contextmanager
+def _quiet(verbose):
+    """Silence the pipeline's progress prints; its progress log lines only show with --verbose."""
+    if verbose:
+        yield
+    else:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+
+
+def _timed(stages, name, verbose, func, *args, **kwargs):
+    start = time.perf_counter()
+    with _quiet(verbose):
+        result = func(*args, **kwargs)
+    stages[name] = time.perf_counter() - start
+    return result
+
+
+def _latency_summary(seconds):
+    ms = np.array(seconds) * 1000
+    return {"p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+            "mean_ms": float(ms.mean())}
+
+
+def run_size(n_pages, args, client, pool):
+    """Ingest a synthetic corpus of n_pages pages, then run the query stages against it."""
+    stages = {}
+    with tempfile.TemporaryDirectory(prefix="rag_bench_pdfs_") as folder:
+        dates = write_synthetic_pdfs(folder, n_pages, args.pages_per_pdf)
+        detector = FakeLayoutDetector(DETECT_BATCH_SIZE, args.detect_latency_ms / 1000)
+        classifier = FakeChartClassifier(CLASSIFY_BATCH_SIZE, args.classify_latency_ms / 1000)
+        _, text_nodes, table_chart_nodes = _timed(stages, "process_pdfs", args.verbose, process_pdfs,
+                                                  folder, args.render_workers, detector, classifier)
+
+    # Caches off and no client-side rate limit, so every call pays the simulated latency
+    summarized = _timed(stages, "summarize", args.verbose, summarize_all_table_chart_nodes_in_memory,
+                        client, table_chart_nodes, cache=False, rate_limiter=RateLimiter())
+    chunks = _timed(stages, "chunk_full_json", args.verbose, lambda: chunk_full_json(
+        merge_text_and_table_charts(text_nodes, summarized)))
+    embeddings = _timed(stages, "embedding", args.verbose, get_google_embeddings_raw,
+                        client, [c["chunk_text"] for c in chunks], cache=False, rate_limiter=RateLimiter())
+    result = {
+        "pages": len(text_nodes),
+        "pdfs": len(dates),
+        "figures": len(table_chart_nodes),
+        "chunks": len(chunks),
+        "ingestion": {},
+        "query": {},
+    }
+
+    if pool is not None:
+        with _quiet(args.verbose):
+            reset_bench_schema(pool)
+        _timed(stages, "insert", args.verbose, insert_chunks_into_pgvector, pool, chunks, embeddings)
+
+        figure_store = synthetic_figure_store(text_nodes)
+        per_query = {name: [] for name in ("embed_query", "retrieve_chunks", "match_figures", "build_prompt")}
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            for query_text in synthetic_queries(dates, args.queries):
+                timings = {}
+                # embed_query without its on-disk cache: repeated runs must not be cache hits (or fill it)
+                query_embedding = _timed(timings, "embed_query", args.verbose, get_google_embeddings_raw, client,
+                                         [query_text], cache=False, rate_limiter=RateLimiter())[0]
+                rows = _timed(timings, "retrieve_chunks", args.verbose, retrieve_chunks, cursor, query_embedding,
+                              extract_report_dates(query_text), [], query_text=query_text, fallback="best")
+                retrieved = [{"id": r[0], "content": r[1], "report_date": r[2], "placeholder": r[3],
+                              "similarity": r[4]} for r in rows]
+                figures = _timed(timings, "match_figures", args.verbose, match_figures, retrieved, figure_store)
+                _timed(timings, "build_prompt", args.verbose, build_prompt, query_text, retrieved, figures)
+                for name, seconds in timings.items():
+                    per_query[name].append(seconds)
+            conn.rollback()
+        result["query"] = {name: _latency_summary(seconds) for name, seconds in per_query.items()}
+
+    for name, seconds in stages.items():
+        unit = "chunk" if name in ("chunk_full_json", "embedding", "insert") else "page"
+        count = result[unit + "s"]
+        result["ingestion"][name] = {"seconds": round(seconds, 4), "unit": unit,
+                                     "ms_per_unit": round(seconds * 1000 / count, 3) if count else 0.0}
+    return result
+
+
+# --------------------------
+# Reporting
+# --------------------------
+def git_commit():
+    """(commit sha, working tree dirty?) of the repo, or (None, None) outside git."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        sha = subprocess.run(["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True,
+                             check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return sha, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def print_result(result):
+    print(f"\n📊 {result['pages']} pages / {result['pdfs']} PDFs / {result['figures']} figures / "
+          f"{result['chunks']} chunks")
+    for name, stage in result["ingestion"].items():
+        print(f"  {name:<16} {stage['seconds']:8.3f}s  ({stage['ms_per_unit']:.2f} ms/{stage['unit']})")
+    for name, stage in result["query"].items():
+        print(f"  {name:<16} p50={stage['p50_ms']:7.2f}ms  p95={stage['p95_ms']:7.2f}ms")
+
+
+def compare(previous, current):
+    """Print current / previous time per stage for corpus sizes present in both reports."""
+    print(f"\n🔁 vs {previous.get('commit', '?')[:10]} (ratio > 1 = slower now)")
+    old_runs = {r["pages"]: r for r in previous["runs"]}
+    for run in current["runs"]:
+        old = old_runs.get(run["pages"])
+        if not old:
+            continue
+        cells = []
+        for section, key in (("ingestion", "seconds"), ("query", "p50_ms")):
+            for name, stage in run[section].items():
+                before = old[section].get(name, {}).get(key)
+                if before:
+                    cells.append(f"{name}={stage[key] / before:.2f}x")
+        print(f"  {run['pages']:>5} pages: " + "  ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 100, 400], help="Corpus sizes in pages")
+    parser.add_argument("--pages-per-pdf", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=30, help="Queries per corpus size")
+    parser.add_argument("--generate-latency-ms", type=float, default=300.0)
+    parser.add_argument("--embed-latency-ms", type=float, default=100.0)
+    parser.add_argument("--per-token-ms", type=float, default=0.0)
+    parser.add_argument("--detect-latency-ms", type=float, default=0.0, help="Simulated layout model time per page")
+    parser.add_argument("--classify-latency-ms", type=float, default=0.0, help="Simulated classifier time per crop")
+    parser.add_argument("--render-workers", type=int, default=RENDER_WORKERS)
+    db = parser.add_mutually_exclusive_group()
+    db.add_argument("--dsn", help="Scratch Postgres with pgvector (default: a temporary pgserver instance)")
+    db.add_argument("--no-db", action="store_true", help="Skip insert and query stages")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Earlier --json output to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own progress output")
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+
+    client = FakeGeminiClient(args.generate_latency_ms / 1000, args.embed_latency_ms / 1000,
+                              args.per_token_ms / 1000, EMBEDDING_DIM)
+    pool = None if args.no_db else open_bench_pool(args.dsn or _local_server())
+    chunk_full_json([])  # the text splitter import is a one-time cost, not part of the first corpus
+
+    commit, dirty = git_commit()
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "args": vars(args),
+        "runs": [],
+    }
+    try:
+        for n_pages in sorted(args.sizes):
+            print(f"🚀 Corpus of {n_pages} pages...")
+            result = run_size(n_pages, args, client, pool)
+            print_result(result)
+            report["runs"].append(result)
+    finally:
+        if pool is not None:
+            pool.close()
+    report["fake_gemini"] = client.stats()
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
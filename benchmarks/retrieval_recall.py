@@ -0,0 +1,147 @@
+"""
+Offline recall@k: hybrid (full-text + vector, RRF) vs. vector-only retrieval.
+
+Labeled queries come from a JSON file ([{"query", "relevant": [chunk ids],
+"report_dates": [...]}, ...]) or are generated from the table itself with
+--synthetic N. A synthetic query takes a rare code-like term from a sampled
+chunk (part names, quarter codes such as "C3Q22" or "HBM3e"). Its relevant set
+is every chunk containing that term. Query embeddings go through the on-disk
+embedding cache, so repeated runs do not call the API again.
+
+Usage (from the repo root):
+    python -m benchmarks.retrieval_recall --synthetic 100 [--k 5 10 20] [--json recall.json]
+    python -m benchmarks.retrieval_recall --labels labeled_queries.json
+"""
+import argparse
+import json
+import random
+import re
+import time
+
+import numpy as np
+
+from config import (
+    VECTOR_METRIC, VECTOR_INDEX_METHOD, HNSW_EF_SEARCH, IVFFLAT_PROBES, VECTOR_ITERATIVE_SCAN, HNSW_MAX_SCAN_TUPLES,
+    IVFFLAT_MAX_PROBES, RRF_K,
+)
+from pipeline.database import get_pool
+from pipeline.retrieval import (
+    DEFAULT_TABLE, build_retrieval_query, build_hybrid_query, format_vector, lexical_query, text_search_ready,
+)
+from pipeline.schema import apply_search_params
+
+# Code-like terms: letters and digits mixed, e.g. HBM3e, C3Q22, DDR5, 176L
+_CODE_TERM = re.compile(r"\b(?=[A-Za-z0-9]*\d)(?=[A-Za-z0-9]*[A-Za-z])[A-Za-z0-9]{3,}\b")
+
+
+def synthetic_labels(cursor, n, table_name=DEFAULT_TABLE, max_relevant=20, seed=0):
+    """Queries built around rare code-like terms; relevant = chunks containing the term."""
+    cursor.execute(f"SELECT id, content FROM {table_name};")
+    rows = cursor.fetchall()
+    # Term -> chunks that contain it (case-insensitive)
+    postings = {}
+    for chunk_id, content in rows:
+        for term in set(t.lower() for t in _CODE_TERM.findall(content or "")):
+            postings.setdefault(term, set()).add(chunk_id)
+    rng = random.Random(seed)
+    rng.shuffle(rows)
+    labels, used = [], set()
+    for chunk_id, content in rows:
+        terms = [t for t in _CODE_TERM.findall(content or "")
+                 if t.lower() not in used and len(postings[t.lower()]) <= max_relevant]
+        if not terms:
+            continue
+        term = min(terms, key=lambda t: len(postings[t.lower()]))
+        used.add(term.lower())
+        words = re.findall(r"[A-Za-z]{4,}", content)
+        context = " ".join(rng.sample(words, min(3, len(words))))
+        labels.append({"query": f"{context} {term}".strip(), "relevant": sorted(postings[term.lower()])})
+        if len(labels) >= n:
+            break
+    return labels
+
+
+def _search(cursor, sql, params, query_text, query_embedding, top_k, table_name):
+    apply_search_params(cursor, VECTOR_INDEX_METHOD, ef_search=HNSW_EF_SEARCH, probes=IVFFLAT_PROBES,
+                        top_k=2 * top_k, table_name=table_name, iterative_scan=VECTOR_ITERATIVE_SCAN,
+                        max_scan_tuples=HNSW_MAX_SCAN_TUPLES, max_probes=IVFFLAT_MAX_PROBES)
+    params = dict(params, query_vec=format_vector(query_embedding), query_text=lexical_query(query_text))
+    start = time.perf_counter()
+    cursor.execute(sql, params)
+    ids = [row[0] for row in cursor.fetchall()]
+    return ids, time.perf_counter() - start
+
+
+def evaluate(cursor, labels, embeddings, ks, table_name=DEFAULT_TABLE, vector_weight=1.0, lexical_weight=1.0,
+             rrf_k=RRF_K):
+    """
+    Returns:
+        dict: {mode: {"recall@k": ..., "mrr": ..., "latency_ms_p50": ...}}
+    """
+    top_k = max(ks)
+    results = {}
+    for mode in ("vector", "hybrid"):
+        recalls = {k: [] for k in ks}
+        rr, latencies = [], []
+        for label, embedding in zip(labels, embeddings):
+            dates = label.get("report_dates", [])
+            if mode == "vector":
+                sql, params = build_retrieval_query(dates, [], top_k=top_k, table_name=table_name,
+                                                    metric=VECTOR_METRIC)
+            else:
+                sql, params = build_hybrid_query(dates, [], top_k=top_k, table_name=table_name,
+                                                 metric=VECTOR_METRIC, rrf_k=rrf_k,
+                                                 vector_weight=vector_weight, lexical_weight=lexical_weight)
+            ids, seconds = _search(cursor, sql, params, label["query"], embedding, top_k, table_name)
+            latencies.append(seconds)
+            relevant = set(label["relevant"])
+            for k in ks:
+                recalls[k].append(len(relevant.intersection(ids[:k])) / min(len(relevant), k))
+            first = next((i for i, chunk_id in enumerate(ids) if chunk_id in relevant), None)
+            rr.append(1 / (first + 1) if first is not None else 0.0)
+        results[mode] = {f"recall@{k}": float(np.mean(recalls[k])) for k in ks}
+        results[mode]["mrr"] = float(np.mean(rr))
+        results[mode]["latency_ms_p50"] = float(np.percentile(np.array(latencies) * 1000, 50))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--labels", help="JSON file of labeled queries")
+    source.add_argument("--synthetic", type=int, help="Generate this many labeled queries from the table")
+    parser.add_argument("--table", default=DEFAULT_TABLE)
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--vector-weight", type=float, default=1.0)
+    parser.add_argument("--lexical-weight", type=float, default=1.0)
+    parser.add_argument("--rrf-k", type=float, default=RRF_K)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    from google import genai
+    from pipeline.embeddings import get_google_embeddings_raw
+
+    with get_pool().connection() as conn:
+        cursor = conn.cursor()
+        if not text_search_ready(cursor, args.table):
+            raise SystemExit("Full-text column missing: run main_rebuild_index.py first")
+        if args.labels:
+            with open(args.labels) as f:
+                labels = json.load(f)
+        else:
+            labels = synthetic_labels(cursor, args.synthetic, args.table)
+        print(f"📋 {len(labels)} labeled queries")
+        embeddings = get_google_embeddings_raw(genai.Client(), [label["query"] for label in labels])
+        results = evaluate(cursor, labels, embeddings, args.k, args.table,
+                           args.vector_weight, args.lexical_weight, args.rrf_k)
+        conn.rollback()
+
+    for mode, metrics in results.items():
+        print(f"{mode:<7} " + "  ".join(f"{name}={value:.3f}" for name, value in metrics.items()))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"queries": len(labels), "results": results, "args": vars(args)}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Chatbot cold-start benchmark: import time, peak RSS and whether torch got loaded.
+
+Each run is a fresh interpreter importing what main_chatbot.py imports.
+
+Usage (from the repo root):
+    python -m benchmarks.startup [--runs 5] [--json startup.json]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+CHATBOT_IMPORTS = [
+    "config",
+    "pipeline.chatbot",
+    "pipeline.database",
+    "pipeline.run_query",
+    "pipeline.llamajson",
+    "google.genai",
+]
+
+_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": seconds,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "torch_loaded": "torch" in sys.modules,
+    "ultralytics_loaded": "ultralytics" in sys.modules,
+}}))
+"""
+
+
+def run_once(modules):
+    out = subprocess.run([sys.executable, "-c", _PROBE.format(modules=modules)],
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="Write the summary to this file")
+    args = parser.parse_args()
+
+    runs = [run_once(CHATBOT_IMPORTS) for _ in range(args.runs)]
+    summary = {
+        "runs": args.runs,
+        "import_seconds_median": statistics.median(r["seconds"] for r in runs),
+        "import_seconds_min": min(r["seconds"] for r in runs),
+        "max_rss_mb_median": statistics.median(r["max_rss_mb"] for r in runs),
+        "torch_loaded": any(r["torch_loaded"] for r in runs),
+        "ultralytics_loaded": any(r["ultralytics_loaded"] for r in runs),
+    }
+    print(json.dumps(summary, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    if summary["torch_loaded"]:
+        print("⚠️ torch was imported on the chatbot path")
+
+
+if __name__ == "__main__":
+    main()
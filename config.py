@@ -1,25 +1,28 @@
+"""
+Settings only. Importing this module is cheap: the YOLO models (and torch)
+are loaded on first use through get_model_detect() / get_model_classify().
+"""
 import os
-import torch
+from functools import lru_cache
 from dotenv import load_dotenv
-from ultralytics import YOLO
-from ultralytics.nn.tasks import ClassificationModel
-from doclayout_yolo import YOLOv10
 
 # Load environment variables from .env
 load_dotenv()
 
-# Allow the specific class for safe unpickling
-torch.serialization.add_safe_globals([ClassificationModel])
-
 PDF_FOLDER = 'input_pdfs'
 LLAMA_JSON_PATH = 'llamajson/combined_images_data.json'
+# Figure lookup by placeholder (pipeline.figure_store): "sqlite" shares one
+# on-disk index across chatbot processes, "memory" parses the JSON into a dict
+FIGURE_STORE_BACKEND = os.environ.get("FIGURE_STORE_BACKEND", "sqlite")
+FIGURE_INDEX_PATH = os.environ.get("FIGURE_INDEX_PATH", ".cache/figures.sqlite")
+
 # -------------------------------
 # Database (pgvector) connection
 # -------------------------------
-PGVECTOR_HOST = "postgres-vectorstore.clmnkejpqspy.us-east-1.rds.amazonaws.com"
-PGVECTOR_PORT = 5432
-PGVECTOR_DB = "postgres"
-PGVECTOR_USER = "postgres"
+PGVECTOR_HOST = os.environ.get("PGVECTOR_HOST", "postgres-vectorstore.clmnkejpqspy.us-east-1.rds.amazonaws.com")
+PGVECTOR_PORT = int(os.environ.get("PGVECTOR_PORT", 5432))
+PGVECTOR_DB = os.environ.get("PGVECTOR_DB", "postgres")
+PGVECTOR_USER = os.environ.get("PGVECTOR_USER", "postgres")
 
 # Fetch password from secrets manager / userdata
 # Example: from userdata.get("postgres_rws")
@@ -29,6 +32,251 @@ PGVECTOR_PASSWORD_KEY = os.environ.get("PGVECTOR_PASSWORD_KEY")
 if not PGVECTOR_PASSWORD_KEY:
     raise ValueError("Postgres password not set! Please check your .env file or environment variables.")
 
+PGVECTOR_SSLMODE = os.environ.get("PGVECTOR_SSLMODE", "prefer")
+PGVECTOR_CONNECT_TIMEOUT = 10          # seconds
+PGVECTOR_APPLICATION_NAME = "chatbot-rag"
+
+# Connection pool (pipeline.database.PgPool)
+PGVECTOR_POOL_MIN = int(os.environ.get("PGVECTOR_POOL_MIN", 1))
+PGVECTOR_POOL_MAX = int(os.environ.get("PGVECTOR_POOL_MAX", 10))
+# Idle connections older than this are pinged (SELECT 1) before being handed out
+PGVECTOR_HEALTHCHECK_SECS = 30
+# Retries for pool.run() when the server drops connections (e.g. RDS failover)
+PGVECTOR_RECONNECT_RETRIES = 2
+
+# -------------------------------
+# Vector index (pgvector)
+# -------------------------------
+# Distance metric used by both the index opclass and the retrieval operator:
+# "cosine" (<=>), "l2" (<->) or "ip" (<#>)
+VECTOR_METRIC = os.environ.get("VECTOR_METRIC", "cosine")
+# "hnsw" or "ivfflat"
+VECTOR_INDEX_METHOD = os.environ.get("VECTOR_INDEX_METHOD", "hnsw")
+# None = pick from the table size (see pipeline.schema.recommend_index_params)
+HNSW_M = None
+HNSW_EF_CONSTRUCTION = None
+HNSW_EF_SEARCH = None
+IVFFLAT_LISTS = None
+IVFFLAT_PROBES = None
+# Date / document filters are applied to the ANN candidates, so a selective filter
+# can leave fewer than top_k rows. With pgvector >= 0.8 the index scan keeps going
+# until top_k rows pass ("relaxed_order", "strict_order" for HNSW only, or "off");
+# older versions re-run short filtered results as an exact scan.
+VECTOR_ITERATIVE_SCAN = os.environ.get("VECTOR_ITERATIVE_SCAN", "relaxed_order")
+HNSW_MAX_SCAN_TUPLES = 20000            # pgvector's default
+IVFFLAT_MAX_PROBES = None               # None = all lists
+
+# -------------------------------
+# Hybrid retrieval (lexical + vector)
+# -------------------------------
+# "hybrid" fuses full-text (tsvector/GIN) and ANN candidates with reciprocal rank
+# fusion; "vector" is embedding similarity only
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid")
+# Postgres text search configuration for the generated content_tsv column
+TEXT_SEARCH_CONFIG = "english"
+# RRF: score = sum(weight / (RRF_K + rank)) over the two candidate lists
+RRF_K = 60
+HYBRID_VECTOR_WEIGHT = 1.0
+HYBRID_LEXICAL_WEIGHT = 1.0
+# Candidates taken from each list, as a multiple of top_k
+HYBRID_CANDIDATE_FACTOR = 2
+
+# -------------------------------
+# Cross-encoder rerank (pipeline.rerank, needs `pip install sentence-transformers`)
+# -------------------------------
+# When enabled, the top RERANK_CANDIDATES chunks (no similarity cutoff) are
+# rescored on CPU and the best RERANK_TOP_K go to the prompt
+RERANK_ENABLED = os.environ.get("RERANK_ENABLED", "0") != "0"
+RERANK_MODEL = os.environ.get("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = 50
+RERANK_TOP_K = 12
+RERANK_BATCH_SIZE = 16
+RERANK_MAX_LENGTH = 512
+# Scores by (model, query, chunk id, chunk content), so repeated queries skip the model
+RERANK_CACHE_ENABLED = os.environ.get("RERANK_CACHE_ENABLED", "1") != "0"
+RERANK_CACHE_PATH = os.environ.get("RERANK_CACHE_PATH", ".cache/rerank_scores.sqlite")
+RERANK_CACHE_MAX_ENTRIES = 200_000
+
+# -------------------------------
+# Document catalog (pipeline.catalog)
+# -------------------------------
+DOCUMENTS_TABLE = "documents"
+# How often the chatbot checks whether ingestion changed the catalog
+CATALOG_REFRESH_SECS = 30
+
+# -------------------------------
+# Query pipeline
+# -------------------------------
+# Threads for the independent query steps (embedding, keywords, catalog) in
+# run_query_pipeline_concurrent
+QUERY_FANOUT_WORKERS = 8
+# Stream answers to the chat CLI as Gemini generates them
+CHAT_STREAMING = os.environ.get("CHAT_STREAMING", "1") != "0"
+# Semantic answer cache (pipeline.answer_cache): reuse an answer when a query's
+# embedding is this similar to a cached one and it resolves to the same report dates
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "1") != "0"
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", 0.97))
+ANSWER_CACHE_TTL_SECS = 24 * 3600
+ANSWER_CACHE_MAX_ENTRIES = 1000
+# Prompt context packing (pipeline.context_packing): estimated tokens for the
+# retrieved chunks + figures in the answer prompt, and the share figures may take
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 12000))
+CONTEXT_FIGURE_SHARE = 0.4
+# Chat memory (pipeline.memory): the last MEMORY_RECENT_TURNS turns verbatim plus a
+# rolling summary of older ones, together capped at MEMORY_TOKEN_BUDGET estimated tokens
+MEMORY_RECENT_TURNS = 6
+MEMORY_TOKEN_BUDGET = 4000
+MEMORY_SUMMARY_TOKENS = 800
+# Longer answers (e.g. pipeline tables) are truncated in memory to this many tokens
+MEMORY_TURN_MAX_TOKENS = 600
+# Turns that left the verbatim window are folded into the summary this many at a time
+MEMORY_FOLD_TURNS = 3
+MEMORY_SUMMARY_MODEL = "gemini-2.5-flash"
+# Local intent router (pipeline.intent): document queries go straight to retrieval
+# instead of first asking Gemini whether it can answer from the conversation
+INTENT_ROUTER_ENABLED = os.environ.get("INTENT_ROUTER_ENABLED", "1") != "0"
+# Minimum score gap between the best and second intent; below it the router abstains
+INTENT_MIN_MARGIN = 0.05
+
+# -------------------------------
+# HTTP query service (pipeline.service, main_service.py)
+# -------------------------------
+SERVICE_HOST = os.environ.get("SERVICE_HOST", "0.0.0.0")
+SERVICE_PORT = int(os.environ.get("SERVICE_PORT", 8080))
+# Pipeline runs in flight at once (each holds a worker thread and, briefly, a pool connection)
+SERVICE_MAX_CONCURRENT = int(os.environ.get("SERVICE_MAX_CONCURRENT", 8))
+SERVICE_REQUEST_TIMEOUT_SECS = float(os.environ.get("SERVICE_REQUEST_TIMEOUT_SECS", 120))
+# Chat sessions kept in memory (least recently used are dropped) and their idle timeout
+SERVICE_MAX_SESSIONS = 1000
+SERVICE_SESSION_TTL_SECS = 3600
+# Default for the `fallback` request parameter when no chunk passes the threshold:
+# "best" (use the single best chunk), "none", or a float minimum similarity
+SERVICE_RETRIEVAL_FALLBACK = "best"
+
+# -------------------------------
+# Telemetry (pipeline.telemetry)
+# -------------------------------
+# Off = spans and metrics become no-ops
+TELEMETRY_ENABLED = os.environ.get("TELEMETRY_ENABLED", "1") != "0"
+# Share of traces whose spans are kept and written to TELEMETRY_LOG_PATH (metrics always count every call)
+TELEMETRY_SAMPLE_RATE = float(os.environ.get("TELEMETRY_SAMPLE_RATE", 0.01))
+TELEMETRY_LOG_PATH = os.environ.get("TELEMETRY_LOG_PATH", ".cache/traces.jsonl")
+# The log is rotated to <path>.1 past this size, so at most twice this is kept on disk
+TELEMETRY_LOG_MAX_BYTES = int(os.environ.get("TELEMETRY_LOG_MAX_BYTES", 50 * 1024 * 1024))
+# Off = traces keep only the length and a hash of user queries / messages, not the text
+TELEMETRY_LOG_QUERY_TEXT = os.environ.get("TELEMETRY_LOG_QUERY_TEXT", "0") == "1"
+# Ingestion runs write their metrics here for the node_exporter textfile collector (unset = don't)
+TELEMETRY_PROMETHEUS_PATH = os.environ.get("TELEMETRY_PROMETHEUS_PATH")
+# Level of the pipeline's progress lines (logging); the main_* scripts set it up, library use stays quiet
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+
+# -------------------------------
+# Gemini embeddings
+# -------------------------------
+EMBEDDING_MODEL = "gemini-embedding-001"
+EMBEDDING_DIM = 768
+EMBED_BATCH_SIZE = 100                 # API maximum per embed_content call
+EMBED_MAX_IN_FLIGHT = int(os.environ.get("EMBED_MAX_IN_FLIGHT", 4))
+EMBED_REQUESTS_PER_MINUTE = int(os.environ.get("EMBED_REQUESTS_PER_MINUTE", 1500))
+EMBED_TOKENS_PER_MINUTE = int(os.environ.get("EMBED_TOKENS_PER_MINUTE", 1_000_000))
+EMBED_MAX_RETRIES = 6
+# Local content-addressed embedding cache (pipeline.cache.EmbeddingCache)
+EMBED_CACHE_ENABLED = os.environ.get("EMBED_CACHE_ENABLED", "1") != "0"
+EMBED_CACHE_PATH = os.environ.get("EMBED_CACHE_PATH", ".cache/embeddings.sqlite")
+EMBED_CACHE_MAX_ENTRIES = 500_000
+
+# -------------------------------
+# Gemini table/chart summarization
+# -------------------------------
+SUMMARY_MODEL = "gemini-2.5-flash"
+SUMMARY_MAX_IN_FLIGHT = int(os.environ.get("SUMMARY_MAX_IN_FLIGHT", 8))
+SUMMARY_REQUESTS_PER_MINUTE = int(os.environ.get("SUMMARY_REQUESTS_PER_MINUTE", 500))
+SUMMARY_TOKENS_PER_MINUTE = int(os.environ.get("SUMMARY_TOKENS_PER_MINUTE", 1_000_000))
+SUMMARY_MAX_RETRIES = 5
+SUMMARY_MAX_IMAGE_SIDE = 1536          # crops are downscaled to this before upload
+SUMMARY_IMAGE_FORMAT = "png"           # "png" (lossless, best for small text) or "jpeg"
+# Local summary cache (pipeline.cache.SummaryCache)
+SUMMARY_CACHE_ENABLED = os.environ.get("SUMMARY_CACHE_ENABLED", "1") != "0"
+SUMMARY_CACHE_PATH = os.environ.get("SUMMARY_CACHE_PATH", ".cache/summaries.sqlite")
+SUMMARY_CACHE_MAX_ENTRIES = 100_000
+# "content": exact bytes of the (downscaled) crop. "perceptual": dHash, so visually
+# identical charts re-rendered across reports share a summary -- only safe when
+# repeated charts really carry the same numbers.
+SUMMARY_CACHE_KEY = os.environ.get("SUMMARY_CACHE_KEY", "content")
+
+# -------------------------------
+# PDF processing pipeline
+# -------------------------------
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+DETECT_BATCH_SIZE = int(os.environ.get("DETECT_BATCH_SIZE", 8))      # pages per detection call
+CLASSIFY_BATCH_SIZE = int(os.environ.get("CLASSIFY_BATCH_SIZE", 32)) # crops per classification call
+DETECT_IMGSZ = 1024                    # fixed letterboxed size, matches the docstructbench checkpoint
+CLASSIFY_IMGSZ = 224
+# Crops go to the classifier as-is (it resizes + center-crops each one itself, as in training);
+# letterboxing adds gray padding that shifts the confidences behind the chart filter. Opt-in only.
+CLASSIFY_LETTERBOX = os.environ.get("CLASSIFY_LETTERBOX", "0") == "1"
+
+# -------------------------------
+# Incremental ingestion (pipeline.manifest / pipeline.ingest)
+# -------------------------------
+INGEST_MANIFEST_PATH = os.environ.get("INGEST_MANIFEST_PATH", ".cache/ingest_manifest.sqlite")
+INGEST_CHECKPOINT_DIR = os.environ.get("INGEST_CHECKPOINT_DIR", ".cache/checkpoints")
+INGEST_KEEP_CHECKPOINTS = False        # delete a document's page checkpoints once it is in pgvector
+# Streaming ingestion: pages buffered between detection and summarization, and
+# pages being summarized/chunked concurrently. Memory is bounded by these, not by PDF size.
+INGEST_PREFETCH_PAGES = 4
+INGEST_PAGES_IN_FLIGHT = 4
+
 # Detection & Classification
-model_detect = YOLOv10("models/doclayout_yolo_docstructbench_imgsz1024.pt")
-model_classify = YOLO("models/classification_chart.pt")
+MODEL_DETECT_PATH = "models/doclayout_yolo_docstructbench_imgsz1024.pt"
+MODEL_CLASSIFY_PATH = "models/classification_chart.pt"
+# "onnx" or "torchscript": load the exported model next to the .pt if it exists
+# (see main_export_models.py); empty = always load the .pt checkpoint
+MODEL_EXPORT_FORMAT = os.environ.get("MODEL_EXPORT_FORMAT", "")
+_EXPORT_SUFFIX = {"onnx": ".onnx", "torchscript": ".torchscript"}
+
+
+def _model_path(pt_path):
+    suffix = _EXPORT_SUFFIX.get(MODEL_EXPORT_FORMAT)
+    if suffix:
+        exported = os.path.splitext(pt_path)[0] + suffix
+        if os.path.exists(exported):
+            return exported
+    return pt_path
+
+
+@lru_cache(maxsize=None)
+def get_model_detect():
+    """Layout detection model, loaded once on first use."""
+    from doclayout_yolo import YOLOv10
+    path = _model_path(MODEL_DETECT_PATH)
+    return YOLOv10(path) if path.endswith(".pt") else YOLOv10(path, task="detect")
+
+
+@lru_cache(maxsize=None)
+def get_model_classify():
+    """Chart/non-chart classification model, loaded once on first use."""
+    import torch
+    from ultralytics import YOLO
+    from ultralytics.nn.tasks import ClassificationModel
+
+    # Allow the specific class for safe unpickling
+    torch.serialization.add_safe_globals([ClassificationModel])
+    path = _model_path(MODEL_CLASSIFY_PATH)
+    return YOLO(path) if path.endswith(".pt") else YOLO(path, task="classify")
+
+
+@lru_cache(maxsize=None)
+def get_model_rerank():
+    """Cross-encoder for reranking, loaded once on first use (CPU)."""
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(RERANK_MODEL, max_length=RERANK_MAX_LENGTH, device="cpu")
+
+
+def __getattr__(name):
+    # Backwards compatible `config.model_detect` / `config.model_classify`, now lazy
+    if name == "model_detect":
+        return get_model_detect()
+    if name == "model_classify":
+        return get_model_classify()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,26 +1,31 @@
 """
 Interactive Chatbot using PGVector + Gemini + llamajson
 """
+import logging
+import sys
 
 from pipeline.chatbot import ChatbotWrapper
-from pipeline.database import connect_pg
-from pipeline.run_query import run_query_pipeline
-from pipeline.llamajson import load_llama_json, normalize_llama_placeholders
-from config import LLAMA_JSON_PATH
+from pipeline.database import get_pool
+from pipeline.run_query import run_query_pipeline_concurrent
+from pipeline.figure_store import open_figure_store
+from pipeline.answer_cache import get_answer_cache
+from config import LLAMA_JSON_PATH, CHAT_STREAMING, LOG_LEVEL
+
+# Pipeline progress lines, printed as before
+logging.basicConfig(level=LOG_LEVEL, format="%(message)s", stream=sys.stdout)
 
 # -----------------------------
 # 1️⃣ Connect to PGVector
 # -----------------------------
 print("🔌 Connecting to Postgres...")
-conn = connect_pg()
+pool = get_pool()
 
 # -----------------------------
-# 2️⃣ Load llamajson
+# 2️⃣ Open the figure store (llama JSON indexed by placeholder)
 # -----------------------------
-print("📄 Loading Llama JSON...")
+print("📄 Loading Llama JSON figures...")
 
-llamageneratedjson = load_llama_json(LLAMA_JSON_PATH)
-llamageneratedjson = normalize_llama_placeholders(llamageneratedjson)
+figure_store = open_figure_store(LLAMA_JSON_PATH)
 
 # -----------------------------
 # 3️⃣ Initialize Gemini client
@@ -32,25 +37,41 @@ client = genai.Client()
 # 4️⃣ Initialize ChatbotWrapper
 # -----------------------------
 chatbot = ChatbotWrapper(
-    run_pipeline_func=run_query_pipeline,  # full pipeline function
-    conn=conn,                              # active Postgres connection
-    llamageneratedjson=llamageneratedjson,  # preloaded llama JSON
+    run_pipeline_func=run_query_pipeline_concurrent,  # full pipeline, independent steps in parallel
+    pool=pool,                              # Postgres connection pool
+    figure_store=figure_store,              # figures by placeholder
     client=client,                          # Gemini client
-    max_history=25                           # number of turns to remember
+    max_history=25,                          # number of turns to remember
+    concurrent=True                         # query embedded inside the pipeline, alongside keywords
 )
 
 # -----------------------------
 # 5️⃣ Commands and CLI help
 # -----------------------------
-COMMAND_BAR = "💡 Commands:  [exit] [quit] [history] [help] [query:<text>]"
+COMMAND_BAR = "💡 Commands:  [exit] [quit] [history] [cache] [help] [query:<text>]"
 COMMANDS = {
     "exit": "Quit the chatbot",
     "quit": "Quit the chatbot",
     "history": "Show recent conversation history",
+    "cache": "Show answer cache statistics",
     "help": "Show this list of commands",
     "query": "Run a document query (example: 'query: <your query>')"
 }
 
+
+def render_stream(chunks):
+    """Print answer chunks as they arrive; returns the full answer."""
+    parts = []
+    for chunk in chunks:
+        if not parts:
+            # Retrieval logs are printed before the first chunk arrives
+            print("\nBot: ", end="", flush=True)
+        print(chunk, end="", flush=True)
+        parts.append(chunk)
+    print()
+    return "".join(parts)
+
+
 print("💬 Chatbot ready! Type 'help' to see available commands. Type 'exit' to quit.")
 print(COMMAND_BAR)
 
@@ -73,15 +94,25 @@ while True:
         print("\n🕑 Conversation History:")
         chatbot.print_history()
         continue
+    elif user_input.lower() == "cache":
+        answer_cache = get_answer_cache()
+        print(f"\n💾 Answer cache: {answer_cache.stats() if answer_cache else 'disabled'}")
+        continue
     elif user_input.lower().startswith("query:"):
         query_text = user_input[len("query:"):].strip()
-        answer = chatbot.run_new_query(query_text)
-        print(f"\nBot: {answer}")
+        if CHAT_STREAMING:
+            render_stream(chatbot.run_new_query_stream(query_text))
+        else:
+            answer = chatbot.run_new_query(query_text)
+            print(f"\nBot: {answer}")
         continue
 
     # Default: normal chat response
-    answer = chatbot.respond(user_input)
-    print(f"\nBot: {answer}")
+    if CHAT_STREAMING:
+        render_stream(chatbot.respond_stream(user_input))
+    else:
+        answer = chatbot.respond(user_input)
+        print(f"\nBot: {answer}")
 
     # Reprint command bar below each response
     print("\n" + COMMAND_BAR)
@@ -1,43 +1,43 @@
 """
 Main pipeline: process PDFs, summarize, create embeddings, insert into PGVector
 """
-import os
-from pipeline.pdf_processing import process_pdfs
-from pipeline.summarization import summarize_all_table_chart_nodes_in_memory, merge_text_and_table_charts
-from pipeline.embeddings import chunk_full_json, get_google_embeddings_raw
-from pipeline.database import connect_pg
-from pipeline.insert_chunks_pgvector import insert_chunks_into_pgvector
-from config import PDF_FOLDER
+from functools import partial
+from pipeline.pdf_processing import iter_pdf_pages
+from pipeline.ingest import summarize_and_chunk_page, embed_page_chunks
+from pipeline.streaming import prefetch, bounded_map
+from pipeline.cache import get_embedding_cache
+from config import PDF_FOLDER, INGEST_PREFETCH_PAGES, INGEST_PAGES_IN_FLIGHT
 
 from google import genai
-client = genai.Client()
 
-print("hi")
+
+# Render workers are spawned and re-import this module, so nothing runs at import time
 def main():
     print("🚀 Running full PDF → PGVector pipeline...")
+    client = genai.Client()
+
+    # 1️⃣ Process PDFs, page by page (detection runs ahead on a background thread)
+    pages = prefetch(iter_pdf_pages(PDF_FOLDER), maxsize=INGEST_PREFETCH_PAGES)
+
+    # 2️⃣ Summarize tables/charts, merge with page text and chunk (crops are released here)
+    n_pages, n_nodes = 0, 0
+    def _counted(pages):
+        nonlocal n_pages, n_nodes
+        for clean_pdf_name, *page in pages:
+            n_pages += 1
+            n_nodes += len(page[-1])
+            yield page
+    chunked = bounded_map(partial(summarize_and_chunk_page, client), _counted(pages), max_in_flight=INGEST_PAGES_IN_FLIGHT)
+
+    # 3️⃣ Generate embeddings in full batches across pages
+    n_chunks = 0
+    for _, chunks, embeddings in embed_page_chunks(client, chunked):
+        n_chunks += len(embeddings)
+    print(f"Processed {n_pages} pages, {n_nodes} table/chart nodes, {n_chunks} chunks and embeddings!")
+    if get_embedding_cache():
+        print(f"Embedding cache: {get_embedding_cache().stats()}")
 
-    # 1️⃣ Process PDFs
-    all_placeholders, all_text_json, all_table_chart_nodes = process_pdfs(PDF_FOLDER)
-    print(f"Processed {len(all_text_json)} pages, {len(all_table_chart_nodes)} table/chart nodes!")
-
-    # 2️⃣ Summarize tables/charts in-memory
-    summarized_table_chart_nodes = summarize_all_table_chart_nodes_in_memory(client,all_table_chart_nodes)
-    print(f"Summarized {len(summarized_table_chart_nodes)} table/chart nodes!")
-
-    # 3️⃣ Merge text and table/chart nodes
-    full_json_text_table_charts = merge_text_and_table_charts(all_text_json, summarized_table_chart_nodes)
-    print(f"Merged {len(all_text_json)} pages with {len(summarized_table_chart_nodes)} table/chart nodes!")
-
-    # 4️⃣ Chunk full JSON
-    all_chunks = chunk_full_json(full_json_text_table_charts)
-    print(f"Processed {len(all_text_json)} pages, {len(summarized_table_chart_nodes)} table/chart nodes, {len(all_chunks)} total chunks in-memory!")
-
-    # 5️⃣ Generate embeddings
-    chunk_texts = [c['chunk_text'] for c in all_chunks]
-    chunk_embeddings = get_google_embeddings_raw(client,chunk_texts)
-    print(f"Generated {len(chunk_embeddings)} embeddings!")
 
-    
 
 if __name__ == "__main__":
     main()
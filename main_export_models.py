@@ -0,0 +1,30 @@
+"""
+Export the YOLO checkpoints once to ONNX or TorchScript for faster cold loads.
+
+Usage:
+    python main_export_models.py --format onnx
+    MODEL_EXPORT_FORMAT=onnx python main_newpdf_insertpgvector.py
+
+The exported files are written next to the .pt checkpoints; config.py picks
+them up when MODEL_EXPORT_FORMAT matches.
+"""
+import argparse
+
+from config import get_model_detect, get_model_classify, DETECT_IMGSZ, CLASSIFY_IMGSZ
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--format", default="onnx", choices=["onnx", "torchscript"])
+    args = parser.parse_args()
+
+    # dynamic batch axis so BatchedDetector / BatchedClassifier can send N images per call
+    dynamic = args.format == "onnx"
+    detect_path = get_model_detect().export(format=args.format, imgsz=DETECT_IMGSZ, dynamic=dynamic)
+    print(f"✅ Exported layout model to {detect_path}")
+    classify_path = get_model_classify().export(format=args.format, imgsz=CLASSIFY_IMGSZ, dynamic=dynamic)
+    print(f"✅ Exported classification model to {classify_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,73 @@
 """
 Main pipeline: process PDFs, summarize, create embeddings, insert into PGVector
+
+Incremental: PDFs whose content is unchanged since the last successful run are
+skipped, an interrupted run resumes each document from its last completed
+stage, and a changed PDF replaces only its own rows.
+
+Usage:
+    python main_newpdf_insertpgvector.py [--force]
 """
+import argparse
+import logging
 import os
-from pipeline.pdf_processing import process_pdfs
-from pipeline.summarization import summarize_all_table_chart_nodes_in_memory, merge_text_and_table_charts
-from pipeline.embeddings import chunk_full_json, get_google_embeddings_raw
-from pipeline.database import connect_pg
-from pipeline.insert_chunks_pgvector import insert_chunks_into_pgvector
-from config import PDF_FOLDER
+import sys
+from pipeline.pdf_processing import list_pdfs, rendering_executor
+from pipeline.ingest import ingest_document
+from pipeline.manifest import IngestManifest, CheckpointStore
+from pipeline.cache import get_embedding_cache, get_summary_cache
+from pipeline.database import get_pool
+from pipeline.schema import ensure_vector_index, ensure_text_search
+from pipeline.catalog import ensure_documents_table
+from pipeline.telemetry import write_prometheus
+from config import (
+    PDF_FOLDER, VECTOR_INDEX_METHOD, VECTOR_METRIC, TEXT_SEARCH_CONFIG, TELEMETRY_PROMETHEUS_PATH, LOG_LEVEL,
+)
 
 from google import genai
-client = genai.Client()
-
-print("hi")
-def main():
-    print("🚀 Running full PDF → PGVector pipeline...")
 
-    # 1️⃣ Process PDFs
-    all_placeholders, all_text_json, all_table_chart_nodes = process_pdfs(PDF_FOLDER)
-    print(f"Processed {len(all_text_json)} pages, {len(all_table_chart_nodes)} table/chart nodes!")
 
-    # 2️⃣ Summarize tables/charts in-memory
-    summarized_table_chart_nodes = summarize_all_table_chart_nodes_in_memory(client,all_table_chart_nodes)
-    print(f"Summarized {len(summarized_table_chart_nodes)} table/chart nodes!")
-
-    # 3️⃣ Merge text and table/chart nodes
-    full_json_text_table_charts = merge_text_and_table_charts(all_text_json, summarized_table_chart_nodes)
-    print(f"Merged {len(all_text_json)} pages with {len(summarized_table_chart_nodes)} table/chart nodes!")
+def main(force=False):
+    logging.basicConfig(level=LOG_LEVEL, format="%(message)s", stream=sys.stdout)
+    print("🚀 Running full PDF → PGVector pipeline...")
+    client = genai.Client()
 
-    # 4️⃣ Chunk full JSON
-    all_chunks = chunk_full_json(full_json_text_table_charts)
-    print(f"Processed {len(all_text_json)} pages, {len(summarized_table_chart_nodes)} table/chart nodes, {len(all_chunks)} total chunks in-memory!")
+    print("🔌 Connecting to Postgres...")
+    pool = get_pool()
+    with pool.connection() as conn:
+        ensure_vector_index(conn, method=VECTOR_INDEX_METHOD, metric=VECTOR_METRIC)
+        ensure_text_search(conn, config=TEXT_SEARCH_CONFIG)
+        ensure_documents_table(conn)
 
-    # 5️⃣ Generate embeddings
-    chunk_texts = [c['chunk_text'] for c in all_chunks]
-    chunk_embeddings = get_google_embeddings_raw(client,chunk_texts)
-    print(f"Generated {len(chunk_embeddings)} embeddings!")
+    manifest = IngestManifest()
+    checkpoints = CheckpointStore()
+    executor = rendering_executor()
+    ingested, skipped, total_rows = 0, 0, 0
+    try:
+        for pdf_file in list_pdfs(PDF_FOLDER):
+            stats = ingest_document(os.path.join(PDF_FOLDER, pdf_file), client, pool,
+                                    manifest, checkpoints, executor, force=force)
+            if stats is None:
+                skipped += 1
+            else:
+                ingested += 1
+                total_rows += stats["rows"]
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        manifest.close()
 
-    # 6️⃣ Insert chunks + embeddings into PGVector
-    print("🔌 Connecting to Postgres...")
-    conn = connect_pg()
-    insert_chunks_into_pgvector(conn,all_chunks, chunk_embeddings)
-    print(f"Inserted/Appended {len(all_chunks)} chunks into PGVector!")
+    print(f"Ingested {ingested} PDFs ({total_rows} chunks), skipped {skipped} unchanged PDFs!")
+    if get_embedding_cache():
+        print(f"Embedding cache: {get_embedding_cache().stats()}")
+    if get_summary_cache():
+        print(f"Summary cache: {get_summary_cache().stats()}")
+    if TELEMETRY_PROMETHEUS_PATH:
+        write_prometheus(TELEMETRY_PROMETHEUS_PATH)
+        print(f"📈 Metrics written to {TELEMETRY_PROMETHEUS_PATH}")
 
-    
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--force", action="store_true", help="Re-ingest every PDF even if unchanged")
+    main(force=parser.parse_args().force)
@@ -0,0 +1,42 @@
+"""
+Create or rebuild the ANN index on pdf_chunks_768.embedding (and make sure the
+full-text column + GIN index used by hybrid retrieval and the documents
+catalog table exist).
+
+Usage:
+    python main_rebuild_index.py            # create if missing
+    python main_rebuild_index.py --rebuild  # rebuild with parameters for the current table size
+"""
+import argparse
+
+from pipeline.database import get_pool
+from pipeline.catalog import ensure_documents_table
+from pipeline.schema import ensure_vector_index, rebuild_vector_index, ensure_text_search
+from config import (
+    VECTOR_INDEX_METHOD, VECTOR_METRIC, HNSW_M, HNSW_EF_CONSTRUCTION, IVFFLAT_LISTS, TEXT_SEARCH_CONFIG,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild even if an index exists")
+    parser.add_argument("--method", default=VECTOR_INDEX_METHOD, choices=["hnsw", "ivfflat"])
+    parser.add_argument("--metric", default=VECTOR_METRIC, choices=["cosine", "l2", "ip"])
+    parser.add_argument("--m", type=int, default=HNSW_M)
+    parser.add_argument("--ef-construction", type=int, default=HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--lists", type=int, default=IVFFLAT_LISTS)
+    args = parser.parse_args()
+
+    build_params = {"m": args.m, "ef_construction": args.ef_construction, "lists": args.lists}
+    with get_pool().connection() as conn:
+        if args.rebuild:
+            rebuild_vector_index(conn, method=args.method, metric=args.metric, **build_params)
+        else:
+            ensure_vector_index(conn, method=args.method, metric=args.metric, **build_params)
+        print(f"✅ Full-text index ready: {ensure_text_search(conn, config=TEXT_SEARCH_CONFIG)}")
+        ensure_documents_table(conn)
+        print("✅ Document catalog ready")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+HTTP query service using PGVector + Gemini + llamajson (see pipeline/service.py for the endpoints)
+"""
+import logging
+
+from aiohttp import web
+
+from pipeline.database import get_pool
+from pipeline.figure_store import open_figure_store
+from pipeline.service import create_app
+from config import LLAMA_JSON_PATH, SERVICE_HOST, SERVICE_PORT, LOG_LEVEL
+
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+# -----------------------------
+# 1️⃣ Connect to PGVector
+# -----------------------------
+print("🔌 Connecting to Postgres...")
+pool = get_pool()
+
+# -----------------------------
+# 2️⃣ Open the figure store (llama JSON indexed by placeholder)
+# -----------------------------
+print("📄 Loading Llama JSON figures...")
+figure_store = open_figure_store(LLAMA_JSON_PATH)
+
+# -----------------------------
+# 3️⃣ Initialize Gemini client
+# -----------------------------
+from google import genai
+client = genai.Client()
+
+# -----------------------------
+# 4️⃣ Serve
+# -----------------------------
+print(f"🌐 Query service on http://{SERVICE_HOST}:{SERVICE_PORT}")
+web.run_app(create_app(pool, figure_store, client), host=SERVICE_HOST, port=SERVICE_PORT)
@@ -0,0 +1,137 @@
+"""
+Semantic answer cache in front of the query pipeline.
+
+An answer is reused when a new query's embedding is within a cosine
+similarity threshold of a cached query AND both resolved to the same report
+dates AND matched the same documents (so "TrendForce DRAM outlook Jan 2024"
+never gets the answer to "Edgewater DRAM outlook Jan 2024"). Each entry remembers the catalog version of its dates (document count
+and last update per date, see DocumentCatalog.date_versions), so ingesting
+rows for one of those dates invalidates it. Entries also expire after a TTL,
+and the least recently used ones are evicted beyond max_entries.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from config import (
+    EMBEDDING_DIM, ANSWER_CACHE_ENABLED, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL_SECS,
+    ANSWER_CACHE_MAX_ENTRIES,
+)
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, ttl_secs=ANSWER_CACHE_TTL_SECS,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES, dim=EMBEDDING_DIM):
+        """
+        Args:
+            threshold (float): Minimum cosine similarity between query embeddings for a hit.
+            ttl_secs (float): Entries older than this are never served.
+            max_entries (int): Least recently used entries beyond this are evicted.
+            dim (int): Query embedding dimensionality.
+        """
+        self.threshold = threshold
+        self.ttl_secs = ttl_secs
+        self.max_entries = max_entries
+        # One row per slot; unused slots stay zero so they never pass the threshold
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._free = list(range(max_entries - 1, -1, -1))
+        self._entries = OrderedDict()  # slot -> entry dict, least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def _normalize(embedding):
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    @staticmethod
+    def scope_key(report_dates, doc_ids):
+        """What a query was answered from: its report dates and matched document ids (empty = all)."""
+        return tuple(sorted(set(report_dates))), tuple(sorted(set(doc_ids or ())))
+
+    def _drop(self, slot):
+        del self._entries[slot]
+        self._vectors[slot] = 0
+        self._free.append(slot)
+
+    def lookup(self, query_embedding, report_dates, doc_ids, versions=None):
+        """
+        Return the cached entry {"query", "answer", "similarity", ...} or None.
+
+        Args:
+            doc_ids: Documents the query's keywords matched; only entries with the same set are hits.
+            versions: Current catalog versions of report_dates; entries stored
+                      under different versions are invalidated.
+        """
+        query = self._normalize(query_embedding)
+        key = self.scope_key(report_dates, doc_ids)
+        now = time.monotonic()
+        with self._lock:
+            if self._entries:
+                sims = self._vectors @ query
+                for slot in np.argsort(-sims):
+                    if sims[slot] < self.threshold:
+                        break
+                    entry = self._entries.get(int(slot))
+                    if entry is None or entry["scope"] != key:
+                        continue
+                    if now - entry["created"] > self.ttl_secs or entry["versions"] != versions:
+                        self._drop(int(slot))
+                        self.invalidated += 1
+                        continue
+                    self._entries.move_to_end(int(slot))
+                    self.hits += 1
+                    self.saved_seconds += entry["latency"]
+                    return dict(entry, similarity=float(sims[slot]))
+            self.misses += 1
+        return None
+
+    def store(self, query_text, query_embedding, report_dates, doc_ids, answer, latency, versions=None):
+        """Cache an answer; `latency` is what producing it cost (reported as saved on hits)."""
+        with self._lock:
+            if not self._free:
+                self._drop(next(iter(self._entries)))
+            slot = self._free.pop()
+            self._vectors[slot] = self._normalize(query_embedding)
+            self._entries[slot] = {
+                "query": query_text, "answer": answer, "scope": self.scope_key(report_dates, doc_ids),
+                "versions": versions, "latency": latency, "created": time.monotonic(),
+            }
+
+    def clear(self):
+        with self._lock:
+            for slot in list(self._entries):
+                self._drop(slot)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "invalidated": self.invalidated,
+            "saved_seconds": round(self.saved_seconds, 2),
+        }
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Process-wide answer cache, or None when disabled in config.py."""
+    global _answer_cache
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = SemanticAnswerCache()
+    return _answer_cache
@@ -0,0 +1,235 @@
+"""
+Persistent, size-bounded key/value caches on SQLite.
+
+`SQLiteCache` stores bytes under string keys with LRU eviction and hit/miss
+counters. WAL mode lets several processes (ingestion + chatbot) share one file.
+`EmbeddingCache` builds on it, keyed by the hash of (model, dim, text);
+`SummaryCache` maps (model, prompt, image key) to a Gemini summary;
+`RerankScoreCache` maps (model, query, chunk) to a cross-encoder score.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from config import (
+    EMBED_CACHE_PATH, EMBED_CACHE_MAX_ENTRIES, EMBED_CACHE_ENABLED,
+    SUMMARY_CACHE_PATH, SUMMARY_CACHE_MAX_ENTRIES, SUMMARY_CACHE_ENABLED,
+    RERANK_CACHE_PATH, RERANK_CACHE_MAX_ENTRIES, RERANK_CACHE_ENABLED,
+)
+
+# SQLite's default limit on host parameters per statement is 999
+_SQL_BATCH = 900
+
+
+class SQLiteCache:
+    def __init__(self, path, max_entries=100_000, table="cache"):
+        """
+        Args:
+            path (str): SQLite file (parent directory is created).
+            max_entries (int): Least recently used entries beyond this are evicted.
+            table (str): Table name, so several caches can share one file.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL;")
+        self._db.execute("PRAGMA synchronous=NORMAL;")
+        self._db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            f"(key TEXT PRIMARY KEY, value BLOB NOT NULL, last_access REAL NOT NULL);"
+        )
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access);")
+        self._db.commit()
+        self._count = self._db.execute(f"SELECT count(*) FROM {table};").fetchone()[0]
+
+    def get_many(self, keys):
+        """Return {key: value} for the keys present; refreshes their LRU position."""
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), _SQL_BATCH):
+                part = keys[i:i+_SQL_BATCH]
+                marks = ",".join("?" * len(part))
+                found.update(self._db.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({marks});", part
+                ).fetchall())
+            if found:
+                now = time.time()
+                self._db.executemany(
+                    f"UPDATE {self.table} SET last_access = ? WHERE key = ?;",
+                    [(now, k) for k in found]
+                )
+                self._db.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items):
+        """Insert or replace {key: value} pairs, then evict down to max_entries."""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, last_access) VALUES (?, ?, ?);",
+                [(k, v, now) for k, v in items.items()]
+            )
+            self._count += len(items)  # upper bound; corrected below when it matters
+            if self._count > self.max_entries:
+                self._count = self._db.execute(f"SELECT count(*) FROM {self.table};").fetchone()[0]
+                excess = self._count - self.max_entries
+                if excess > 0:
+                    self._db.execute(
+                        f"DELETE FROM {self.table} WHERE key IN "
+                        f"(SELECT key FROM {self.table} ORDER BY last_access LIMIT ?);",
+                        (excess,)
+                    )
+                    self._count -= excess
+            self._db.commit()
+
+    def put(self, key, value):
+        self.put_many({key: value})
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": self._count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class EmbeddingCache:
+    """Content-addressed embedding store: hash(model, dim, text) -> float32 vector."""
+
+    def __init__(self, path=EMBED_CACHE_PATH, max_entries=EMBED_CACHE_MAX_ENTRIES):
+        self.store = SQLiteCache(path, max_entries=max_entries, table="embeddings")
+
+    @staticmethod
+    def key(model, dim, text):
+        return hashlib.sha256(f"{model}\0{dim}\0{text}".encode("utf-8")).hexdigest()
+
+    def lookup(self, model, dim, texts):
+        """Return {text: vector} for the texts already cached."""
+        keys = {self.key(model, dim, t): t for t in texts}
+        found = self.store.get_many(keys)
+        return {keys[k]: np.frombuffer(v, dtype=np.float32) for k, v in found.items()}
+
+    def store_many(self, model, dim, vectors_by_text):
+        self.store.put_many({
+            self.key(model, dim, t): np.asarray(v, dtype=np.float32).tobytes()
+            for t, v in vectors_by_text.items()
+        })
+
+    @property
+    def hits(self):
+        return self.store.hits
+
+    @property
+    def misses(self):
+        return self.store.misses
+
+    def stats(self):
+        return self.store.stats()
+
+
+class SummaryCache:
+    """Table/chart summaries keyed by hash(model, prompt, image key)."""
+
+    def __init__(self, path=SUMMARY_CACHE_PATH, max_entries=SUMMARY_CACHE_MAX_ENTRIES):
+        self.store = SQLiteCache(path, max_entries=max_entries, table="summaries")
+
+    @staticmethod
+    def key(model, prompt, image_key):
+        return hashlib.sha256(f"{model}\0{prompt}\0{image_key}".encode("utf-8")).hexdigest()
+
+    def lookup(self, keys):
+        """Return {key: summary} for the keys already cached."""
+        return {k: v.decode("utf-8") for k, v in self.store.get_many(keys).items()}
+
+    def store_summary(self, key, summary):
+        self.store.put(key, summary.encode("utf-8"))
+
+    def stats(self):
+        return self.store.stats()
+
+
+class RerankScoreCache:
+    """Cross-encoder scores keyed by hash(model, query, chunk id, chunk content)."""
+
+    def __init__(self, path=RERANK_CACHE_PATH, max_entries=RERANK_CACHE_MAX_ENTRIES):
+        self.store = SQLiteCache(path, max_entries=max_entries, table="rerank_scores")
+
+    @staticmethod
+    def key(model, query_text, chunk_id, content):
+        # Content is part of the key so a re-ingested chunk with the same id is rescored
+        return hashlib.sha256(f"{model}\0{query_text}\0{chunk_id}\0{content}".encode("utf-8")).hexdigest()
+
+    def lookup(self, keys):
+        """Return {key: score} for the keys already cached."""
+        return {k: float(np.frombuffer(v, dtype=np.float32)[0]) for k, v in self.store.get_many(keys).items()}
+
+    def store_many(self, scores_by_key):
+        self.store.put_many({k: np.float32(v).tobytes() for k, v in scores_by_key.items()})
+
+    def stats(self):
+        return self.store.stats()
+
+
+_embedding_cache = None
+_summary_cache = None
+_rerank_cache = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Process-wide embedding cache, or None when disabled in config.py."""
+    global _embedding_cache
+    if not EMBED_CACHE_ENABLED:
+        return None
+    if _embedding_cache is None:
+        with _embedding_cache_lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache()
+    return _embedding_cache
+
+
+def get_summary_cache():
+    """Process-wide summary cache, or None when disabled in config.py."""
+    global _summary_cache
+    if not SUMMARY_CACHE_ENABLED:
+        return None
+    if _summary_cache is None:
+        with _embedding_cache_lock:
+            if _summary_cache is None:
+                _summary_cache = SummaryCache()
+    return _summary_cache
+
+
+def get_rerank_cache():
+    """Process-wide rerank score cache, or None when disabled in config.py."""
+    global _rerank_cache
+    if not RERANK_CACHE_ENABLED:
+        return None
+    if _rerank_cache is None:
+        with _embedding_cache_lock:
+            if _rerank_cache is None:
+                _rerank_cache = RerankScoreCache()
+    return _rerank_cache
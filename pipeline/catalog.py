@@ -0,0 +1,244 @@
+"""
+Document catalog: one row per ingested document, so query-time keyword
+matching never scans the chunk table.
+
+The `documents` table is kept in sync by the loaders in
+pipeline.insert_chunks_pgvector (in the same transaction as the chunk rows).
+`DocumentCatalog` caches it in process behind a trigram index and re-reads it
+only when its version (row count + last update) changes, checked at most every
+CATALOG_REFRESH_SECS; ingestion in the same process invalidates it directly.
+
+The table is created (and backfilled) by ingestion and main_rebuild_index.py
+only; the query path never runs DDL. Until it exists, the catalog is read once
+from the chunk table instead.
+"""
+import logging
+import re
+import threading
+import time
+
+from pipeline import telemetry
+from config import DOCUMENTS_TABLE, CATALOG_REFRESH_SECS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_TABLE = "pdf_chunks_768"
+
+# Chunk ids are '<doc_id>_page<N>_chunk<i>' and doc_id is alphanumeric only
+DOC_ID_SQL = "split_part(id, '_page', 1)"
+
+
+# --------------------------
+# documents table
+# --------------------------
+def ensure_documents_table(conn, chunk_table=DEFAULT_CHUNK_TABLE, documents_table=DOCUMENTS_TABLE):
+    """Create the documents table; backfill it from the chunk table the first time."""
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {documents_table} (
+            doc_id TEXT PRIMARY KEY,
+            report_date TEXT,
+            chunk_count INTEGER NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """
+    )
+    cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {documents_table});")
+    if not cursor.fetchone()[0]:
+        synced = sync_documents(cursor, chunk_table=chunk_table, documents_table=documents_table)
+        if synced:
+            logger.info("📚 Backfilled %d documents into %s", synced, documents_table)
+    conn.commit()
+
+
+def sync_documents(cursor, doc_ids=None, chunk_table=DEFAULT_CHUNK_TABLE, documents_table=DOCUMENTS_TABLE):
+    """
+    Recompute catalog rows for `doc_ids` (all documents if None) from the chunk
+    table; documents left without chunks are removed. Runs in the caller's transaction.
+
+    Returns:
+        int: Documents upserted.
+    """
+    where, params = "", {}
+    if doc_ids is not None:
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return 0
+        where = f"WHERE {DOC_ID_SQL} = ANY(%(doc_ids)s)"
+        params["doc_ids"] = doc_ids
+    cursor.execute(
+        f"""
+        INSERT INTO {documents_table} (doc_id, report_date, chunk_count, updated_at)
+        SELECT {DOC_ID_SQL}, max(report_date), count(*), now()
+        FROM {chunk_table}
+        {where}
+        GROUP BY 1
+        ON CONFLICT (doc_id) DO UPDATE
+            SET report_date = EXCLUDED.report_date,
+                chunk_count = EXCLUDED.chunk_count,
+                updated_at = EXCLUDED.updated_at;
+        """,
+        params,
+    )
+    synced = cursor.rowcount
+    if doc_ids is not None:
+        cursor.execute(
+            f"DELETE FROM {documents_table} d WHERE d.doc_id = ANY(%(doc_ids)s) "
+            f"AND NOT EXISTS (SELECT 1 FROM {chunk_table} WHERE {DOC_ID_SQL} = d.doc_id);",
+            params,
+        )
+    return synced
+
+
+def documents_table_exists(cursor, documents_table=DOCUMENTS_TABLE):
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", (documents_table,))
+    return cursor.fetchone()[0]
+
+
+def catalog_version(cursor, documents_table=DOCUMENTS_TABLE):
+    """Cheap change marker: (row count, latest update)."""
+    cursor.execute(f"SELECT count(*), max(updated_at) FROM {documents_table};")
+    return tuple(cursor.fetchone())
+
+
+# --------------------------
+# In-process matcher
+# --------------------------
+def normalize_name(text):
+    """Lowercase and keep alphanumerics only, the same way document ids are built from file names."""
+    return re.sub(r"[^a-z0-9]+", "", text.lower())
+
+
+class TrigramIndex:
+    """Substring search over a few thousand names via trigram posting lists."""
+
+    def __init__(self, names):
+        self.names = list(names)
+        self._keys = [normalize_name(n) for n in self.names]
+        self._postings = {}
+        for i, key in enumerate(self._keys):
+            for j in range(len(key) - 2):
+                self._postings.setdefault(key[j:j+3], set()).add(i)
+
+    def search(self, keyword):
+        """Names whose normalized form contains the normalized keyword."""
+        kw = normalize_name(keyword)
+        if not kw:
+            return []
+        if len(kw) < 3:
+            candidates = range(len(self._keys))
+        else:
+            # Intersect the rarest posting lists first
+            grams = sorted({kw[j:j+3] for j in range(len(kw) - 2)}, key=lambda g: len(self._postings.get(g, ())))
+            candidates = set(self._postings.get(grams[0], ()))
+            for gram in grams[1:]:
+                if not candidates:
+                    break
+                candidates &= self._postings[gram]
+        return [self.names[i] for i in candidates if kw in self._keys[i]]
+
+
+class DocumentCatalog:
+    def __init__(self, pool, chunk_table=DEFAULT_CHUNK_TABLE, documents_table=DOCUMENTS_TABLE,
+                 refresh_secs=CATALOG_REFRESH_SECS):
+        """
+        Args:
+            pool: pipeline.database.PgPool.
+            refresh_secs (float): How often the version is re-checked against Postgres.
+        """
+        self.pool = pool
+        self.chunk_table = chunk_table
+        self.documents_table = documents_table
+        self.refresh_secs = refresh_secs
+        self.version = None
+        self._docs = {}
+        self._index = TrigramIndex([])
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _load(self, conn):
+        cursor = conn.cursor()
+        with telemetry.external("postgres", "catalog_version"):
+            if documents_table_exists(cursor, self.documents_table):
+                version = catalog_version(cursor, self.documents_table)
+                sql = f"SELECT doc_id, report_date, chunk_count, updated_at FROM {self.documents_table};"
+            else:
+                # Not created yet (ingestion / main_rebuild_index.py do that): one pass over the chunks
+                version = ("chunks",)
+                sql = (f"SELECT {DOC_ID_SQL}, max(report_date), count(*), NULL::timestamptz "
+                       f"FROM {self.chunk_table} GROUP BY 1;")
+        if version == self.version:
+            return
+        if version == ("chunks",):
+            logger.warning("⚠️ %s is missing; reading documents from %s (run main_rebuild_index.py)",
+                           self.documents_table, self.chunk_table)
+        with telemetry.external("postgres", "catalog_load"):
+            cursor.execute(sql)
+            rows = cursor.fetchall()
+        docs = {doc_id: {"report_date": report_date, "chunk_count": chunk_count, "updated_at": updated_at}
+                for doc_id, report_date, chunk_count, updated_at in rows}
+        self._docs, self._index, self.version = docs, TrigramIndex(docs), version
+
+    def refresh(self, force=False):
+        """Reload from Postgres if the refresh interval passed and the catalog changed."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._checked_at is not None and now - self._checked_at < self.refresh_secs:
+                return
+            self.pool.run(self._load)
+            self._checked_at = now
+
+    def invalidate(self):
+        """Force a version check on the next lookup (called after ingesting in this process)."""
+        with self._lock:
+            self._checked_at = None
+
+    def documents(self):
+        """{doc_id: {"report_date", "chunk_count", "updated_at"}}"""
+        self.refresh()
+        return self._docs
+
+    def latest_report_date(self):
+        self.refresh()
+        dates = [d["report_date"] for d in self._docs.values() if d["report_date"]]
+        return max(dates) if dates else None
+
+    def date_versions(self, report_dates):
+        """
+        Change marker for the documents behind `report_dates`: per date, the
+        number of documents and their latest update. "LATEST" uses the whole catalog version.
+        """
+        self.refresh()
+        if "LATEST" in report_dates:
+            return (("LATEST",) + tuple(self.version or ()),)
+        versions = []
+        for date in sorted(set(report_dates)):
+            updates = [d["updated_at"] for d in self._docs.values() if d["report_date"] == date]
+            versions.append((date, len(updates), max((u for u in updates if u), default=None)))
+        return tuple(versions)
+
+    def match(self, keywords):
+        """Document ids whose name contains any of the keywords (case/punctuation-insensitive)."""
+        self.refresh()
+        index = self._index
+        return sorted({doc_id for kw in keywords for doc_id in index.search(kw)})
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_document_catalog(pool):
+    """Process-wide catalog over the default chunk table."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = DocumentCatalog(pool)
+    return _catalog
+
+
+def invalidate_document_catalog():
+    if _catalog is not None:
+        _catalog.invalidate()
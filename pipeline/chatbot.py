@@ -1,41 +1,82 @@
+import logging
 from collections import deque
 from typing import List
 from google import genai
 
-from pipeline.embeddings import get_google_embeddings_raw
+from pipeline.embeddings import embed_query
+from pipeline.timing import StageTimer
+from pipeline.run_query import stream_gemini_text
+from pipeline.memory import ConversationMemory
+from pipeline.intent import IntentRouter, QUERY
+from pipeline.ratelimit import estimate_tokens
+from pipeline import telemetry
+from config import INTENT_ROUTER_ENABLED
+
+logger = logging.getLogger(__name__)
+
+# Phrases with which the follow-up LLM says it needs a pipeline run
+NEEDS_QUERY_PHRASES = ("don't have enough information", "cannot answer")
+# Characters held back while streaming a follow-up answer, to spot those phrases before printing
+STREAM_HOLDBACK_CHARS = 80
 
 class ChatbotWrapper:
-    def __init__(self, run_pipeline_func, conn, llamageneratedjson, client: genai.Client, max_history=100):
+    def __init__(self, run_pipeline_func, pool, figure_store, client: genai.Client, max_history=100,
+                 concurrent=False, memory=None, router=None, retrieval_fallback="ask"):
         """
         Interactive chatbot wrapper with memory and LLM follow-up handling.
 
         Args:
             run_pipeline_func: Your retrieval pipeline function
-                               (run_query_pipeline(query_text, query_embedding, conn, llamageneratedjson))
-            conn: Active Postgres connection
-            llamageneratedjson: Pre-loaded llama JSON for figures
+                               (run_query_pipeline(query_text, query_embedding, pool, figure_store, client,
+                                                   timer=None, stream=False, fallback="ask"))
+            pool: Postgres connection pool (pipeline.database.PgPool)
+            figure_store: Figures by placeholder (pipeline.figure_store.open_figure_store)
             client: Gemini LLM client
-            max_history: Number of past conversations to keep
+            max_history: Number of past conversations kept for `history` (display only)
+            concurrent: run_pipeline_func embeds the query itself, concurrently with
+                        its other steps (run_query_pipeline_concurrent), so the
+                        wrapper passes query_embedding=None
+            memory: ConversationMemory for the follow-up prompt (default: one
+                    with the config.py limits)
+            router: IntentRouter that sends document queries straight to the
+                    pipeline (default: one if INTENT_ROUTER_ENABLED; False = off)
+            retrieval_fallback: Passed to the pipeline as `fallback` when no chunk
+                    passes the similarity threshold ("ask" prompts on stdin)
         """
         self.run_pipeline_func = run_pipeline_func
-        self.conn = conn
-        self.llamageneratedjson = llamageneratedjson
+        self.pool = pool
+        self.figure_store = figure_store
         self.client = client
         self.max_history = max_history
+        self.concurrent = concurrent
+        self.last_timings = None  # StageTimer.summary() of the last pipeline run
+        self.last_trace_id = None  # its telemetry trace id (correlates with the trace log)
         self.history = deque(maxlen=max_history)  # stores (user, bot) tuples
+        self.memory = memory or ConversationMemory(client)  # bounded prompt context
+        if router is None and INTENT_ROUTER_ENABLED:
+            router = IntentRouter()
+        self.router = router or None
+        self.retrieval_fallback = retrieval_fallback
+        self.last_needed_query = False  # the last follow-up answer asked for a pipeline run
 
     # -----------------------------
     # LLM-based follow-up answer
     # -----------------------------
-    def answer_with_history(self, user_input: str) -> str | None:
-        """
-        Sends user input + last conversation history to LLM.
-        Returns LLM answer, or None if LLM call fails.
-        """
-        # Prepare context
-        history_text = ""
-        for u, b in list(self.history)[-self.max_history:]:
-            history_text += f"User: {u}\nBot: {b}\n"
+    def _remember(self, user_input: str, answer: str):
+        self.history.append((user_input, answer))
+        self.memory.add(user_input, answer)
+
+    def _routed_to_query(self, user_input: str) -> bool:
+        """True if the local router is confident this is a document query."""
+        if not self.router:
+            return False
+        intent, margin, seconds = self.router.route(user_input)
+        logger.info("🔀 Intent: %s (margin %.2f, %.1fms)", intent or "unsure", margin, seconds * 1000)
+        return intent == QUERY
+
+    def _history_prompt(self, user_input: str) -> str:
+        # Summary of older turns + recent turns, bounded by the memory's token budget
+        history_text = self.memory.context()
 
         prompt = f"""
 You are a helpful assistant chatbot. Use the following conversation history to answer the user's new question.
@@ -49,14 +90,24 @@ New Question: {user_input}
 
 Answer:
 """
+        return prompt
+
+    def answer_with_history(self, user_input: str) -> str | None:
+        """
+        Sends user input + conversation memory to LLM.
+        Returns LLM answer, or None if LLM call fails.
+        """
+        prompt = self._history_prompt(user_input)
         try:
-            resp = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt
-            )
-            answer_text = resp.text.strip()
+            with telemetry.external("gemini", "followup", tokens_in=estimate_tokens(prompt)) as call:
+                resp = self.client.models.generate_content(
+                    model="gemini-2.5-flash",
+                    contents=prompt
+                )
+                answer_text = resp.text.strip()
+                call.set(tokens_out=estimate_tokens(answer_text))
         except Exception as e:
-            print("⚠️ LLM call failed:", e)
+            logger.warning("⚠️ LLM call failed: %s", e)
             return None
 
         return answer_text
@@ -64,78 +115,185 @@ Answer:
     # -----------------------------
     # Retrieval pipeline fallback
     # -----------------------------
-    def run_new_query(self, user_input: str) -> str:
+    def _ask_to_run_query(self, user_input: str):
+        """Default `confirm` for respond(): ask on stdin. Returns (run?, query text)."""
+        print(
+            "I am an AI assistant specialized in helping you query and explore your documents. "
+            "For questions outside general conversation, I can fetch the latest data. "
+            "Do you want me to run a query for this?"
+        )
+        choice = input("Please type 'y' to run the query, or 'n' to continue chit-chat: ").strip().lower()
+        if choice != "y":
+            return False, None
+        return True, input("Please type the query you want me to run: ").strip()
+
+    def run_new_query(self, user_input: str, fallback=None) -> str:
         """
         Calls the full retrieval pipeline using embeddings + Postgres + Gemini.
+        `fallback` overrides retrieval_fallback for this call.
         """
-        query_embedding = get_google_embeddings_raw(self.client, [user_input])[0]  # list of floats
-        answer = self.run_pipeline_func(user_input, query_embedding, self.conn, self.llamageneratedjson, self.client)
+        timer = StageTimer()
+        query_embedding = None
+        if not self.concurrent:
+            with timer.stage("embedding"):
+                query_embedding = embed_query(self.client, user_input)  # float32 vector
+        answer = self.run_pipeline_func(user_input, query_embedding, self.pool, self.figure_store, self.client,
+                                        timer=timer,
+                                        fallback=self.retrieval_fallback if fallback is None else fallback)
+        self.last_timings = timer.summary()
+        self.last_trace_id = timer.trace_id
         return answer
 
+    def run_new_query_stream(self, user_input: str, fallback=None):
+        """
+        Streaming run_new_query: retrieval runs first, then the answer is yielded
+        in chunks as Gemini produces it. Time to first token ("ttft") and total
+        generation time end up in last_timings once the stream is consumed.
+        """
+        timer = StageTimer()
+        query_embedding = None
+        if not self.concurrent:
+            with timer.stage("embedding"):
+                query_embedding = embed_query(self.client, user_input)
+        chunks = self.run_pipeline_func(user_input, query_embedding, self.pool, self.figure_store, self.client,
+                                        timer=timer, stream=True,
+                                        fallback=self.retrieval_fallback if fallback is None else fallback)
+        yield from chunks
+        self.last_timings = timer.summary()
+        self.last_trace_id = timer.trace_id
+
     # -----------------------------
     # Main entry point
     # -----------------------------
-    def respond(self, user_input: str) -> str:
+    def respond(self, user_input: str, confirm=None) -> str:
         """
         Handles user input:
-        - Always sends input + last conversation history to LLM
+        - Document queries (per the local intent router) go straight to the pipeline
+        - Otherwise sends input + conversation memory to LLM
         - LLM decides if it can answer (chit-chat) or needs a pipeline run
         - If a query is needed, politely asks user for confirmation before running
+
+        Args:
+            confirm: confirm(user_input) -> (run the pipeline?, query text or None
+                     for user_input); defaults to asking on stdin.
         """
+        confirm = confirm or self._ask_to_run_query
+        self.last_needed_query = False
 
         # ------------------------------
-        # 1️⃣ Prepare history context for LLM
+        # 0️⃣ Route document queries locally, without the LLM round trip
         # ------------------------------
-        history_text = ""
-        for user_msg, bot_msg in list(self.history)[-self.max_history:]:
-            history_text += f"User: {user_msg}\nBot: {bot_msg}\n"
-
-        full_prompt = history_text + f"User: {user_input}\nBot:"
+        if self._routed_to_query(user_input):
+            pipeline_answer = self.run_new_query(user_input)
+            self._remember(user_input, pipeline_answer)
+            return pipeline_answer
 
         # ------------------------------
-        # 2️⃣ Get LLM answer using history
+        # 1️⃣ Get LLM answer using conversation memory
         # ------------------------------
-        llm_answer = self.answer_with_history(full_prompt)
+        timer = StageTimer("followup", **telemetry.text_attrs("message", user_input))
+        with timer.stage("generation"):
+            llm_answer = self.answer_with_history(user_input)
+        self.last_timings = timer.summary()
+        self.last_trace_id = timer.trace_id
+        timer.log("Follow-up timings")
 
         if llm_answer:
-            self.history.append((user_input, llm_answer))
+            self._remember(user_input, llm_answer)
 
             # ------------------------------
-            # 3️⃣ Check if LLM cannot answer (requires new data)
+            # 2️⃣ Check if LLM cannot answer (requires new data)
             # ------------------------------
             if "don't have enough information" in llm_answer.lower() or \
                "cannot answer" in llm_answer.lower():
+                self.last_needed_query = True
+                run_query, query_text = confirm(user_input)
 
-                professional_msg = (
-                    "I am an AI assistant specialized in helping you query and explore your documents. "
-                    "For questions outside general conversation, I can fetch the latest data. "
-                    "Do you want me to run a query for this?"
-                )
-                print(professional_msg)
-                choice = input("Please type 'y' to run the query, or 'n' to continue chit-chat: ").strip().lower()
-
-                if choice == "y":
-                    query_text = input("Please type the query you want me to run: ").strip()
+                if run_query:
+                    query_text = query_text or user_input
                     pipeline_answer = self.run_new_query(query_text)
-                    self.history.append((query_text, pipeline_answer))
+                    self._remember(query_text, pipeline_answer)
                     return pipeline_answer
                 else:
                     fallback = "Let's continue the conversation. Ask me something else!"
-                    self.history.append((user_input, fallback))
+                    self._remember(user_input, fallback)
                     return fallback
 
             # ------------------------------
-            # 4️⃣ Normal LLM answer (chit-chat or answer from history)
+            # 3️⃣ Normal LLM answer (chit-chat or answer from history)
             # ------------------------------
             return llm_answer
 
         # ------------------------------
-        # 5️⃣ LLM call failed completely
+        # 4️⃣ LLM call failed completely
         # ------------------------------
         fallback = "Sorry, I cannot process your request right now."
-        self.history.append((user_input, fallback))
+        self._remember(user_input, fallback)
         return fallback
 
+    def respond_stream(self, user_input: str, confirm=None):
+        """
+        Streaming respond: yields the answer in chunks as they arrive.
+
+        The first STREAM_HOLDBACK_CHARS of a follow-up answer are held back so a
+        "please run a new query" reply is not shown before asking to run the pipeline.
+        `confirm` is as in respond().
+        """
+        confirm = confirm or self._ask_to_run_query
+        self.last_needed_query = False
+        if self._routed_to_query(user_input):
+            answer_parts = []
+            for chunk in self.run_new_query_stream(user_input):
+                answer_parts.append(chunk)
+                yield chunk
+            self._remember(user_input, "".join(answer_parts).strip())
+            return
+
+        parts, held, shown = [], "", False
+        timer = StageTimer("followup", **telemetry.text_attrs("message", user_input))
+        try:
+            for chunk in stream_gemini_text(self.client, self._history_prompt(user_input), timer):
+                parts.append(chunk)
+                if shown:
+                    yield chunk
+                    continue
+                held += chunk
+                if len(held) >= STREAM_HOLDBACK_CHARS and not any(p in held.lower() for p in NEEDS_QUERY_PHRASES):
+                    shown = True
+                    yield held
+        except Exception as e:
+            logger.warning("⚠️ LLM call failed: %s", e)
+        self.last_timings = timer.summary()
+        self.last_trace_id = timer.trace_id
+        timer.log("Follow-up timings")
+        llm_answer = "".join(parts).strip()
+
+        if not llm_answer:
+            fallback = "Sorry, I cannot process your request right now."
+            self._remember(user_input, fallback)
+            yield fallback
+            return
+
+        self._remember(user_input, llm_answer)
+        if any(p in llm_answer.lower() for p in NEEDS_QUERY_PHRASES):
+            self.last_needed_query = True
+            if shown:
+                yield "\n\n"
+            run_query, query_text = confirm(user_input)
+            if run_query:
+                query_text = query_text or user_input
+                answer_parts = []
+                for chunk in self.run_new_query_stream(query_text):
+                    answer_parts.append(chunk)
+                    yield chunk
+                self._remember(query_text, "".join(answer_parts).strip())
+            else:
+                fallback = "Let's continue the conversation. Ask me something else!"
+                self._remember(user_input, fallback)
+                yield fallback
+        elif not shown:
+            yield held
+
     # -----------------------------
     # Utility
     # -----------------------------
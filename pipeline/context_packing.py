@@ -0,0 +1,175 @@
+"""
+Token-budgeted prompt context: which retrieved chunks and figures go into the
+answer prompt, and how they are serialized.
+
+Chunks keep their retrieval order (best first: similarity, or the fused rank
+in hybrid mode) and exact duplicates are dropped. Text that
+neighbouring chunks of the same page share (the splitter's chunk_overlap) is
+sent only once. Figures are ranked by the best similarity of the included
+chunks that reference them. Items go in best first until the token budget
+is used up, serialized as compact JSON lines (no indentation, no empty fields).
+"""
+import json
+import re
+
+from pipeline.ratelimit import estimate_tokens
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_FIGURE_SHARE
+
+# Chunk ids are '<doc_id>_page<N>_chunk<i>'
+_CHUNK_ID = re.compile(r"^(?P<page>.+)_chunk(?P<index>\d+)$")
+# Shortest shared text treated as splitter overlap rather than coincidence
+MIN_OVERLAP_CHARS = 20
+
+
+def compact_json(item):
+    """One-line JSON without null/empty fields."""
+    return json.dumps({k: v for k, v in item.items() if v not in (None, "", [], {})},
+                      separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def split_placeholders(placeholder):
+    """'{a,b}' -> ['a', 'b'] (the format stored on chunks)."""
+    if not placeholder:
+        return []
+    return [p.strip() for p in placeholder.strip("{}").split(",") if p.strip()]
+
+
+def _chunk_position(chunk_id):
+    match = _CHUNK_ID.match(chunk_id or "")
+    return (match["page"], int(match["index"])) if match else (None, None)
+
+
+def text_overlap(left, right, max_chars=1000):
+    """Length of the longest suffix of `left` that is also a prefix of `right`."""
+    for k in range(min(len(left), len(right), max_chars), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:k]):
+            return k
+    return 0
+
+
+def _trim_overlaps(content, page, index, selected):
+    """Drop the text this chunk shares with already selected neighbours on its page."""
+    before = selected.get((page, index - 1))
+    after = selected.get((page, index + 1))
+    head = text_overlap(before, content) if before else 0
+    tail = text_overlap(content, after) if after else 0
+    if head + tail >= len(content):
+        return ""
+    return content[head:len(content) - tail].strip()
+
+
+def _fill(items, budget):
+    """Greedy: keep items (already ranked) whose serialized size still fits."""
+    kept, used = [], 0
+    for item in items:
+        tokens = estimate_tokens(compact_json(item))
+        if used + tokens <= budget:
+            kept.append(item)
+            used += tokens
+    return kept, used
+
+
+def _fill_chunks(chunks, budget, kept_text):
+    """
+    _fill for chunks, trimming each one against the neighbours kept so far.
+    `kept_text` ({(page, index): content}) is updated in place.
+
+    Returns:
+        (kept items, chunks that did not fit, tokens used, chars trimmed,
+         chunks left out because their neighbours already cover all of their text)
+    """
+    kept, spill, used, trimmed_chars, covered = [], [], 0, 0, 0
+    for chunk in chunks:
+        content = chunk.get("content") or ""
+        page, index = _chunk_position(chunk.get("id"))
+        trimmed = _trim_overlaps(content, page, index, kept_text) if page is not None else content
+        if not trimmed:
+            trimmed_chars += len(content)
+            covered += 1
+            continue
+        item = {
+            "id": chunk.get("id"),
+            "report_date": chunk.get("report_date"),
+            "placeholder": chunk.get("placeholder"),
+            "similarity": round(chunk["similarity"], 3) if chunk.get("similarity") is not None else None,
+            "content": trimmed,
+        }
+        tokens = estimate_tokens(compact_json(item))
+        if used + tokens > budget:
+            spill.append(chunk)
+            continue
+        kept.append(item)
+        used += tokens
+        trimmed_chars += len(content) - len(trimmed)
+        if page is not None:
+            kept_text[(page, index)] = content
+    return kept, spill, used, trimmed_chars, covered
+
+
+def pack_context(retrieved_chunks, figures, token_budget=CONTEXT_TOKEN_BUDGET, figure_share=CONTEXT_FIGURE_SHARE):
+    """
+    Select and serialize prompt context within `token_budget` estimated tokens.
+
+    Chunks first fill up to (1 - figure_share) of the budget, figures referenced
+    by the kept chunks get what the chunks left, and any remainder goes back to
+    chunks that did not fit the first pass.
+
+    Args:
+        retrieved_chunks (list[dict]): {"id", "content", "report_date", "placeholder", "similarity"},
+                                       best first.
+        figures (list[dict]): Figure dicts tagged with their "placeholder" (see match_figures).
+        token_budget (int): Estimated tokens for chunks + figures together.
+        figure_share (float): Budget share reserved for figures in the first pass.
+
+    Returns:
+        dict: {"chunks_text", "figures_text", "chunks", "figures",
+               "tokens": {"chunks", "figures"}, "dropped": {...}, "trimmed_chars"}
+    """
+    # Exact duplicates (same text in several documents/pages): keep the best ranked
+    seen, unique = set(), []
+    for chunk in retrieved_chunks:
+        key = " ".join((chunk.get("content") or "").split())
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(chunk)
+    duplicates = len(retrieved_chunks) - len(unique)
+
+    kept_text = {}
+    chunks, spill, chunk_tokens, trimmed_chars, trimmed_chunks = _fill_chunks(
+        unique, int(token_budget * (1 - figure_share)), kept_text)
+
+    # Figures, ranked by the best kept chunk that references them
+    relevance = {}
+    for item in chunks:
+        for placeholder in split_placeholders(item.get("placeholder")):
+            relevance[placeholder] = max(relevance.get(placeholder, 0.0), item.get("similarity") or 0.0)
+    ranked_figures = sorted((f for f in figures if f.get("placeholder") in relevance),
+                            key=lambda f: relevance[f["placeholder"]], reverse=True)
+    kept_figures, figure_tokens = _fill(ranked_figures, token_budget - chunk_tokens)
+
+    # Whatever figures did not use goes to chunks that missed the first pass
+    extra, _, extra_tokens, extra_trimmed, extra_covered = _fill_chunks(
+        spill, token_budget - chunk_tokens - figure_tokens, kept_text)
+    trimmed_chars += extra_trimmed
+    trimmed_chunks += extra_covered
+    if extra:
+        rank = {chunk.get("id"): i for i, chunk in enumerate(unique)}
+        chunks = sorted(chunks + extra, key=lambda item: rank[item["id"]])
+        chunk_tokens += extra_tokens
+
+    return {
+        "chunks_text": "\n".join(compact_json(c) for c in chunks),
+        "figures_text": "\n".join(compact_json(f) for f in kept_figures),
+        "chunks": chunks,
+        "figures": kept_figures,
+        "tokens": {"chunks": chunk_tokens, "figures": figure_tokens},
+        "dropped": {
+            "duplicate_chunks": duplicates,
+            "chunks": len(unique) - len(chunks) - trimmed_chunks,  # over budget
+            "trimmed_chunks": trimmed_chunks,  # text entirely covered by kept neighbours
+            "unreferenced_figures": len(figures) - len(ranked_figures),
+            "figures": len(ranked_figures) - len(kept_figures),
+        },
+        "trimmed_chars": trimmed_chars,
+    }
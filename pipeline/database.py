@@ -1,16 +1,181 @@
+"""
+Postgres (pgvector) connections.
+
+`get_pool()` returns a process-wide `PgPool`: a bounded, thread-safe pool that
+health-checks idle connections on checkout, drops broken ones, and reconnects
+transparently after a server restart / RDS failover. Settings come from config.py.
+
+    with get_pool().connection() as conn:
+        cursor = conn.cursor()
+        ...
+"""
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
-import os
-from dotenv import load_dotenv
+from psycopg2 import pool as pg_pool
+
+from config import (
+    PGVECTOR_HOST, PGVECTOR_PORT, PGVECTOR_DB, PGVECTOR_USER, PGVECTOR_PASSWORD_KEY,
+    PGVECTOR_SSLMODE, PGVECTOR_CONNECT_TIMEOUT, PGVECTOR_APPLICATION_NAME,
+    PGVECTOR_POOL_MIN, PGVECTOR_POOL_MAX, PGVECTOR_HEALTHCHECK_SECS, PGVECTOR_RECONNECT_RETRIES,
+)
+
+# Errors after which a connection must not be reused
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+def connection_kwargs():
+    """psycopg2.connect() keyword arguments built from config.py."""
+    return {
+        "host": PGVECTOR_HOST,
+        "port": PGVECTOR_PORT,
+        "dbname": PGVECTOR_DB,
+        "user": PGVECTOR_USER,
+        "password": PGVECTOR_PASSWORD_KEY,
+        "sslmode": PGVECTOR_SSLMODE,
+        "connect_timeout": PGVECTOR_CONNECT_TIMEOUT,
+        "application_name": PGVECTOR_APPLICATION_NAME,
+        # TCP keepalives so dead peers (failover) are noticed instead of hanging
+        "keepalives": 1,
+        "keepalives_idle": 30,
+        "keepalives_interval": 10,
+        "keepalives_count": 3,
+    }
 
-load_dotenv()
 
-print("DEBUG password from env:", os.getenv("PGVECTOR_PASSWORD_KEY"))  # 👈 add this
 def connect_pg():
-    conn = psycopg2.connect(
-        host="postgres-vectorstore.clmnkejpqspy.us-east-1.rds.amazonaws.com",
-        port=5432,
-        dbname="postgres",
-        user="postgres",
-        password=os.getenv("PGVECTOR_PASSWORD_KEY")
-    )
-    return conn
+    """Open a standalone (unpooled) connection. Prefer get_pool().connection()."""
+    return psycopg2.connect(**connection_kwargs())
+
+
+class PgPool:
+    def __init__(self, minconn=PGVECTOR_POOL_MIN, maxconn=PGVECTOR_POOL_MAX,
+                 healthcheck_interval=PGVECTOR_HEALTHCHECK_SECS, **connect_kwargs):
+        """
+        Bounded connection pool with health checks and reconnect.
+
+        Args:
+            minconn (int): Connections kept open.
+            maxconn (int): Hard cap; checkouts block while all are in use.
+            healthcheck_interval (float): Ping connections idle for longer than this.
+            connect_kwargs: psycopg2.connect() arguments (defaults from config.py).
+        """
+        self._connect_kwargs = connect_kwargs or connection_kwargs()
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, **self._connect_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {}      # id(conn) -> (monotonic time, epoch)
+        self._epoch = 0           # bumped on every connection failure
+        self.healthcheck_interval = healthcheck_interval
+
+    # -----------------------------
+    # Checkout / checkin
+    # -----------------------------
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used, epoch = self._last_used.get(id(conn), (0.0, -1))
+        if epoch == self._epoch and time.monotonic() - last_used < self.healthcheck_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self):
+        # Every pooled connection may be stale after a failover; try each at most once
+        for _ in range(self._pool.maxconn + 1):
+            conn = self._pool.getconn()
+            if self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+        raise psycopg2.OperationalError("Could not obtain a healthy Postgres connection")
+
+    def _discard(self, conn):
+        with self._lock:
+            self._epoch += 1
+            self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+
+    def _checkin(self, conn):
+        with self._lock:
+            self._last_used[id(conn)] = (time.monotonic(), self._epoch)
+        self._pool.putconn(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection. Commits on success, rolls back on error, and
+        returns the connection to the pool (or closes it if it is broken).
+        """
+        self._slots.acquire()
+        conn = None
+        try:
+            conn = self._checkout()
+            try:
+                yield conn
+                if not conn.closed:
+                    conn.commit()
+            except CONNECTION_ERRORS:
+                self._discard(conn)
+                conn = None
+                raise
+            except BaseException:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+        finally:
+            if conn is not None:
+                if conn.closed:
+                    self._discard(conn)
+                else:
+                    self._checkin(conn)
+            self._slots.release()
+
+    def run(self, func, retries=PGVECTOR_RECONNECT_RETRIES):
+        """
+        Call func(conn) in a pooled transaction, retrying on a fresh connection
+        if the server dropped it. Only use for work that is safe to repeat.
+        """
+        for attempt in range(retries + 1):
+            try:
+                with self.connection() as conn:
+                    return func(conn)
+            except CONNECTION_ERRORS as e:
+                if attempt == retries:
+                    raise
+                print(f"⚠️ Postgres connection lost ({e.__class__.__name__}), reconnecting...")
+                time.sleep(min(2 ** attempt, 10))
+
+    def close(self):
+        if not self._pool.closed:
+            self._pool.closeall()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process-wide pool, created on first use from config.py settings."""
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                _default_pool = PgPool()
+                atexit.register(close_pool)
+    return _default_pool
+
+
+def close_pool():
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is not None:
+            _default_pool.close()
+            _default_pool = None
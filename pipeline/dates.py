@@ -0,0 +1,28 @@
+"""
+Report dates mentioned in a query ("Jan 2024", "Mar'24", "C3Q24").
+
+Kept apart from pipeline.run_query so lightweight callers (the intent router)
+can use it without importing the query pipeline.
+"""
+import re
+
+import dateparser
+
+
+def extract_report_dates(query: str):
+    """Report dates in the query as 'YYYY-MM' / 'YYYY-Qn' strings (unordered, unique)."""
+    dates = []
+    matches = re.findall(
+        r"(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s?['\-]?\s?(\d{2,4})",
+        query, re.I
+    )
+    for month, year in matches:
+        year = "20" + year if len(year) == 2 else year
+        parsed = dateparser.parse(f"{month} {year}")
+        if parsed:
+            dates.append(parsed.strftime("%Y-%m"))
+    qmatches = re.findall(r"C([1-4])Q(\d{2})", query, re.I)
+    for quarter, year in qmatches:
+        year = "20" + year
+        dates.append(f"{year}-Q{quarter}")
+    return list(set(dates))
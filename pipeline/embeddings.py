@@ -2,11 +2,24 @@
 # 5️⃣ Split into chunks (in-memory)
 # ===============================
 from google.genai import types
+import logging
 import numpy as np  
 import re
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline.ratelimit import RateLimiter, call_with_retry, estimate_tokens
+from pipeline.cache import get_embedding_cache
+from pipeline import telemetry
+from config import (
+    EMBEDDING_MODEL, EMBEDDING_DIM, EMBED_BATCH_SIZE, EMBED_MAX_IN_FLIGHT,
+    EMBED_REQUESTS_PER_MINUTE, EMBED_TOKENS_PER_MINUTE, EMBED_MAX_RETRIES,
+)
+
+logger = logging.getLogger(__name__)
 
 def chunk_full_json(full_json_text_table_charts, chunk_size=2500, chunk_overlap=300):
+    # Imported here so the chatbot (which only embeds queries) does not pay for langchain at startup
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
     all_chunks=[]
     text_splitter=RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
     placeholder_pattern=re.compile(r"^\[.*?_(Chart|Table)\d+_Page\d+\]$")
@@ -29,33 +42,98 @@ def chunk_full_json(full_json_text_table_charts, chunk_size=2500, chunk_overlap=
             })
     return all_chunks
 
-def get_google_embeddings_raw(client, chunk_texts, batch_size=100, dim=768):
+# Shared by every caller in the process so concurrent runs respect one budget
+_embed_rate_limiter = RateLimiter(EMBED_REQUESTS_PER_MINUTE, EMBED_TOKENS_PER_MINUTE)
+
+
+def _embed_batch(client, batch, dim, rate_limiter, max_retries):
+    def _call():
+        tokens = sum(estimate_tokens(t) for t in batch)
+        rate_limiter.acquire(tokens)
+        with telemetry.external("gemini", "embed", texts=len(batch), tokens_in=tokens):
+            return client.models.embed_content(
+                model=EMBEDDING_MODEL,
+                contents=batch,
+                config=types.EmbedContentConfig(output_dimensionality=dim)
+            )
+    result = call_with_retry(_call, max_retries=max_retries)
+    return np.array([emb.values for emb in result.embeddings], dtype=np.float32)
+
+
+def _embed_uncached(client, texts, batch_size, dim, max_in_flight, rate_limiter, max_retries, on_batch=None):
+    """
+    Embed texts through the API; returns a float32 matrix in input order.
+    on_batch(batch_texts, batch_embeddings) is called as each batch completes (from a worker thread).
+    """
+    all_embeddings = np.empty((len(texts), dim), dtype=np.float32)
+    starts = range(0, len(texts), batch_size)
+
+    def _fill(i):
+        batch = texts[i:i+batch_size]
+        embeddings = _embed_batch(client, batch, dim, rate_limiter, max_retries)
+        all_embeddings[i:i+len(batch)] = embeddings
+        if on_batch:
+            on_batch(batch, embeddings)
+
+    if len(starts) <= 1 or max_in_flight <= 1:
+        for i in starts:
+            _fill(i)
+    else:
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            for future in [executor.submit(telemetry.propagate(_fill), i) for i in starts]:
+                future.result()
+    return all_embeddings
+
+
+def get_google_embeddings_raw(client, chunk_texts, batch_size=EMBED_BATCH_SIZE, dim=EMBEDDING_DIM,
+                              max_in_flight=EMBED_MAX_IN_FLIGHT, rate_limiter=None,
+                              max_retries=EMBED_MAX_RETRIES, cache=None):
     """
     Generate raw embeddings for chunk_texts using Gemini embedding API
     without any normalization.
 
+    Texts already in the on-disk embedding cache (keyed by model, dim and text)
+    are not sent again; only the misses go to the API. Each batch is cached as
+    soon as it returns, so a failing late batch does not lose the ones already
+    paid for. Several batches are kept in flight on a thread pool, subject to
+    the shared requests/tokens-per-minute budget; transient errors (429, 5xx,
+    timeouts) are retried with jittered backoff. Output rows are in input order.
+
     Args:
         chunk_texts (list[str]): List of texts to embed.
         batch_size (int): Max 100, API limitation.
         dim (int): Desired embedding dimensionality (default 768).
+        max_in_flight (int): Concurrent embed_content requests.
+        rate_limiter (RateLimiter): Defaults to the process-wide embedding limiter.
+        max_retries (int): Retries per batch.
+        cache (EmbeddingCache | False | None): None = process-wide cache, False = no cache.
 
     Returns:
-        list[list[float]]: List of raw embeddings (each a list of floats).
+        np.ndarray: float32 matrix of shape (len(chunk_texts), dim).
     """
-    all_embeddings = []
+    rate_limiter = rate_limiter or _embed_rate_limiter
+    cache = get_embedding_cache() if cache is None else (cache or None)
+
+    cached = cache.lookup(EMBEDDING_MODEL, dim, set(chunk_texts)) if cache else {}
+    # Unique misses only: identical texts in one call are embedded once
+    missing = list(dict.fromkeys(t for t in chunk_texts if t not in cached))
+    n_hits = len(cached)
+    if missing:
+        def _store(batch, embeddings):
+            cache.store_many(EMBEDDING_MODEL, dim, dict(zip(batch, embeddings)))
 
-    for i in range(0, len(chunk_texts), batch_size):
-        batch = chunk_texts[i:i+batch_size]
+        fresh = _embed_uncached(client, missing, batch_size, dim, max_in_flight, rate_limiter, max_retries,
+                                on_batch=_store if cache else None)
+        cached.update(zip(missing, fresh))
+    if cache and len(chunk_texts) > 1:
+        logger.info("   ↳ Embedding cache: %d hits, %d misses sent to API", n_hits, len(missing))
 
-        result = client.models.embed_content(
-            model="gemini-embedding-001",
-            contents=batch,
-            config=types.EmbedContentConfig(output_dimensionality=dim)
-        )
+    all_embeddings = np.empty((len(chunk_texts), dim), dtype=np.float32)
+    for i, text in enumerate(chunk_texts):
+        all_embeddings[i] = cached[text]
+    return all_embeddings
 
-        for emb in result.embeddings:
-            # directly convert to float32 without normalization
-            vec = np.array(emb.values, dtype=np.float32)
-            all_embeddings.append(vec.tolist())
 
-    return all_embeddings
\ No newline at end of file
+def embed_query(client, query_text, dim=EMBEDDING_DIM):
+    """Embedding of one query as a float32 vector (served from the cache when repeated)."""
+    return get_google_embeddings_raw(client, [query_text], dim=dim)[0]
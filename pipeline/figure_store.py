@@ -0,0 +1,169 @@
+"""
+Figure store: llama-generated figure JSON indexed by placeholder.
+
+`FigureStore` is an in-memory dict (placeholder -> figures) built once at load
+time. `SQLiteFigureStore` keeps the same index in a read-only SQLite file next
+to the other caches: the JSON is parsed only when the source file changes,
+startup just opens the file, each lookup decodes only the figures it returns,
+and the pages are memory-mapped so several chatbot processes share them
+through the OS page cache.
+"""
+import json
+import os
+import sqlite3
+import threading
+
+from config import LLAMA_JSON_PATH, FIGURE_INDEX_PATH, FIGURE_STORE_BACKEND
+
+
+def normalize_placeholder(placeholder):
+    """Llama JSON placeholders carry the crop file name: drop `.png` and whitespace."""
+    return placeholder.replace(".png", "").strip()
+
+
+def _annotated_figures(node, placeholder):
+    """The node's figures as dicts tagged with their placeholder (done once, at index time)."""
+    figures = []
+    for fig in node.get("figures", []):
+        fig = dict(fig) if isinstance(fig, dict) else {"text": fig}
+        fig["placeholder"] = placeholder
+        figures.append(fig)
+    return figures
+
+
+def index_llama_nodes(llamageneratedjson):
+    """{placeholder: [figure, ...]} in file order; nodes sharing a placeholder are merged."""
+    index = {}
+    for node in llamageneratedjson:
+        placeholder = node.get("placeholder")
+        if not isinstance(placeholder, str):
+            continue
+        placeholder = normalize_placeholder(placeholder)
+        index.setdefault(placeholder, []).extend(_annotated_figures(node, placeholder))
+    return index
+
+
+class FigureStore:
+    def __init__(self, index):
+        """
+        Args:
+            index (dict): {placeholder: [figure dicts]}, see index_llama_nodes.
+        """
+        self._index = index
+
+    @classmethod
+    def from_nodes(cls, llamageneratedjson):
+        return cls(index_llama_nodes(llamageneratedjson))
+
+    @classmethod
+    def from_json(cls, llama_json_path=LLAMA_JSON_PATH):
+        with open(llama_json_path, "r") as f:
+            return cls.from_nodes(json.load(f))
+
+    def get(self, placeholder):
+        """Figures for one placeholder (the stored dicts; do not mutate)."""
+        return self._index.get(placeholder, [])
+
+    def figures_for(self, placeholders):
+        """Figures for each distinct placeholder, in the order given."""
+        figures = []
+        for placeholder in dict.fromkeys(placeholders):
+            figures.extend(self.get(placeholder))
+        return figures
+
+    def __contains__(self, placeholder):
+        return placeholder in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def build_figure_index(llama_json_path=LLAMA_JSON_PATH, index_path=FIGURE_INDEX_PATH):
+    """(Re)build the SQLite index from the llama JSON; written to a temp file, then swapped in."""
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    tmp = f"{index_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    with open(llama_json_path, "r") as f:
+        index = index_llama_nodes(json.load(f))
+    db = sqlite3.connect(tmp)
+    db.execute("CREATE TABLE figures (placeholder TEXT PRIMARY KEY, figures TEXT NOT NULL);")
+    db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);")
+    db.executemany("INSERT INTO figures VALUES (?, ?);",
+                   ((ph, json.dumps(figs, separators=(",", ":"))) for ph, figs in index.items()))
+    db.execute("INSERT INTO meta VALUES ('source', ?);", (_source_signature(llama_json_path),))
+    db.commit()
+    db.close()
+    os.replace(tmp, index_path)
+    print(f"✅ Indexed {len(index)} figure placeholders into {index_path}")
+
+
+class SQLiteFigureStore:
+    """FigureStore backed by the read-only SQLite index; figures are decoded per lookup."""
+
+    def __init__(self, index_path=FIGURE_INDEX_PATH, mmap_bytes=256 << 20):
+        self.index_path = index_path
+        self._db = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True, check_same_thread=False)
+        self._db.execute(f"PRAGMA mmap_size={int(mmap_bytes)};")
+        self._lock = threading.Lock()
+
+    def source_signature(self):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'source';").fetchone()
+        return row[0] if row else None
+
+    def get(self, placeholder):
+        with self._lock:
+            row = self._db.execute("SELECT figures FROM figures WHERE placeholder = ?;", (placeholder,)).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def figures_for(self, placeholders):
+        placeholders = list(dict.fromkeys(placeholders))
+        if not placeholders:
+            return []
+        marks = ",".join("?" * len(placeholders))
+        with self._lock:
+            rows = dict(self._db.execute(
+                f"SELECT placeholder, figures FROM figures WHERE placeholder IN ({marks});", placeholders
+            ).fetchall())
+        figures = []
+        for placeholder in placeholders:
+            if placeholder in rows:
+                figures.extend(json.loads(rows[placeholder]))
+        return figures
+
+    def __contains__(self, placeholder):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM figures WHERE placeholder = ?;", (placeholder,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM figures;").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def open_figure_store(llama_json_path=LLAMA_JSON_PATH, backend=FIGURE_STORE_BACKEND, index_path=FIGURE_INDEX_PATH):
+    """
+    Open the figure store for the chatbot.
+
+    Args:
+        backend (str): "sqlite" (shared on-disk index, rebuilt when the JSON
+                       changes) or "memory" (parse the JSON into a dict).
+    """
+    if backend == "memory":
+        return FigureStore.from_json(llama_json_path)
+    if os.path.exists(index_path):
+        store = SQLiteFigureStore(index_path)
+        if store.source_signature() == _source_signature(llama_json_path):
+            return store
+        store.close()
+    build_figure_index(llama_json_path, index_path)
+    return SQLiteFigureStore(index_path)
@@ -0,0 +1,117 @@
+"""
+Batched YOLO inference for layout detection and chart classification.
+
+Images are run through the model N at a time in a single forward pass, and
+the results are scattered back to their source images. Detection letterboxes
+pages to one fixed square `imgsz` (boxes are mapped back to original pixel
+coordinates); classification passes crops unchanged, so the model applies the
+same resize + center-crop it was trained with.
+"""
+import time
+from abc import ABC, abstractmethod
+
+import cv2
+import numpy as np
+
+from pipeline import telemetry
+
+LETTERBOX_COLOR = (114, 114, 114)
+
+
+def letterbox(img, imgsz, color=LETTERBOX_COLOR):
+    """
+    Resize keeping aspect ratio and pad to imgsz x imgsz.
+
+    Returns:
+        tuple: (padded image, scale, (pad_x, pad_y))
+    """
+    h, w = img.shape[:2]
+    scale = min(imgsz / h, imgsz / w)
+    new_w, new_h = max(1, round(w * scale)), max(1, round(h * scale))
+    resized = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR) if (new_w, new_h) != (w, h) else img
+    pad_x, pad_y = (imgsz - new_w) // 2, (imgsz - new_h) // 2
+    padded = cv2.copyMakeBorder(resized, pad_y, imgsz - new_h - pad_y, pad_x, imgsz - new_w - pad_x,
+                                cv2.BORDER_CONSTANT, value=color)
+    return padded, scale, (pad_x, pad_y)
+
+
+class BatchedPredictor(ABC):
+    operation = "predict"  # telemetry label
+
+    def __init__(self, model, imgsz, batch_size, use_letterbox=True, **predict_kwargs):
+        """
+        Args:
+            model: ultralytics / doclayout_yolo model (callable on a list of images).
+            imgsz (int): Fixed square inference size.
+            batch_size (int): Images per forward pass.
+            use_letterbox (bool): Letterbox inputs to imgsz before inference.
+            predict_kwargs: Extra arguments for the model call (e.g. conf, device).
+        """
+        self.model = model
+        self.imgsz = imgsz
+        self.batch_size = batch_size
+        self.use_letterbox = use_letterbox
+        self.predict_kwargs = predict_kwargs
+        self.images = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    @abstractmethod
+    def _parse(self, result, scale, pad, orig_shape):
+        """One model result -> the parsed output for its source image (orig_shape = (h, w))."""
+
+    def predict(self, images):
+        """Run every image through the model in batches; one parsed result per image, in order."""
+        outputs = []
+        for i in range(0, len(images), self.batch_size):
+            batch = images[i:i+self.batch_size]
+            if self.use_letterbox:
+                boxed = [letterbox(img, self.imgsz) for img in batch]
+            else:
+                boxed = [(img, 1.0, (0, 0)) for img in batch]
+            start = time.perf_counter()
+            with telemetry.external("yolo", self.operation, images=len(batch)):
+                results = self.model([b[0] for b in boxed], imgsz=self.imgsz, save=False,
+                                     verbose=False, **self.predict_kwargs)
+            self.seconds += time.perf_counter() - start
+            self.images += len(batch)
+            self.batches += 1
+            outputs.extend(self._parse(r, scale, pad, img.shape[:2])
+                           for r, img, (_, scale, pad) in zip(results, batch, boxed))
+        return outputs
+
+    def throughput(self):
+        """Images per second of model time so far."""
+        return self.images / self.seconds if self.seconds else 0.0
+
+    def stats(self):
+        return {"images": self.images, "batches": self.batches,
+                "seconds": round(self.seconds, 3), "images_per_sec": round(self.throughput(), 2)}
+
+
+class BatchedDetector(BatchedPredictor):
+    """Layout detection; each result is a list of (xyxy int array, conf, cls) in source-image pixels."""
+    operation = "detect"
+
+    def _parse(self, result, scale, pad, orig_shape):
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return []
+        xyxy = boxes.xyxy.cpu().numpy().astype(np.float32)
+        xyxy[:, [0, 2]] -= pad[0]
+        xyxy[:, [1, 3]] -= pad[1]
+        xyxy /= scale
+        h, w = orig_shape
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, w)
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, h)
+        confs = boxes.conf.cpu().numpy()
+        classes = boxes.cls.cpu().numpy()
+        return [(xyxy[j].astype(int), float(confs[j]), int(classes[j])) for j in range(len(xyxy))]
+
+
+class BatchedClassifier(BatchedPredictor):
+    """Image classification; each result is (top1 class, top1 confidence)."""
+    operation = "classify"
+
+    def _parse(self, result, scale, pad, orig_shape):
+        return int(result.probs.top1), float(result.probs.top1conf)
@@ -0,0 +1,160 @@
+"""
+Incremental, resumable, streaming ingestion of one PDF into pgvector.
+
+Pages flow through bounded generator stages:
+detection + text (background thread) -> summarize + chunk (a few pages in
+flight) -> embed (groups of EMBED_BATCH_SIZE chunks) -> per-page checkpoint.
+Each stage's output is checkpointed per page ("detect", "chunks", then the
+final chunks + embeddings), and a resumed run picks every page up after its
+last finished stage. Each checkpoint replaces the page's previous one (the
+detect one holds the crops, so only pages in flight keep them on disk). Crops
+are dropped from memory as soon as their page is summarized, so memory
+depends on the buffer sizes in config.py, not on the size of the PDF or the
+folder. Once every page is checkpointed, the document's rows are replaced in
+one transaction, streaming the checkpoints into COPY.
+"""
+import os
+
+from pipeline.pdf_processing import document_id, extract_report_date_from_filename, iter_page_nodes, page_count
+from pipeline.summarization import summarize_all_table_chart_nodes_in_memory, merge_text_and_table_charts
+from pipeline.embeddings import chunk_full_json, get_google_embeddings_raw
+from pipeline.insert_chunks_pgvector import replace_document_chunk_batches
+from pipeline.manifest import file_sha256
+from pipeline.streaming import prefetch, bounded_map
+from pipeline.timing import StageTimer
+from pipeline import telemetry
+from config import INGEST_KEEP_CHECKPOINTS, INGEST_PREFETCH_PAGES, INGEST_PAGES_IN_FLIGHT, EMBED_BATCH_SIZE
+
+
+def _page_checkpoint(page_num, stage=None):
+    """Final output of a page (chunks + embeddings), or of an earlier stage ("detect" / "chunks")."""
+    return f"page{page_num:05d}" + (f".{stage}" if stage else "")
+
+
+@telemetry.traced()
+def summarize_and_chunk_page(client, page):
+    """(page_num, placeholders, text_node, table_chart_nodes) -> (page_num, chunks)."""
+    page_num, _, text_node, table_chart_nodes = page
+    # Summarized nodes come back without their crops
+    summarized = summarize_all_table_chart_nodes_in_memory(client, table_chart_nodes) if table_chart_nodes else []
+    return page_num, chunk_full_json(merge_text_and_table_charts([text_node], summarized))
+
+
+def _embed_pages(client, group):
+    texts = [c["chunk_text"] for _, chunks in group for c in chunks]
+    embeddings = get_google_embeddings_raw(client, texts) if texts else []
+    offset = 0
+    for page_num, chunks in group:
+        yield page_num, chunks, embeddings[offset:offset+len(chunks)]
+        offset += len(chunks)
+
+
+def embed_page_chunks(client, pages, batch_size=EMBED_BATCH_SIZE):
+    """
+    Embed a stream of (page_num, chunks), grouping pages so each API call is
+    close to a full batch. Yields (page_num, chunks, embeddings) in order.
+    """
+    group, n_chunks = [], 0
+    for page_num, chunks in pages:
+        group.append((page_num, chunks))
+        n_chunks += len(chunks)
+        if n_chunks >= batch_size:
+            yield from _embed_pages(client, group)
+            group, n_chunks = [], 0
+    if group:
+        yield from _embed_pages(client, group)
+
+
+def ingest_document(pdf_path, client, pool, manifest, checkpoints, executor=None, force=False,
+                    table_name="pdf_chunks_768"):
+    """
+    Ingest one PDF unless the manifest says this exact content is already in pgvector.
+
+    Args:
+        pdf_path (str): PDF to ingest.
+        client: Gemini client (summaries + embeddings).
+        pool: pipeline.database.PgPool.
+        manifest (IngestManifest): Per-document content hash / status.
+        checkpoints (CheckpointStore): Per-page outputs, keyed by content hash.
+        executor: Page-rendering process pool (see pdf_processing.rendering_executor).
+        force (bool): Re-ingest even if unchanged.
+
+    Returns:
+        dict | None: Insert stats, or None if the document was skipped.
+    """
+    pdf_file = os.path.basename(pdf_path)
+    doc_id = document_id(pdf_file)
+    content_hash = file_sha256(pdf_path)
+
+    if not force and manifest.is_current(doc_id, content_hash):
+        print(f"⏭️  {pdf_file}: unchanged, skipping")
+        return None
+
+    previous = manifest.get(doc_id)
+    if previous and previous["content_hash"] != content_hash:
+        print(f"🔄 {pdf_file}: content changed, re-ingesting")
+        checkpoints.clear(previous["content_hash"])
+    n_pages = page_count(pdf_path)
+    done = checkpoints.completed(content_hash)
+    todo = [i for i in range(n_pages) if _page_checkpoint(i + 1) not in done]
+    # Unfinished pages resume after their last checkpointed stage
+    resume_chunked = [i + 1 for i in todo if _page_checkpoint(i + 1, "chunks") in done]
+    resume_detected = [i + 1 for i in todo
+                       if i + 1 not in resume_chunked and _page_checkpoint(i + 1, "detect") in done]
+    to_detect = [i for i in todo if i + 1 not in resume_chunked and i + 1 not in resume_detected]
+    print(f"📄 {pdf_file}: ingesting {n_pages} pages"
+          + (f" (resuming, {n_pages - len(todo)} already done)" if len(todo) < n_pages else "")
+          + (f" ({len(resume_chunked)} already summarized, {len(resume_detected)} already detected)"
+             if resume_chunked or resume_detected else ""))
+    manifest.mark(doc_id, pdf_file, content_hash, "in_progress")
+    report_date = extract_report_date_from_filename(pdf_file)
+
+    def _detected_pages():
+        for page_num in resume_detected:
+            yield checkpoints.load(content_hash, _page_checkpoint(page_num, "detect"))
+        if to_detect:
+            for page in iter_page_nodes(pdf_path, doc_id, report_date, executor, pages=to_detect):
+                checkpoints.save(content_hash, _page_checkpoint(page[0], "detect"), page)
+                yield page
+
+    def _summarize_and_chunk(page):
+        page_num, chunks = summarize_and_chunk_page(client, page)
+        checkpoints.save(content_hash, _page_checkpoint(page_num, "chunks"), chunks)
+        checkpoints.discard(content_hash, _page_checkpoint(page_num, "detect"))
+        return page_num, chunks
+
+    def _chunked_pages(summarized):
+        for page_num in resume_chunked:
+            yield page_num, checkpoints.load(content_hash, _page_checkpoint(page_num, "chunks"))
+        yield from summarized
+
+    timer = StageTimer("ingest", doc=pdf_file, pages=n_pages, pages_todo=len(todo))
+    with timer.stage("pages"):
+        if todo:
+            pages = prefetch(_detected_pages(), maxsize=INGEST_PREFETCH_PAGES, name=f"detect-{doc_id}")
+            summarized = bounded_map(_summarize_and_chunk, pages,
+                                     max_in_flight=INGEST_PAGES_IN_FLIGHT, name="summarize")
+            chunked = _chunked_pages(summarized)
+            try:
+                for page_num, chunks, embeddings in embed_page_chunks(client, chunked):
+                    checkpoints.save(content_hash, _page_checkpoint(page_num),
+                                     {"chunks": chunks, "embeddings": embeddings})
+                    checkpoints.discard(content_hash, _page_checkpoint(page_num, "chunks"))
+            finally:
+                chunked.close()
+                summarized.close()
+                pages.close()
+            print(f"   ↳ {len(todo)} pages detected, summarized, chunked and embedded")
+
+    def _checkpointed_pages():
+        for page_num in range(1, n_pages + 1):
+            page = checkpoints.load(content_hash, _page_checkpoint(page_num))
+            yield page["chunks"], page["embeddings"]
+
+    with timer.stage("insert"):
+        stats = replace_document_chunk_batches(pool, doc_id, _checkpointed_pages(), table_name)
+    manifest.mark(doc_id, pdf_file, content_hash, "ingested", chunk_count=stats["rows"])
+    timer.log(f"{pdf_file} timings", rows=stats["rows"])
+    if not INGEST_KEEP_CHECKPOINTS:
+        checkpoints.clear(content_hash)
+    return stats
@@ -1,28 +1,280 @@
-def insert_chunks_into_pgvector(conn, all_chunks, chunk_embeddings, table_name="pdf_chunks_768"):
+"""
+Bulk loader for the pgvector chunk table.
+
+Rows are streamed with `COPY ... FROM STDIN` into a session-local staging table
+(binary format when every column type has a binary encoder here, text format
+otherwise), then upserted with `INSERT ... ON CONFLICT (id) DO UPDATE`, so
+re-running an ingestion is idempotent. Each batch is its own transaction.
+"""
+import io
+import struct
+import time
+
+import numpy as np
+
+from pipeline.catalog import sync_documents, invalidate_document_catalog
+from pipeline import telemetry
+
+COLUMNS = ("id", "content", "embedding", "report_date", "page_num", "type", "placeholder")
+TEXT_OID = 25
+BINARY_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+
+
+# --------------------------
+# Row preparation
+# --------------------------
+def _pg_array_literal(values):
+    """Python list -> Postgres array literal, quoting elements only when needed (like array_out)."""
+    items = []
+    for v in values:
+        s = str(v)
+        if s == "" or s.upper() == "NULL" or any(ch in s for ch in '{},"\\ \t\n'):
+            s = '"' + s.replace("\\", "\\\\").replace('"', '\\"') + '"'
+        items.append(s)
+    return "{" + ",".join(items) + "}"
+
+
+def _chunk_rows(all_chunks, chunk_embeddings):
+    """Yield one tuple per chunk in COLUMNS order."""
+    for chunk, emb in zip(all_chunks, chunk_embeddings):
+        yield (
+            chunk["chunk_id"],
+            chunk["chunk_text"],
+            np.asarray(emb, dtype=np.float32),
+            chunk.get("report_date"),
+            chunk.get("page_num"),
+            chunk.get("type"),
+            chunk.get("placeholder"),
+        )
+
+
+# --------------------------
+# COPY encoders
+# --------------------------
+def _copy_text_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, np.ndarray):
+        return "[" + ",".join(map(str, value.tolist())) + "]"
+    if isinstance(value, (list, tuple)):
+        value = _pg_array_literal(value)
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def _encode_text(rows):
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(_copy_text_value(v) for v in row))
+        buf.write("\n")
+    buf.seek(0)
+    return buf
+
+
+def _bin_text(value):
+    if isinstance(value, (list, tuple)):
+        value = _pg_array_literal(value)
+    return str(value).encode("utf-8")
+
+
+def _bin_text_array(value):
+    if isinstance(value, str):
+        value = [p.strip() for p in value.strip("{}").split(",") if p.strip()]
+    if not value:
+        return struct.pack(">iii", 0, 0, TEXT_OID)
+    parts = [struct.pack(">iiiii", 1, 0, TEXT_OID, len(value), 1)]
+    for v in value:
+        data = str(v).encode("utf-8")
+        parts.append(struct.pack(">i", len(data)) + data)
+    return b"".join(parts)
+
+
+def _bin_vector(value):
+    vec = np.asarray(value, dtype=">f4")
+    return struct.pack(">hh", vec.shape[0], 0) + vec.tobytes()
+
+
+BINARY_ENCODERS = {
+    "text": _bin_text,
+    "character varying": _bin_text,
+    "text[]": _bin_text_array,
+    "character varying[]": _bin_text_array,
+    "integer": lambda v: struct.pack(">i", int(v)),
+    "bigint": lambda v: struct.pack(">q", int(v)),
+    "smallint": lambda v: struct.pack(">h", int(v)),
+    "vector": _bin_vector,
+}
+
+
+def _binary_encoders(column_types):
+    """Encoder per column, or None if any column type has no binary encoder here."""
+    encoders = []
+    for type_name in column_types:
+        base = type_name.split("(")[0].strip()
+        if type_name.endswith("[]") and base + "[]" in BINARY_ENCODERS:
+            base += "[]"
+        if base not in BINARY_ENCODERS:
+            return None
+        encoders.append(BINARY_ENCODERS[base])
+    return encoders
+
+
+def _encode_binary(rows, encoders):
+    buf = io.BytesIO()
+    buf.write(BINARY_COPY_HEADER)
+    field_count = struct.pack(">h", len(encoders))
+    for row in rows:
+        buf.write(field_count)
+        for value, encode in zip(row, encoders):
+            if value is None:
+                buf.write(struct.pack(">i", -1))
+            else:
+                data = encode(value)
+                buf.write(struct.pack(">i", len(data)))
+                buf.write(data)
+    buf.write(struct.pack(">h", -1))
+    buf.seek(0)
+    return buf
+
+
+def _column_types(cursor, table_name, columns):
+    cursor.execute(
+        """
+        SELECT attname, format_type(atttypid, atttypmod)
+        FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped;
+        """,
+        (table_name,),
+    )
+    types = dict(cursor.fetchall())
+    return [types[c] for c in columns]
+
+
+# --------------------------
+# Bulk upsert
+# --------------------------
+def _batch_rows(chunk_batches):
+    """Rows for an iterable of (chunks, embeddings) pairs, consumed lazily."""
+    for chunks, embeddings in chunk_batches:
+        if len(chunks) != len(embeddings):
+            raise ValueError(f"{len(chunks)} chunks but {len(embeddings)} embeddings")
+        yield from _chunk_rows(chunks, embeddings)
+
+
+def copy_chunks_into_pgvector(conn, all_chunks, chunk_embeddings, table_name="pdf_chunks_768",
+                              batch_size=5000, binary=True, commit=True):
     """
-    Insert chunks + embeddings into Postgres pgvector table.
+    Bulk upsert chunks + embeddings via COPY into a staging table.
+
+    Args:
+        conn: psycopg2 connection (left open).
+        all_chunks (list[dict]): Chunks from chunk_full_json.
+        chunk_embeddings: Embeddings aligned with all_chunks (list of lists or 2D array).
+        batch_size (int): Rows per COPY + upsert transaction.
+        binary (bool): Use binary COPY when every column type supports it.
+        commit (bool): Commit after every batch; False leaves the whole load in
+                       the caller's transaction.
+
+    Returns:
+        dict: rows, seconds, rows_per_sec, copy format.
+    """
+    return copy_chunk_batches_into_pgvector(conn, [(all_chunks, chunk_embeddings)], table_name,
+                                            batch_size=batch_size, binary=binary, commit=commit)
+
+
+def copy_chunk_batches_into_pgvector(conn, chunk_batches, table_name="pdf_chunks_768",
+                                     batch_size=5000, binary=True, commit=True):
     """
-    
+    Like copy_chunks_into_pgvector, for an iterable of (chunks, embeddings)
+    pairs that is consumed lazily, so only `batch_size` rows are held at a time.
+    """
+    staging = f"{table_name}_staging"
+    col_list = ", ".join(COLUMNS)
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in COLUMNS if c != "id")
     cursor = conn.cursor()
 
-    for i, chunk in enumerate(all_chunks):
-        cursor.execute(
-            f"""
-            INSERT INTO {table_name}
-            (id, content, embedding, report_date, page_num, type, placeholder)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """,
-            (
-                chunk["chunk_id"],
-                chunk["chunk_text"],
-                chunk_embeddings[i],
-                chunk.get("report_date"),
-                chunk.get("page_num"),
-                chunk.get("type"),
-                chunk.get("placeholder"),
-            ),
-        )
-    conn.commit()
+    cursor.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {staging} "
+        f"(LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS;"
+    )
+    encoders = _binary_encoders(_column_types(cursor, staging, COLUMNS)) if binary else None
+    copy_format = "binary" if encoders else "text"
+
+    start = time.perf_counter()
+    total = 0
+    rows = _batch_rows(chunk_batches)
+    while True:
+        # Keep the last occurrence of each id: ON CONFLICT cannot touch a row twice per statement
+        batch = {}
+        for row in rows:
+            batch[row[0]] = row
+            if len(batch) >= batch_size:
+                break
+        if not batch:
+            break
+
+        buf = _encode_binary(batch.values(), encoders) if encoders else _encode_text(batch.values())
+        with telemetry.external("postgres", "copy_upsert", rows=len(batch), format=copy_format):
+            cursor.copy_expert(f"COPY {staging} ({col_list}) FROM STDIN WITH (FORMAT {copy_format})", buf)
+            cursor.execute(
+                f"""
+                INSERT INTO {table_name} ({col_list})
+                SELECT {col_list} FROM {staging}
+                ON CONFLICT (id) DO UPDATE SET {updates};
+                """
+            )
+            cursor.execute(f"TRUNCATE {staging};")
+            if commit:
+                conn.commit()
+        total += len(batch)
+
+    seconds = time.perf_counter() - start
+    rows_per_sec = total / seconds if seconds > 0 else float("inf")
     cursor.close()
-    conn.close()
-    print(f"✅ Inserted {len(all_chunks)} chunks into {table_name}")
\ No newline at end of file
+    print(f"✅ Upserted {total} chunks into {table_name} in {seconds:.2f}s "
+          f"({rows_per_sec:,.0f} rows/s, {copy_format} COPY)")
+    return {"rows": total, "seconds": seconds, "rows_per_sec": rows_per_sec, "format": copy_format}
+
+
+def insert_chunks_into_pgvector(pool, all_chunks, chunk_embeddings, table_name="pdf_chunks_768", batch_size=5000):
+    """
+    Insert chunks + embeddings into Postgres pgvector table.
+    Idempotent: existing ids are updated.
+
+    Args:
+        pool: pipeline.database.PgPool; a connection is checked out for the load.
+    """
+    with pool.connection() as conn:
+        stats = copy_chunks_into_pgvector(conn, all_chunks, chunk_embeddings, table_name, batch_size=batch_size)
+        doc_ids = {chunk["chunk_id"].split("_page")[0] for chunk in all_chunks}
+        sync_documents(conn.cursor(), doc_ids, chunk_table=table_name)
+    invalidate_document_catalog()
+    return stats
+
+
+def delete_document_chunks(cursor, doc_id, table_name="pdf_chunks_768"):
+    """Delete every chunk of one document (chunk ids are '<doc_id>_page<N>_chunk<i>')."""
+    cursor.execute(f"DELETE FROM {table_name} WHERE id LIKE %s;", (doc_id + "\\_page%",))
+    return cursor.rowcount
+
+
+def replace_document_chunks(pool, doc_id, all_chunks, chunk_embeddings, table_name="pdf_chunks_768", batch_size=5000):
+    """
+    Atomically replace one document's rows: delete its old chunks and load the
+    new ones in a single transaction, so readers never see a half-ingested report.
+    """
+    return replace_document_chunk_batches(pool, doc_id, [(all_chunks, chunk_embeddings)], table_name, batch_size)
+
+
+def replace_document_chunk_batches(pool, doc_id, chunk_batches, table_name="pdf_chunks_768", batch_size=5000):
+    """replace_document_chunks for a lazily consumed iterable of (chunks, embeddings) pairs."""
+    with pool.connection() as conn:
+        deleted = delete_document_chunks(conn.cursor(), doc_id, table_name)
+        stats = copy_chunk_batches_into_pgvector(conn, chunk_batches, table_name,
+                                                 batch_size=batch_size, commit=False)
+        # Catalog row commits with the chunks
+        sync_documents(conn.cursor(), [doc_id], chunk_table=table_name)
+    invalidate_document_catalog()
+    stats["deleted"] = deleted
+    print(f"✅ Replaced {doc_id}: {deleted} old rows removed, {stats['rows']} rows loaded")
+    return stats
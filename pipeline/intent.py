@@ -0,0 +1,168 @@
+"""
+Local intent router for chat messages: chit-chat, follow-up on the
+conversation, or a new document query. It runs before any LLM call.
+
+Messages are embedded as hashed, IDF-weighted character n-grams plus words
+(numpy only, a few hundred microseconds on CPU). They are compared by cosine
+similarity to labeled exemplars. An intent scores the mean of its top-k
+exemplar similarities; when the best two intents are closer than
+INTENT_MIN_MARGIN the router abstains and the caller keeps the LLM decision.
+"""
+import re
+import time
+import zlib
+
+import numpy as np
+
+from pipeline.dates import extract_report_dates
+from config import INTENT_MIN_MARGIN
+
+CHITCHAT = "chitchat"
+FOLLOWUP = "followup"
+QUERY = "query"
+INTENTS = (CHITCHAT, FOLLOWUP, QUERY)
+
+INTENT_EXEMPLARS = {
+    CHITCHAT: [
+        "hi", "hello there", "hey, how are you?", "good morning", "thanks!", "thank you so much",
+        "ok cool", "great, thanks for the help", "bye", "see you later", "who are you?",
+        "what can you do?", "are you a bot?", "that's awesome", "lol", "nice", "how's your day going",
+        "tell me a joke", "never mind", "sounds good", "you are helpful", "what's your name",
+        "good night", "cheers", "okay", "hmm interesting",
+    ],
+    FOLLOWUP: [
+        "can you explain that again?", "what did you mean by that?", "summarize your last answer",
+        "make that shorter", "put that in a table", "why is that?", "can you elaborate on the second point?",
+        "what was the first number you mentioned?", "repeat the previous answer",
+        "translate that into simple words", "so which one is higher?", "and what about the other one?",
+        "compare the two you just mentioned", "give me that as bullet points", "what does that imply?",
+        "is that good or bad?", "can you rephrase it", "what did I ask before?",
+        "which source was that from?", "tell me more about it", "what's the takeaway from that",
+        "expand on the last point", "how did you get that figure?", "list those again",
+    ],
+    QUERY: [
+        "what is the DRAM price outlook for Q3 2024?", "show server DRAM shipments in Aug 2022",
+        "TrendForce NAND flash revenue by supplier", "what does Edgewater say about memory demand?",
+        "HBM capacity expansion plans 2025", "compare DRAM contract prices C1Q23 and C2Q23",
+        "what were Samsung's memory market share numbers?", "wafer capacity forecast for next year",
+        "show me the chart on smartphone memory content", "latest report on enterprise SSD pricing",
+        "what are the challenges ahead for memory?", "DDR5 penetration rate in servers",
+        "inventory levels of memory makers in Oct 2023", "AI server demand impact on HBM",
+        "quarterly revenue of the top NAND suppliers", "what is the bit growth forecast for 2024",
+        "mobile DRAM price trend Jan 2024", "find the table on foundry utilization",
+        "Micron capex guidance", "data on PC shipments this quarter", "how did memory prices change in May 24",
+        "what is the supply demand balance for NAND", "get the latest Edgewater report summary",
+        "TrendForce server DRAM Aug2022 key points",
+    ],
+}
+
+HASH_DIM = 1 << 14
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _tokens(text):
+    text = text.lower().strip()
+    padded = f" {' '.join(_WORD.findall(text))} "
+    tokens = [padded[i:i+n] for n in (3, 4, 5) for i in range(len(padded) - n + 1)]
+    tokens.extend("w:" + w for w in padded.split())
+    if extract_report_dates(text):
+        tokens.append("<date>")
+    if text.endswith("?"):
+        tokens.append("<question>")
+    return tokens
+
+
+def hash_counts(text, dim=HASH_DIM):
+    """Sublinear term counts of the message's hashed n-grams (float32, unnormalized)."""
+    idx = np.fromiter((zlib.crc32(t.encode()) % dim for t in _tokens(text)), dtype=np.int64)
+    counts = np.bincount(idx, minlength=dim).astype(np.float32)
+    return np.log1p(counts, out=counts)
+
+
+class IntentRouter:
+    def __init__(self, exemplars=None, top_k=3, min_margin=INTENT_MIN_MARGIN, dim=HASH_DIM):
+        """
+        Args:
+            exemplars (dict): {intent: [example messages]}; defaults to INTENT_EXEMPLARS.
+            top_k (int): Exemplars averaged per intent.
+            min_margin (float): Best-vs-second score gap below which route() returns None.
+        """
+        exemplars = exemplars or INTENT_EXEMPLARS
+        self.top_k = top_k
+        self.min_margin = min_margin
+        self.dim = dim
+        self.intents = list(exemplars)
+        self.labels = np.array([i for i, intent in enumerate(self.intents) for _ in exemplars[intent]])
+        counts = np.stack([hash_counts(t, dim) for intent in self.intents for t in exemplars[intent]])
+        df = np.count_nonzero(counts, axis=0)
+        self.idf = (np.log((1 + len(counts)) / (1 + df)) + 1).astype(np.float32)
+        self.matrix = np.stack([self._normalize(row * self.idf) for row in counts])
+        self.routed = 0
+        self.route_seconds = 0.0
+
+    @staticmethod
+    def _normalize(vec):
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def scores(self, text):
+        """{intent: mean of the top_k exemplar similarities}"""
+        sims = self.matrix @ self._normalize(hash_counts(text, self.dim) * self.idf)
+        out = {}
+        for i, intent in enumerate(self.intents):
+            top = np.sort(sims[self.labels == i])[-self.top_k:]
+            out[intent] = float(top.mean()) if len(top) else 0.0
+        return out
+
+    def classify(self, text):
+        """(best intent, margin over the runner-up), never abstains."""
+        ranked = sorted(self.scores(text).items(), key=lambda kv: kv[1], reverse=True)
+        margin = ranked[0][1] - (ranked[1][1] if len(ranked) > 1 else 0.0)
+        return ranked[0][0], margin
+
+    def route(self, text):
+        """
+        Returns:
+            (intent | None, margin, seconds): intent is None when the router is not confident.
+        """
+        start = time.perf_counter()
+        intent, margin = self.classify(text)
+        seconds = time.perf_counter() - start
+        self.routed += 1
+        self.route_seconds += seconds
+        return (intent if margin >= self.min_margin else None), margin, seconds
+
+    def evaluate(self, samples):
+        """
+        Accuracy on labeled (text, intent) pairs.
+
+        Returns:
+            dict: accuracy (all predictions), coverage / accuracy_routed (confident
+                  predictions only), confusion {true: {predicted: n}}, per-message latency.
+        """
+        correct = routed = routed_correct = 0
+        confusion = {t: {p: 0 for p in self.intents + [None]} for t in self.intents}
+        latencies = []
+        for text, label in samples:
+            start = time.perf_counter()
+            intent, margin = self.classify(text)
+            latencies.append(time.perf_counter() - start)
+            correct += intent == label
+            confident = margin >= self.min_margin
+            routed += confident
+            routed_correct += confident and intent == label
+            confusion[label][intent if confident else None] += 1
+        n = len(samples)
+        lat_ms = np.array(latencies) * 1000
+        return {
+            "samples": n,
+            "accuracy": correct / n if n else 0.0,
+            "coverage": routed / n if n else 0.0,
+            "accuracy_routed": routed_correct / routed if routed else 0.0,
+            "confusion": confusion,
+            "latency_ms": {
+                "p50": float(np.percentile(lat_ms, 50)) if n else 0.0,
+                "p99": float(np.percentile(lat_ms, 99)) if n else 0.0,
+                "mean": float(lat_ms.mean()) if n else 0.0,
+            },
+        }
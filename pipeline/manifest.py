@@ -0,0 +1,114 @@
+"""
+Incremental ingestion state.
+
+`IngestManifest` records, per document, the content hash of the PDF that was
+last fully ingested, so unchanged PDFs are skipped. `CheckpointStore` keeps,
+per PDF content hash, the output of each page's stages (detection + text,
+summaries + chunks, embeddings), so an interrupted run resumes every page from
+its last finished stage instead of redoing detection, summarization and
+embedding.
+"""
+import hashlib
+import os
+import pickle
+import shutil
+import sqlite3
+import time
+
+from config import INGEST_MANIFEST_PATH, INGEST_CHECKPOINT_DIR
+
+
+def file_sha256(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class IngestManifest:
+    def __init__(self, path=INGEST_MANIFEST_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id TEXT PRIMARY KEY,
+                pdf_file TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                status TEXT NOT NULL,
+                chunk_count INTEGER,
+                updated_at REAL NOT NULL
+            );
+            """
+        )
+        self._db.commit()
+
+    def get(self, doc_id):
+        """Return {pdf_file, content_hash, status, chunk_count, updated_at} or None."""
+        row = self._db.execute(
+            "SELECT pdf_file, content_hash, status, chunk_count, updated_at FROM documents WHERE doc_id = ?;",
+            (doc_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("pdf_file", "content_hash", "status", "chunk_count", "updated_at"), row))
+
+    def is_current(self, doc_id, content_hash):
+        """True if this exact PDF content was already ingested completely."""
+        entry = self.get(doc_id)
+        return entry is not None and entry["status"] == "ingested" and entry["content_hash"] == content_hash
+
+    def mark(self, doc_id, pdf_file, content_hash, status, chunk_count=None):
+        self._db.execute(
+            "INSERT OR REPLACE INTO documents (doc_id, pdf_file, content_hash, status, chunk_count, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?);",
+            (doc_id, pdf_file, content_hash, status, chunk_count, time.time())
+        )
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+class CheckpointStore:
+    """Checkpoints on disk under <root>/<content_hash>/<name>.pkl."""
+
+    def __init__(self, root=INGEST_CHECKPOINT_DIR):
+        self.root = root
+
+    def _path(self, content_hash, name):
+        return os.path.join(self.root, content_hash, name + ".pkl")
+
+    def has(self, content_hash, name):
+        return os.path.exists(self._path(content_hash, name))
+
+    def load(self, content_hash, name):
+        with open(self._path(content_hash, name), "rb") as f:
+            return pickle.load(f)
+
+    def save(self, content_hash, name, value):
+        path = self._path(content_hash, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        # Write-then-rename so a crash never leaves a truncated checkpoint behind
+        with open(tmp, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def completed(self, content_hash):
+        """Names of the checkpoints saved for this content hash."""
+        folder = os.path.join(self.root, content_hash)
+        if not os.path.isdir(folder):
+            return set()
+        return {f[:-len(".pkl")] for f in os.listdir(folder) if f.endswith(".pkl")}
+
+    def discard(self, content_hash, *names):
+        for name in names:
+            try:
+                os.remove(self._path(content_hash, name))
+            except FileNotFoundError:
+                pass
+
+    def clear(self, content_hash):
+        shutil.rmtree(os.path.join(self.root, content_hash), ignore_errors=True)
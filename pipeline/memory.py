@@ -0,0 +1,181 @@
+"""
+Bounded conversation memory for the chatbot.
+
+The prompt context is a rolling summary of older turns followed by the most
+recent turns verbatim. Turns that leave the verbatim window wait in a small
+pending list. They are folded into the summary a few at a time with one LLM
+call, so the summary is updated incrementally and never rebuilt from the full
+transcript. The fold runs on a background thread, so the turn that triggers it
+does not wait for the extra LLM call; until it lands, the pending turns stay in
+the context verbatim. The context string is rebuilt only when a turn is added
+or a fold finishes. Its size is capped by MEMORY_TOKEN_BUDGET however long the
+session runs.
+"""
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline.ratelimit import estimate_tokens
+from pipeline import telemetry
+from config import (
+    MEMORY_RECENT_TURNS, MEMORY_TOKEN_BUDGET, MEMORY_SUMMARY_TOKENS, MEMORY_TURN_MAX_TOKENS,
+    MEMORY_FOLD_TURNS, MEMORY_SUMMARY_MODEL,
+)
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a conversation between a user and a document Q&A assistant.
+Update the summary with the new turns below. Keep facts, figures, document names and dates
+the user may ask about again; drop greetings and chit-chat. Use at most {max_words} words.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}
+
+Updated summary:
+"""
+
+
+def _truncate(text, max_tokens):
+    max_chars = max_tokens * 4
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + " …"
+
+
+def _format_turn(user, bot):
+    return f"User: {user}\nBot: {bot}\n"
+
+
+_fold_executor = None
+_fold_executor_lock = threading.Lock()
+
+
+def _get_fold_executor():
+    global _fold_executor
+    if _fold_executor is None:
+        with _fold_executor_lock:
+            if _fold_executor is None:
+                _fold_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-fold")
+    return _fold_executor
+
+
+class ConversationMemory:
+    def __init__(self, client, recent_turns=MEMORY_RECENT_TURNS, token_budget=MEMORY_TOKEN_BUDGET,
+                 summary_tokens=MEMORY_SUMMARY_TOKENS, turn_max_tokens=MEMORY_TURN_MAX_TOKENS,
+                 fold_turns=MEMORY_FOLD_TURNS, model=MEMORY_SUMMARY_MODEL):
+        """
+        Args:
+            client: Gemini client (summary updates).
+            recent_turns (int): Turns kept verbatim.
+            token_budget (int): Cap on the estimated tokens of context().
+            summary_tokens (int): Cap on the rolling summary.
+            turn_max_tokens (int): Each remembered turn is truncated to this.
+            fold_turns (int): Pending turns folded into the summary per LLM call.
+        """
+        self.client = client
+        self.recent_turns = recent_turns
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.turn_max_tokens = turn_max_tokens
+        self.fold_turns = fold_turns
+        self.model = model
+        self.summary = ""
+        self._recent = deque()   # (formatted turn, tokens), oldest first
+        self._pending = []       # turns evicted from _recent, not yet in the summary
+        self._context = ""
+        self._lock = threading.Lock()  # held only to read / swap state, never during the LLM call
+        self._folding = None      # Future of the fold in flight
+        self._generation = 0      # bumped by clear(), so a late fold does not resurrect old turns
+        self.folds = 0
+
+    def _tokens(self):
+        return (estimate_tokens(self.summary) if self.summary else 0) \
+            + sum(t for _, t in self._pending) + sum(t for _, t in self._recent)
+
+    def add(self, user, bot):
+        """Remember one exchange; may start folding older turns into the summary in the background."""
+        half = self.turn_max_tokens // 2
+        turn = _format_turn(_truncate(user, half), _truncate(bot, self.turn_max_tokens - half))
+        with self._lock:
+            self._recent.append((turn, estimate_tokens(turn)))
+            while len(self._recent) > self.recent_turns or \
+                    (len(self._recent) > 1 and self._tokens() > self.token_budget):
+                self._pending.append(self._recent.popleft())
+            self._maybe_fold()
+            self._context = self._build_context()
+
+    def _maybe_fold(self):
+        """Start a fold of the pending turns if one is due and none is running (caller holds _lock)."""
+        if self._folding or not self._pending:
+            return
+        if len(self._pending) >= self.fold_turns or self._tokens() > self.token_budget:
+            batch = list(self._pending)
+            self._folding = _get_fold_executor().submit(self._fold, batch, self.summary, self._generation)
+
+    def _fold(self, batch, summary, generation):
+        turns = "".join(turn for turn, _ in batch)
+        max_words = int(self.summary_tokens * 0.75)
+        prompt = SUMMARY_PROMPT.format(max_words=max_words, summary=summary or "(empty)", turns=turns)
+        try:
+            with telemetry.external("gemini", "summarize_memory", tokens_in=estimate_tokens(prompt)) as call:
+                resp = self.client.models.generate_content(model=self.model, contents=prompt)
+                new_summary = resp.text.strip()
+                call.set(tokens_out=estimate_tokens(new_summary))
+            if not new_summary:
+                raise ValueError("Gemini returned an empty summary")
+        except Exception as e:
+            # Keep the newest text rather than losing the turns
+            logger.warning("⚠️ Memory summary update failed, keeping the latest turns verbatim: %s", e)
+            new_summary = (summary + "\n" + turns).strip()
+            new_summary = new_summary[-self.summary_tokens * 4:]
+
+        with self._lock:
+            self._folding = None
+            if generation != self._generation:
+                return
+            self.summary = _truncate(new_summary, self.summary_tokens)
+            # Turns evicted while the fold ran stay pending for the next one
+            self._pending = self._pending[len(batch):]
+            self.folds += 1
+            self._maybe_fold()
+            self._context = self._build_context()
+
+    def _build_context(self):
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of earlier conversation:\n{self.summary}\n")
+        # While a fold is in flight, the oldest pending turns that no longer fit are left
+        # out of the prompt (they are still on their way into the summary)
+        pending = list(self._pending)
+        excess = self._tokens() - self.token_budget
+        while pending and excess > 0:
+            excess -= pending.pop(0)[1]
+        turns = [turn for turn, _ in pending] + [turn for turn, _ in self._recent]
+        if turns:
+            parts.append("Recent turns:\n" + "".join(turns))
+        return "\n".join(parts)
+
+    def context(self):
+        """The prebuilt history text for the next prompt."""
+        return self._context
+
+    def clear(self):
+        with self._lock:
+            self.summary, self._context = "", ""
+            self._recent.clear()
+            self._pending = []
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "recent_turns": len(self._recent),
+                "pending_turns": len(self._pending),
+                "folding": self._folding is not None,
+                "summary_tokens": estimate_tokens(self.summary) if self.summary else 0,
+                "context_tokens": estimate_tokens(self._context) if self._context else 0,
+                "folds": self.folds,
+            }
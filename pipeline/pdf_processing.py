@@ -3,10 +3,17 @@ import re
 import fitz
 import numpy as np
 import cv2
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 
-from config import model_detect, model_classify
+from config import (
+    get_model_detect, get_model_classify, RENDER_WORKERS, DETECT_BATCH_SIZE, CLASSIFY_BATCH_SIZE,
+    DETECT_IMGSZ, CLASSIFY_IMGSZ, CLASSIFY_LETTERBOX,
+)
+from pipeline.rendering import render_pages, batched
+from pipeline.inference import BatchedDetector, BatchedClassifier
 
 def iou(box1, box2):
     x1, y1, x2, y2 = box1
@@ -33,38 +40,40 @@ def filter_duplicates(crops, iou_thresh=0.7):
             keep.append((crop_img, conf, box))
     return keep
 
+def _page_text_with_placeholders(page, page_num, placeholders, min_words=5):
+    page_lines=[f"--- Page {page_num} ---"]
+    used_placeholders=set()
+    words=page.get_text("words")
+    lines={}
+    for w in words:
+        x0,y0,x1,y1,word,block_no,line_no,_=w
+        key=(block_no,line_no)
+        if key not in lines: lines[key]={"y0":y0,"y1":y1,"words":[]}
+        lines[key]["words"].append(word)
+    text_blocks=[]
+    for _,data in lines.items():
+        txt=" ".join(data["words"]).strip()
+        if txt and len(txt.split())>=min_words and not re.match(r'^[\d\.\%\$\s,-]+$', txt):
+            text_blocks.append({"y0":data["y0"],"y1":data["y1"],"text":txt})
+    text_blocks=sorted(text_blocks,key=lambda x:x["y0"])
+    for t in text_blocks:
+        for i, ph in enumerate(placeholders):
+            if i in used_placeholders: continue
+            px0, py0, px1, py1=ph["bbox"]
+            if not (t["y1"]<py0 or t["y0"]>py1):
+                page_lines.append(ph["placeholder"])
+                used_placeholders.add(i)
+        page_lines.append(t["text"])
+    for i, ph in enumerate(placeholders):
+        if i not in used_placeholders:
+            page_lines.append(ph["placeholder"])
+    return "\n".join(page_lines)
+
 def extract_clean_text_with_inline_placeholders(pdf_path, page_placeholders, min_words=5):
     doc = fitz.open(pdf_path)
     all_pages=[]
     for page_num, page in enumerate(doc, start=1):
-        page_lines=[f"--- Page {page_num} ---"]
-        placeholders=page_placeholders.get(page_num,[])
-        used_placeholders=set()
-        words=page.get_text("words")
-        lines={}
-        for w in words:
-            x0,y0,x1,y1,word,block_no,line_no,_=w
-            key=(block_no,line_no)
-            if key not in lines: lines[key]={"y0":y0,"y1":y1,"words":[]}
-            lines[key]["words"].append(word)
-        text_blocks=[]
-        for _,data in lines.items():
-            txt=" ".join(data["words"]).strip()
-            if txt and len(txt.split())>=min_words and not re.match(r'^[\d\.\%\$\s,-]+$', txt):
-                text_blocks.append({"y0":data["y0"],"y1":data["y1"],"text":txt})
-        text_blocks=sorted(text_blocks,key=lambda x:x["y0"])
-        for t in text_blocks:
-            for i, ph in enumerate(placeholders):
-                if i in used_placeholders: continue
-                px0, py0, px1, py1=ph["bbox"]
-                if not (t["y1"]<py0 or t["y0"]>py1):
-                    page_lines.append(ph["placeholder"])
-                    used_placeholders.add(i)
-            page_lines.append(t["text"])
-        for i, ph in enumerate(placeholders):
-            if i not in used_placeholders:
-                page_lines.append(ph["placeholder"])
-        all_pages.append("\n".join(page_lines))
+        all_pages.append(_page_text_with_placeholders(page, page_num, page_placeholders.get(page_num,[]), min_words))
     return "\n\n".join(all_pages)
 
 def extract_report_date_from_filename(filename: str):
@@ -86,92 +95,221 @@ def extract_report_date_from_filename(filename: str):
         return f"{year_str}-{month_num:02d}"
     return None
 
-def process_pdfs(pdf_input_folder):
+# --------------------------
+# Stage 2: layout detection (batches of pages)
+# --------------------------
+FIGURE_CLASS, FIGURE_CAPTION_CLASS, TABLE_CLASS, TABLE_CAPTION_CLASS = 3, 4, 5, 6
+CONF_THRESHOLD = 0
+
+
+_layout_detector = None
+_chart_classifier = None
+
+
+def get_layout_detector():
+    """Batched wrapper around the layout model (pages, fixed imgsz, letterboxed); loads it on first use."""
+    global _layout_detector
+    if _layout_detector is None:
+        _layout_detector = BatchedDetector(get_model_detect(), DETECT_IMGSZ, DETECT_BATCH_SIZE)
+    return _layout_detector
+
+
+def get_chart_classifier():
+    """Batched wrapper around the chart classifier (crops); loads it on first use."""
+    global _chart_classifier
+    if _chart_classifier is None:
+        _chart_classifier = BatchedClassifier(get_model_classify(), CLASSIFY_IMGSZ, CLASSIFY_BATCH_SIZE,
+                                              use_letterbox=CLASSIFY_LETTERBOX)
+    return _chart_classifier
+
+
+def _split_boxes(detections):
+    figures, fig_caps, tables, tab_caps = [], [], [], []
+    for xyxy, conf, cls in detections:
+        if conf >= CONF_THRESHOLD:
+            if cls == FIGURE_CLASS: figures.append((xyxy, conf))
+            elif cls == FIGURE_CAPTION_CLASS: fig_caps.append((xyxy, conf))
+            elif cls == TABLE_CLASS: tables.append((xyxy, conf))
+            elif cls == TABLE_CAPTION_CLASS: tab_caps.append((xyxy, conf))
+    return figures, fig_caps, tables, tab_caps
+
+
+def _chart_candidates(img, figures, fig_caps):
+    candidates = []
+    for fig_box, fconf in figures:
+        merged_box = fig_box.copy()
+        for cap_box, _ in fig_caps:
+            if abs(cap_box[1]-fig_box[3]) < 150 or abs(fig_box[1]-cap_box[3]) < 150:
+                merged_box = [min(merged_box[0], cap_box[0]), min(merged_box[1], cap_box[1]),
+                              max(merged_box[2], cap_box[2]), max(merged_box[3], cap_box[3])]
+        x1, y1, x2, y2 = merged_box; w = x2-x1; pad_w = int(0.05*w); x1 = max(0, x1-pad_w); x2 = min(img.shape[1], x2+pad_w)
+        candidates.append((img[y1:y2, x1:x2], fconf, merged_box))
+    return candidates
+
+
+def _table_crops(img, tables, tab_caps):
+    table_crops = []
+    for tab_box, tconf in tables:
+        merged_box = tab_box.copy()
+        for cap_box, _ in tab_caps:
+            if abs(cap_box[1]-tab_box[3]) < 150 or abs(tab_box[1]-cap_box[3]) < 150:
+                merged_box = [min(merged_box[0], cap_box[0]), min(merged_box[1], cap_box[1]),
+                              max(merged_box[2], cap_box[2]), max(merged_box[3], cap_box[3])]
+        x1, y1, x2, y2 = merged_box; w = x2-x1; h = y2-y1; pad_w = int(0.05*w); pad_h = int(0.05*h)
+        x1 = max(0, x1-pad_w); x2 = min(img.shape[1], x2+pad_w); y1 = max(0, y1-pad_h)
+        table_crops.append((img[y1:y2, x1:x2], tconf, [x1, y1, x2, y2]))
+    return filter_duplicates(table_crops)
+
+
+# --------------------------
+# Stage 3: chart classification (batches of crops)
+# --------------------------
+def iter_page_detections(pdf_path, executor=None, detector=None, classifier=None, pages=None):
+    """
+    Staged detection pipeline for one PDF: render (worker processes) ->
+    detect (batches of pages) -> classify (batches of chart crops).
+
+    Args:
+        pages (Iterable[int] | None): 0-based page indices to process (default: all).
+
+    Yields, in page order:
+        (page_idx, chart_crops, table_crops) where each crop list holds
+        deduplicated (crop, conf, box) tuples.
+    """
+    detector = detector or get_layout_detector()
+    classifier = classifier or get_chart_classifier()
+    page_batch_size = detector.batch_size
+    rendered = render_pages(pdf_path, executor, prefetch=2 * page_batch_size, pages=pages)
+    for page_batch in batched(rendered, page_batch_size):
+        results = detector.predict([img for _, img in page_batch])
+
+        per_page = []
+        for (page_idx, img), result in zip(page_batch, results):
+            figures, fig_caps, tables, tab_caps = _split_boxes(result)
+            per_page.append((page_idx, _chart_candidates(img, figures, fig_caps),
+                             _table_crops(img, tables, tab_caps)))
+
+        # One classifier call per batch of crops across all pages in this batch
+        all_candidates = [c for _, candidates, _ in per_page for c in candidates]
+        predictions = iter(classifier.predict([crop for crop, _, _ in all_candidates]))
+
+        for page_idx, candidates, table_crops in per_page:
+            chart_crops = []
+            for candidate in candidates:
+                pred_cls, pred_conf = next(predictions)
+                if pred_cls == 0 and pred_conf >= 0.4:
+                    chart_crops.append(candidate)
+            yield page_idx, filter_duplicates(chart_crops), table_crops
+
+
+def document_id(pdf_file):
+    """Stable document id used in placeholders and chunk ids: file name without non-alphanumerics."""
+    return re.sub(r'[^A-Za-z0-9]+','',os.path.splitext(pdf_file)[0])
+
+
+def rendering_executor(workers=RENDER_WORKERS):
+    """Process pool for page rendering, or None to render inline."""
+    if not workers or workers <= 1:
+        return None
+    # spawn, not fork: no copied threads or loaded models. Each worker re-imports the parent's
+    # __main__ (as __mp_main__), so entry scripts must keep side effects under main(); the imports
+    # themselves stay light because config.py loads no models at import time
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def page_count(pdf_path):
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def _page_figure_nodes(clean_pdf_name, page_num, chart_crops, table_crops):
+    """Placeholders ({"placeholder", "bbox"}) and table/chart nodes (with crops) for one page."""
+    placeholders, table_chart_nodes = [], []
+    # Charts
+    for idx,(crop,_,box) in enumerate(chart_crops):
+        placeholder=f"[{clean_pdf_name}_Chart{idx+1}_Page{page_num}]"
+        placeholders.append({"placeholder":placeholder,"bbox":[int(c) for c in box]})
+        table_chart_nodes.append({"img":crop,"placeholder":placeholder,"node-type":"chart","page_num":page_num})
+
+    # Tables
+    for idx,(crop,_,box) in enumerate(table_crops):
+        placeholder=f"[{clean_pdf_name}_Table{idx+1}_Page{page_num}]"
+        placeholders.append({"placeholder":placeholder,"bbox":[int(c) for c in box]})
+        table_chart_nodes.append({"img":crop,"placeholder":placeholder,"node-type":"table","page_num":page_num})
+    return placeholders, table_chart_nodes
+
+
+def _page_text_node(clean_pdf_name, report_date, page_num, page_text):
+    """Text node for one page, listing the chart/table placeholders that appear on it."""
+    content="\n".join([line for line in page_text.split("\n")[1:] if line.strip()])
+    placeholders=re.findall(r"\[.*?_Table\d+_Page\d+\]|\[.*?_Chart\d+_Page\d+\]", content)
+    content=re.sub(r"^\[.*?_Table\d+_Page\d+\]$|^\[.*?_Chart\d+_Page\d+\]$","",content,flags=re.MULTILINE)
+    content="\n".join([l for l in content.splitlines() if l.strip()])
+    return {"id":f"{clean_pdf_name}_page{page_num}","report_date":report_date,"page_num":page_num,"node-type":"page_text","placeholder":placeholders,"text":content}
+
+
+def iter_page_nodes(pdf_path, clean_pdf_name, report_date, executor=None, detector=None, classifier=None, pages=None):
+    """
+    Stream one PDF page by page: detection, then text with inline placeholders.
+
+    Only the pages currently in the detection batch are held in memory.
+
+    Yields, in page order:
+        (page_num, placeholders, text_node, table_chart_nodes) where placeholders
+        are [{"placeholder", "bbox"}] and table_chart_nodes carry their "img"
+        crops for summarization.
+    """
+    with fitz.open(pdf_path) as doc:
+        for page_idx, chart_crops, table_crops in iter_page_detections(pdf_path, executor, detector, classifier, pages):
+            page_num = page_idx + 1
+            placeholders, table_chart_nodes = _page_figure_nodes(clean_pdf_name, page_num, chart_crops, table_crops)
+            page_text = _page_text_with_placeholders(doc[page_idx], page_num, placeholders)
+            yield (page_num, placeholders, _page_text_node(clean_pdf_name, report_date, page_num, page_text),
+                   table_chart_nodes)
+
+
+def list_pdfs(pdf_input_folder):
+    """PDF file names in the folder, sorted."""
+    return [f for f in sorted(os.listdir(pdf_input_folder)) if f.lower().endswith(".pdf")]
+
+
+def iter_pdf_pages(pdf_input_folder, workers=RENDER_WORKERS, detector=None, classifier=None):
+    """
+    Stream every PDF in the folder page by page.
+
+    Yields:
+        (clean_pdf_name, page_num, placeholders, text_node, table_chart_nodes), see iter_page_nodes.
+    """
+    executor = rendering_executor(workers)
+    try:
+        for pdf_file in list_pdfs(pdf_input_folder):
+            pdf_path=os.path.join(pdf_input_folder,pdf_file)
+            clean_pdf_name=document_id(pdf_file)
+            report_date = extract_report_date_from_filename(pdf_file)
+            for page in iter_page_nodes(pdf_path, clean_pdf_name, report_date, executor, detector, classifier):
+                yield (clean_pdf_name,) + page
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def process_pdfs(pdf_input_folder, workers=RENDER_WORKERS, detector=None, classifier=None):
+    """
+    Detect charts/tables and extract text with inline placeholders for every PDF.
+
+    Materializes everything (crops included); prefer iter_pdf_pages for large folders.
+
+    Args:
+        workers (int): Page-rendering worker processes (<= 1 renders inline).
+        detector (BatchedDetector): Defaults to get_layout_detector() (pages per batch from config).
+        classifier (BatchedClassifier): Defaults to get_chart_classifier() (crops per batch from config).
+    """
     all_placeholders, all_text_json, all_table_chart_nodes = {}, [], []
-    FIGURE_CLASS, FIGURE_CAPTION_CLASS, TABLE_CLASS, TABLE_CAPTION_CLASS = 3,4,5,6
-    CONF_THRESHOLD=0
-
-    for pdf_file in os.listdir(pdf_input_folder):
-        if not pdf_file.lower().endswith(".pdf"): continue
-        pdf_path=os.path.join(pdf_input_folder,pdf_file)
-        pdf_name=os.path.splitext(pdf_file)[0]
-        clean_pdf_name=re.sub(r'[^A-Za-z0-9]+','',pdf_name)
-        report_date = extract_report_date_from_filename(pdf_file)
-        doc=fitz.open(pdf_path)
-        page_placeholders={}
-
-        # --- Extract charts & tables ---
-        for page_idx, page in enumerate(doc):
-            pix=page.get_pixmap(matrix=fitz.Matrix(2,2))
-            img=np.frombuffer(pix.samples,dtype=np.uint8).reshape(pix.height,pix.width,pix.n)
-            img=cv2.cvtColor(img, cv2.COLOR_RGBA2BGR) if pix.n==4 else cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-            results=model_detect(img, save=False)
-            for r in results:
-                boxes=r.boxes
-                figures, fig_caps, tables, tab_caps=[],[],[],[]
-                for box in boxes:
-                    conf=float(box.conf[0]); cls=int(box.cls[0])
-                    xyxy=box.xyxy[0].cpu().numpy().astype(int)
-                    if conf>=CONF_THRESHOLD:
-                        if cls==FIGURE_CLASS: figures.append((xyxy, conf))
-                        elif cls==FIGURE_CAPTION_CLASS: fig_caps.append((xyxy, conf))
-                        elif cls==TABLE_CLASS: tables.append((xyxy, conf))
-                        elif cls==TABLE_CAPTION_CLASS: tab_caps.append((xyxy, conf))
-
-                # Charts
-                chart_crops=[]
-                for fig_box,fconf in figures:
-                    merged_box=fig_box.copy()
-                    for cap_box,_ in fig_caps:
-                        if abs(cap_box[1]-fig_box[3])<150 or abs(fig_box[1]-cap_box[3])<150:
-                            merged_box=[min(merged_box[0],cap_box[0]),min(merged_box[1],cap_box[1]),
-                                        max(merged_box[2],cap_box[2]),max(merged_box[3],cap_box[3])]
-                    x1,y1,x2,y2=merged_box; w=x2-x1; pad_w=int(0.05*w); x1=max(0,x1-pad_w); x2=min(img.shape[1],x2+pad_w)
-                    crop=img[y1:y2, x1:x2]
-                    class_result=model_classify(crop, save=False)[0]
-                    pred_cls=int(class_result.probs.top1); pred_conf=float(class_result.probs.top1conf)
-                    if pred_cls==0 and pred_conf>=0.4: chart_crops.append((crop,fconf,merged_box))
-                chart_crops=filter_duplicates(chart_crops)
-                for idx,(crop,_,box) in enumerate(chart_crops):
-                    placeholder=f"[{clean_pdf_name}_Chart{idx+1}_Page{page_idx+1}]"
-                    page_placeholders.setdefault(page_idx+1,[]).append({"placeholder":placeholder,"bbox":[int(c) for c in box]})
-                    node={"img":crop,"placeholder":placeholder,"node-type":"chart","page_num":page_idx+1}
-                    all_table_chart_nodes.append(node)
-
-                # Tables
-                table_crops=[]
-                for tab_box,tconf in tables:
-                    merged_box=tab_box.copy()
-                    for cap_box,_ in tab_caps:
-                        if abs(cap_box[1]-tab_box[3])<150 or abs(tab_box[1]-cap_box[3])<150:
-                            merged_box=[min(merged_box[0],cap_box[0]),min(merged_box[1],cap_box[1]),
-                                        max(merged_box[2],cap_box[2]),max(merged_box[3],cap_box[3])]
-                    x1,y1,x2,y2=merged_box; w=x2-x1; h=y2-y1; pad_w=int(0.05*w); pad_h=int(0.05*h)
-                    x1=max(0,x1-pad_w); x2=min(img.shape[1],x2+pad_w); y1=max(0,y1-pad_h)
-                    crop=img[y1:y2, x1:x2]
-                    table_crops.append((crop,tconf,[x1,y1,x2,y2]))
-                table_crops=filter_duplicates(table_crops)
-                for idx,(crop,_,box) in enumerate(table_crops):
-                    placeholder=f"[{clean_pdf_name}_Table{idx+1}_Page{page_idx+1}]"
-                    page_placeholders.setdefault(page_idx+1,[]).append({"placeholder":placeholder,"bbox":[int(c) for c in box]})
-                    node={"img":crop,"placeholder":placeholder,"node-type":"table","page_num":page_idx+1}
-                    all_table_chart_nodes.append(node)
-
-        all_placeholders[clean_pdf_name]=page_placeholders
-
-        # Extract text
-        pdf_text_with_placeholders=extract_clean_text_with_inline_placeholders(pdf_path,page_placeholders)
-        pages_split=pdf_text_with_placeholders.split("--- Page ")
-        for page_content in pages_split:
-            if not page_content.strip(): continue
-            header,*body_lines=page_content.split("\n")
-            try: page_num=int(header.strip("- ").strip())
-            except: page_num=None
-            content="\n".join([line for line in body_lines if line.strip()])
-            placeholders=re.findall(r"\[.*?_Table\d+_Page\d+\]|\[.*?_Chart\d+_Page\d+\]", content)
-            content=re.sub(r"^\[.*?_Table\d+_Page\d+\]$|^\[.*?_Chart\d+_Page\d+\]$","",content,flags=re.MULTILINE)
-            content="\n".join([l for l in content.splitlines() if l.strip()])
-            node={"id":f"{clean_pdf_name}_page{page_num}","report_date":report_date,"page_num":page_num,"node-type":"page_text","placeholder":placeholders,"text":content}
-            all_text_json.append(node)
-
-    return all_placeholders, all_text_json, all_table_chart_nodes
\ No newline at end of file
+    for clean_pdf_name, page_num, placeholders, text_node, table_chart_nodes in iter_pdf_pages(
+            pdf_input_folder, workers, detector, classifier):
+        page_placeholders = all_placeholders.setdefault(clean_pdf_name, {})
+        if placeholders:
+            page_placeholders[page_num] = placeholders
+        all_table_chart_nodes.extend(table_chart_nodes)
+        all_text_json.append(text_node)
+    return all_placeholders, all_text_json, all_table_chart_nodes
@@ -0,0 +1,84 @@
+"""
+Client-side rate limiting and retry for Gemini API calls.
+"""
+import random
+import threading
+import time
+
+# HTTP status codes worth retrying (rate limit, timeouts, transient server errors)
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter enforcing a requests-per-minute and a tokens-per-minute
+    budget. Thread-safe; acquire() blocks until both budgets allow the call.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self._requests = float(requests_per_minute or 0)
+        self._tokens = float(tokens_per_minute or 0)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    def acquire(self, tokens=0):
+        """Block until one request carrying `tokens` tokens fits in both budgets."""
+        if self.tpm:
+            tokens = min(tokens, self.tpm)  # a single oversized call must still be able to run
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                wait = 0.0
+                if self.rpm and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60.0 / self.rpm)
+                if self.tpm and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60.0 / self.tpm)
+                if wait == 0.0:
+                    if self.rpm:
+                        self._requests -= 1
+                    if self.tpm:
+                        self._tokens -= tokens
+                    return
+            time.sleep(wait)
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) used for budgeting."""
+    return len(text) // 4 + 1
+
+
+def is_retryable(exc):
+    """True for rate-limit / transient errors from google-genai, httpx or the network."""
+    code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    name = type(exc).__name__
+    return "Timeout" in name or "Connect" in name or "RemoteProtocol" in name
+
+
+def call_with_retry(func, *args, max_retries=5, base_delay=1.0, max_delay=60.0, **kwargs):
+    """
+    Call func(*args, **kwargs), retrying retryable errors with exponential
+    backoff and full jitter. Non-retryable errors are raised immediately.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            print(f"⚠️ {type(e).__name__} ({getattr(e, 'code', '')}), retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+            time.sleep(delay)
@@ -0,0 +1,68 @@
+"""
+Page rendering stage of the PDF pipeline.
+
+Kept free of model / config imports so spawned worker processes start fast.
+"""
+from collections import deque
+from itertools import islice
+
+import cv2
+import fitz
+import numpy as np
+
+RENDER_ZOOM = 2
+
+
+# PyMuPDF documents are not thread-safe, so each worker process opens its own copy
+_worker_docs = {}
+
+
+def _render_page(pdf_path, page_idx, zoom):
+    doc = _worker_docs.get(pdf_path)
+    if doc is None:
+        for old in _worker_docs.values():
+            old.close()
+        _worker_docs.clear()
+        doc = _worker_docs[pdf_path] = fitz.open(pdf_path)
+    pix = doc[page_idx].get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    return cv2.cvtColor(img, cv2.COLOR_RGBA2BGR) if pix.n == 4 else cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+
+
+def render_pages(pdf_path, executor=None, zoom=RENDER_ZOOM, prefetch=None, pages=None):
+    """
+    Yield (page_idx, BGR image) in page order, for every page or only `pages`.
+
+    Pages are rendered on `executor` (a ProcessPoolExecutor) with at most
+    `prefetch` pages in flight, so rendering overlaps with detection without
+    holding every page of a large report in memory. Without an executor pages
+    are rendered inline.
+    """
+    if pages is None:
+        with fitz.open(pdf_path) as doc:
+            pages = range(doc.page_count)
+    if executor is None:
+        for page_idx in pages:
+            yield page_idx, _render_page(pdf_path, page_idx, zoom)
+        return
+
+    prefetch = prefetch or 8
+    pending = deque()
+    for page_idx in pages:
+        pending.append((page_idx, executor.submit(_render_page, pdf_path, page_idx, zoom)))
+        if len(pending) >= prefetch:
+            idx, future = pending.popleft()
+            yield idx, future.result()
+    while pending:
+        idx, future = pending.popleft()
+        yield idx, future.result()
+
+
+def batched(iterable, n):
+    """Yield lists of up to n items."""
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, n))
+        if not batch:
+            return
+        yield batch
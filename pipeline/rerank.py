@@ -0,0 +1,125 @@
+"""
+Cross-encoder reranking between retrieval and prompt building.
+
+Retrieval returns the top RERANK_CANDIDATES chunks with no similarity cutoff.
+A small local cross-encoder scores each (query, chunk) pair on CPU, in batches
+of RERANK_BATCH_SIZE, and the best RERANK_TOP_K are kept. This replaces the
+fixed cosine threshold, which returned either nothing or far too much. Scores
+are cached by (model, query, chunk), so a repeated query does not run the
+model again.
+
+sentence-transformers is optional: without it (or with RERANK_ENABLED off)
+get_reranker() returns None and retrieval works as before.
+"""
+import logging
+import threading
+import time
+
+from pipeline.cache import get_rerank_cache
+from pipeline import telemetry
+from config import RERANK_ENABLED, RERANK_MODEL, RERANK_TOP_K, RERANK_BATCH_SIZE, get_model_rerank
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    def __init__(self, model, model_name=RERANK_MODEL, batch_size=RERANK_BATCH_SIZE, cache=None):
+        """
+        Args:
+            model: Object with predict(list[(query, text)]) -> scores (sentence_transformers.CrossEncoder).
+            model_name (str): Part of the cache key.
+            batch_size (int): Pairs per forward pass.
+            cache (RerankScoreCache | False | None): None = process-wide cache, False = no cache.
+        """
+        self.model = model
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache = get_rerank_cache() if cache is None else (cache or None)
+        self._lock = threading.Lock()  # one forward pass at a time; also guards the counters
+        self.pairs = 0
+        self.cached_pairs = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    def score(self, query_text, chunks):
+        """
+        Cross-encoder score per chunk ({"id", "content"} dicts).
+
+        Returns:
+            tuple[list[float], list[float], int]: scores in input order, per-batch
+            model time in ms, and how many pairs were scored (not cached) by this call.
+        """
+        keys = [self.cache.key(self.model_name, query_text, c["id"], c["content"]) if self.cache else None
+                for c in chunks]
+        cached = self.cache.lookup(set(keys)) if self.cache else {}
+        scores = [cached.get(k) for k in keys]
+        missing = [i for i, s in enumerate(scores) if s is None]
+
+        batch_ms = []
+        with self._lock:
+            for start in range(0, len(missing), self.batch_size):
+                idx = missing[start:start+self.batch_size]
+                t0 = time.perf_counter()
+                with telemetry.external("cross_encoder", "predict", pairs=len(idx)):
+                    batch_scores = self.model.predict([(query_text, chunks[i]["content"]) for i in idx],
+                                                      batch_size=len(idx), show_progress_bar=False)
+                seconds = time.perf_counter() - t0
+                batch_ms.append(round(seconds * 1000, 1))
+                self.seconds += seconds
+                self.batches += 1
+                for i, s in zip(idx, batch_scores):
+                    scores[i] = float(s)
+            self.pairs += len(chunks)
+            self.cached_pairs += len(chunks) - len(missing)
+        if self.cache and missing:
+            self.cache.store_many({keys[i]: scores[i] for i in missing})
+        return scores, batch_ms, len(missing)
+
+    def rerank(self, query_text, chunks, top_k=RERANK_TOP_K):
+        """
+        The top_k chunks by cross-encoder score, best first; each returned dict
+        is a copy with "rerank_score" added.
+        """
+        if not chunks:
+            return []
+        start = time.perf_counter()
+        scores, batch_ms, scored = self.score(query_text, chunks)
+        ranked = sorted((dict(c, rerank_score=s) for c, s in zip(chunks, scores)),
+                        key=lambda c: c["rerank_score"], reverse=True)
+        telemetry.annotate(candidates=len(chunks), scored=scored, batch_ms=batch_ms)
+        logger.info("   ↳ Reranked %d candidates -> top %d in %.0fms (%d scored, %d cached; per-batch ms: %s)",
+                    len(chunks), min(top_k, len(chunks)), (time.perf_counter() - start) * 1000,
+                    scored, len(chunks) - scored, batch_ms)
+        return ranked[:top_k]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pairs": self.pairs,
+                "cached_pairs": self.cached_pairs,
+                "batches": self.batches,
+                "seconds": round(self.seconds, 3),
+                "ms_per_batch": round(self.seconds * 1000 / self.batches, 1) if self.batches else 0.0,
+            }
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+_reranker_unavailable = False
+
+
+def get_reranker():
+    """Process-wide reranker, or None when disabled or sentence-transformers is missing."""
+    global _reranker, _reranker_unavailable
+    if not RERANK_ENABLED or _reranker_unavailable:
+        return None
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None and not _reranker_unavailable:
+                try:
+                    _reranker = CrossEncoderReranker(get_model_rerank())
+                except ImportError:
+                    _reranker_unavailable = True
+                    logger.warning("⚠️ RERANK_ENABLED but sentence-transformers is not installed; skipping rerank")
+                    return None
+    return _reranker
@@ -0,0 +1,251 @@
+"""
+Server-side similarity retrieval over the pgvector chunk table.
+
+All filtering (report dates, LATEST, document ids), ranking, the top-k bound
+and the similarity cutoff run inside Postgres. The ANN candidates are selected
+without touching `content`; the (large) text column is only fetched for the
+rows that survive the cutoff. The distance operator follows the configured
+metric so ORDER BY matches the ANN index operator class. Filters are applied to
+the index's candidates: pgvector >= 0.8 scans iteratively until top_k rows pass,
+and on older versions a filtered query that comes back short is re-run as an
+exact scan, so a selective date / document filter never empties the result.
+
+Hybrid mode runs a full-text candidate query (generated tsvector column + GIN
+index) next to the ANN one in the same statement. It fuses both rankings with
+weighted reciprocal rank fusion, which finds exact part / vendor names and
+quarter codes that embeddings rank poorly.
+"""
+import logging
+import re
+
+from config import (
+    VECTOR_METRIC, VECTOR_INDEX_METHOD, HNSW_EF_SEARCH, IVFFLAT_PROBES, RETRIEVAL_MODE, TEXT_SEARCH_CONFIG,
+    VECTOR_ITERATIVE_SCAN, HNSW_MAX_SCAN_TUPLES, IVFFLAT_MAX_PROBES, RRF_K, HYBRID_VECTOR_WEIGHT, HYBRID_LEXICAL_WEIGHT, HYBRID_CANDIDATE_FACTOR,
+)
+from pipeline.schema import (
+    distance_operator, similarity_sql, max_distance_for, apply_search_params, exact_search, has_text_search,
+    TEXT_SEARCH_COLUMN,
+)
+from pipeline.catalog import DOC_ID_SQL
+from pipeline import telemetry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TABLE = "pdf_chunks_768"
+
+# Terms worth an exact match: codes mixing letters and digits (C3Q22, HBM3e),
+# acronyms (NAND, SSD) and capitalized names (Samsung, TrendForce)
+_KEY_TERM = re.compile(r"\b(?:(?=[A-Za-z0-9]*[A-Za-z])[A-Za-z0-9]*\d[A-Za-z0-9]*|[A-Z][A-Za-z0-9]+)\b")
+
+
+def lexical_query(query_text):
+    """
+    Text for the full-text side of hybrid retrieval: the query's key terms, or
+    the whole query if it has none. ts_rank_cd has no IDF, so an OR over common
+    words would outrank the one rare term the user typed.
+    """
+    terms = _KEY_TERM.findall(query_text)
+    return " ".join(terms) if terms else query_text
+
+
+def format_vector(query_embedding):
+    """Render an embedding as a pgvector text literal: '[0.1,0.2,...]'."""
+    return "[" + ",".join(map(str, query_embedding)) + "]"
+
+
+def _filters(report_dates, matched_docs, table_name):
+    """WHERE conditions (and their params) for the date / document filters."""
+    where, params = [], {}
+    explicit_dates = [d for d in report_dates if d != "LATEST"]
+    if "LATEST" in report_dates:
+        where.append(f"report_date = (SELECT max(report_date) FROM {table_name})")
+    elif explicit_dates:
+        where.append("report_date = ANY(%(report_dates)s)")
+        params["report_dates"] = explicit_dates
+
+    if matched_docs:
+        where.append(f"{DOC_ID_SQL} = ANY(%(doc_ids)s)")
+        params["doc_ids"] = list(matched_docs)
+    return where, params
+
+
+def build_retrieval_query(report_dates, matched_docs, top_k=50, min_similarity=None,
+                          table_name=DEFAULT_TABLE, metric=VECTOR_METRIC):
+    """
+    Build one parameterized similarity query.
+
+    Args:
+        report_dates (list[str]): Explicit 'YYYY-MM' / 'YYYY-Qn' dates and/or "LATEST".
+        matched_docs (list[str]): Document ids to restrict the search to (empty = no restriction).
+        top_k (int): Maximum number of candidates taken from the ANN ordering.
+        min_similarity (float | None): Rows below this similarity are dropped server-side.
+        table_name (str): pgvector table name.
+        metric (str): "cosine", "l2" or "ip"; must match the index operator class.
+
+    Returns:
+        tuple[str, dict]: SQL text and its named parameters (the caller fills `query_vec`).
+    """
+    op = distance_operator(metric)
+    where, params = _filters(report_dates, matched_docs, table_name)
+    params["top_k"] = int(top_k)
+    where_sql = ("WHERE " + "\n          AND ".join(where)) if where else ""
+
+    cutoff_sql = ""
+    if min_similarity is not None:
+        cutoff_sql = "WHERE c.distance <= %(max_distance)s"
+        params["max_distance"] = max_distance_for(metric, min_similarity)
+
+    sql = f"""
+    WITH candidates AS (
+        SELECT id, report_date, placeholder,
+               embedding {op} %(query_vec)s::vector AS distance
+        FROM {table_name}
+        {where_sql}
+        ORDER BY embedding {op} %(query_vec)s::vector
+        LIMIT %(top_k)s
+    )
+    SELECT c.id, t.content, c.report_date, c.placeholder,
+           {similarity_sql(metric, "c.distance")} AS similarity
+    FROM candidates c
+    JOIN {table_name} t ON t.id = c.id
+    {cutoff_sql}
+    ORDER BY c.distance;
+    """
+    return sql, params
+
+
+def build_hybrid_query(report_dates, matched_docs, top_k=50, min_similarity=None,
+                       table_name=DEFAULT_TABLE, metric=VECTOR_METRIC, text_config=TEXT_SEARCH_CONFIG,
+                       rrf_k=RRF_K, vector_weight=HYBRID_VECTOR_WEIGHT, lexical_weight=HYBRID_LEXICAL_WEIGHT,
+                       candidate_factor=HYBRID_CANDIDATE_FACTOR):
+    """
+    Build one parameterized hybrid query: ANN and full-text candidates (same
+    filters), fused by score = sum(weight / (rrf_k + rank)).
+
+    The query text (see lexical_query) becomes an OR of its stemmed,
+    stop-word-free terms, ranked by ts_rank_cd. The similarity cutoff only drops rows that did not match
+    lexically, so exact term hits survive a low cosine similarity.
+
+    Returns:
+        tuple[str, dict]: SQL text and its named parameters (the caller fills
+                          `query_vec` and `query_text`).
+    """
+    op = distance_operator(metric)
+    where, params = _filters(report_dates, matched_docs, table_name)
+    params.update({
+        "top_k": int(top_k),
+        "candidates": int(top_k) * int(candidate_factor),
+        "rrf_k": float(rrf_k),
+        "vector_weight": float(vector_weight),
+        "lexical_weight": float(lexical_weight),
+    })
+    vec_where = ("WHERE " + "\n              AND ".join(where)) if where else ""
+    lex_where = "WHERE " + "\n              AND ".join(where + [f"{TEXT_SEARCH_COLUMN} @@ q.query"])
+
+    # Final rows (at most top_k) get their similarity even if they were lexical-only hits
+    distance_sql = f"t.embedding {op} %(query_vec)s::vector"
+    cutoff_sql = ""
+    if min_similarity is not None:
+        cutoff_sql = f"WHERE f.lexical OR {distance_sql} <= %(max_distance)s"
+        params["max_distance"] = max_distance_for(metric, min_similarity)
+
+    sql = f"""
+    WITH vec AS (
+        SELECT id, row_number() OVER (ORDER BY distance) AS rank
+        FROM (
+            SELECT id, embedding {op} %(query_vec)s::vector AS distance
+            FROM {table_name}
+            {vec_where}
+            ORDER BY embedding {op} %(query_vec)s::vector
+            LIMIT %(candidates)s
+        ) v
+    ),
+    q AS (
+        -- OR of the query terms instead of plainto_tsquery's AND
+        SELECT nullif(replace(plainto_tsquery('{text_config}', %(query_text)s)::text, '&', '|'), '')::tsquery AS query
+    ),
+    lex AS (
+        SELECT id, row_number() OVER (ORDER BY score DESC) AS rank
+        FROM (
+            SELECT id, ts_rank_cd({TEXT_SEARCH_COLUMN}, q.query) AS score
+            FROM {table_name}, q
+            {lex_where}
+            ORDER BY score DESC
+            LIMIT %(candidates)s
+        ) l
+    ),
+    fused AS (
+        SELECT id, sum(score) AS rrf, bool_or(lexical) AS lexical
+        FROM (
+            SELECT id, %(vector_weight)s / (%(rrf_k)s + rank) AS score, false AS lexical FROM vec
+            UNION ALL
+            SELECT id, %(lexical_weight)s / (%(rrf_k)s + rank), true FROM lex
+        ) s
+        GROUP BY id
+        ORDER BY rrf DESC
+        LIMIT %(top_k)s
+    )
+    SELECT f.id, t.content, t.report_date, t.placeholder,
+           {similarity_sql(metric, distance_sql)} AS similarity
+    FROM fused f
+    JOIN {table_name} t ON t.id = f.id
+    {cutoff_sql}
+    ORDER BY f.rrf DESC;
+    """
+    return sql, params
+
+
+_text_search_ready = {}
+
+
+def text_search_ready(cursor, table_name=DEFAULT_TABLE):
+    """Whether hybrid retrieval can run on this table (checked once per process)."""
+    if table_name not in _text_search_ready:
+        _text_search_ready[table_name] = has_text_search(cursor, table_name)
+        if not _text_search_ready[table_name]:
+            logger.warning("⚠️ %s has no full-text column; using vector-only retrieval "
+                           "(run main_rebuild_index.py to add it)", table_name)
+    return _text_search_ready[table_name]
+
+
+def fetch_chunks(cursor, query_embedding, report_dates, matched_docs, top_k=50,
+                 min_similarity=None, table_name=DEFAULT_TABLE, metric=VECTOR_METRIC,
+                 index_method=VECTOR_INDEX_METHOD, query_text=None, mode=RETRIEVAL_MODE):
+    """
+    Run the retrieval query and return rows of
+    (id, content, report_date, placeholder, similarity), best first.
+
+    Args:
+        query_text (str | None): Needed for mode="hybrid"; without it (or without
+                                 the full-text column) retrieval is vector-only.
+        mode (str): "hybrid" or "vector".
+    """
+    iterative = apply_search_params(cursor, index_method, ef_search=HNSW_EF_SEARCH, probes=IVFFLAT_PROBES,
+                                    top_k=top_k * HYBRID_CANDIDATE_FACTOR if mode == "hybrid" else top_k,
+                                    table_name=table_name, iterative_scan=VECTOR_ITERATIVE_SCAN,
+                                    max_scan_tuples=HNSW_MAX_SCAN_TUPLES, max_probes=IVFFLAT_MAX_PROBES)
+    if mode == "hybrid" and query_text and text_search_ready(cursor, table_name):
+        sql, params = build_hybrid_query(
+            report_dates, matched_docs, top_k=top_k,
+            min_similarity=min_similarity, table_name=table_name, metric=metric
+        )
+        params["query_text"] = lexical_query(query_text)
+    else:
+        sql, params = build_retrieval_query(
+            report_dates, matched_docs, top_k=top_k,
+            min_similarity=min_similarity, table_name=table_name, metric=metric
+        )
+    params["query_vec"] = format_vector(query_embedding)
+    with telemetry.external("postgres", "retrieval", mode=mode, top_k=top_k) as call:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        call.set(rows=len(rows))
+        # Without iterative scans the index stops after ef_search / probes candidates,
+        # most of which a selective filter may reject
+        if len(rows) < top_k and (report_dates or matched_docs) and not iterative:
+            with exact_search(cursor):
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+            call.set(rows=len(rows), exact_rescan=True)
+            logger.info("   ↳ Filtered ANN scan came back short; re-ran as an exact scan (%d rows)", len(rows))
+    return rows
@@ -1,32 +1,31 @@
 
+import logging
 import re  
-import dateparser
-import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-# --------------------------
-# 2️⃣ Extract report dates
-# --------------------------
-def extract_report_dates(query: str):
-    dates = []
-    matches = re.findall(
-        r"(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s?['\-]?\s?(\d{2,4})",
-        query, re.I
-    )
-    for month, year in matches:
-        year = "20" + year if len(year) == 2 else year
-        parsed = dateparser.parse(f"{month} {year}")
-        if parsed:
-            dates.append(parsed.strftime("%Y-%m"))
-    qmatches = re.findall(r"C([1-4])Q(\d{2})", query, re.I)
-    for quarter, year in qmatches:
-        year = "20" + year
-        dates.append(f"{year}-Q{quarter}")
-    return list(set(dates))
+from pipeline.database import PgPool
+from pipeline.dates import extract_report_dates
+from pipeline.retrieval import fetch_chunks
+from pipeline.embeddings import embed_query
+from pipeline.timing import StageTimer
+from pipeline.catalog import get_document_catalog
+from pipeline.figure_store import FigureStore
+from pipeline.answer_cache import get_answer_cache
+from pipeline.context_packing import pack_context, split_placeholders
+from pipeline.ratelimit import estimate_tokens
+from pipeline.rerank import get_reranker
+from pipeline import telemetry
+from config import QUERY_FANOUT_WORKERS, CONTEXT_TOKEN_BUDGET, RERANK_CANDIDATES, RERANK_TOP_K
+
+# Progress lines (shown by the CLI entry points' logging setup); results also go on the trace's spans
+logger = logging.getLogger(__name__)
 
 # --------------------------
 # 3️⃣ Extract keywords via Gemini
 # --------------------------
-def extract_doc_keywords_gemini(query: str):
+def extract_doc_keywords_gemini(query: str, client):
     prompt = f"""
     Extract the company or document names mentioned in this query.
     Return only the names as a comma-separated list.
@@ -34,122 +33,128 @@ def extract_doc_keywords_gemini(query: str):
     Query: {query}
     """
     try:
-        resp = client.models.generate_content(model="gemini-2.5-flash", contents=prompt)
-        text_response = resp.text.strip()
+        with telemetry.external("gemini", "keywords", tokens_in=estimate_tokens(prompt)) as call:
+            resp = client.models.generate_content(model="gemini-2.5-flash", contents=prompt)
+            text_response = resp.text.strip()
+            call.set(tokens_out=estimate_tokens(text_response))
         if not text_response:
             raise ValueError("Gemini returned empty text")
     except Exception:
         text_response = query
-        print("⚠️ Gemini returned no text, fallback: using query text")
+        logger.warning("⚠️ Gemini returned no text, fallback: using query text")
     keywords = [kw.strip() for kw in re.split(r",|\n", text_response) if kw.strip()]
     return list(set(keywords))
 
-# --------------------------
-# 4️⃣ Retrieve document IDs
-# --------------------------
-def get_available_ids(cursor):
-    cursor.execute("SELECT DISTINCT id FROM pdf_chunks_768;")
-    return [row[0] for row in cursor.fetchall()]
-
 # --------------------------
 # 5️⃣ Retrieve chunks by similarity with interactive fallback
 # --------------------------
-def retrieve_chunks(cursor, query_embedding, report_dates, matched_docs, similarity_threshold=0.5):
-    query_str = "[" + ",".join(map(str, query_embedding)) + "]"
-    sql_similarity = """
-    SELECT id, content, report_date, placeholder,
-           1 - (embedding <-> %s) AS similarity
-    FROM pdf_chunks_768
-    ORDER BY embedding <-> %s;
+@telemetry.traced()
+def retrieve_chunks(db, query_embedding, report_dates, matched_docs, similarity_threshold=0.5, top_k=50,
+                    query_text=None, fallback="ask"):
     """
-    cursor.execute(sql_similarity, (query_str, query_str))
-    all_chunks = cursor.fetchall()
-
-    # Filter by explicit report_dates
-    explicit_dates = [d for d in report_dates if d != "LATEST"]
-    if explicit_dates:
-        date_filtered_chunks = [row for row in all_chunks if row[2] in explicit_dates]
-    unique_dates = sorted(set(row[2] for row in date_filtered_chunks))
-    print("✅ Unique report dates in filtered chunks:", unique_dates)
-
-    # Filter by LATEST
-    if "LATEST" in report_dates:
-        latest_dates = [row[2] for row in all_chunks if row[2] is not None]
-        if latest_dates:
-            latest_date = max(latest_dates)
-            date_filtered_chunks = [row for row in all_chunks if row[2] == latest_date]
-
-    # Filter by matched docs
-    if matched_docs:
-        doc_filtered_chunks = [row for row in date_filtered_chunks if row[0] in matched_docs]
-    else:
-      doc_filtered_chunks = date_filtered_chunks
-    print(f"   ↳ Retrieved {len(doc_filtered_chunks)} chunks (after date filtering)")
-
-    filtered_chunks = [row for row in doc_filtered_chunks if row[4] >= similarity_threshold]
-
-    # Interactive fallback
-    if not filtered_chunks and doc_filtered_chunks:
-        best_row = max(doc_filtered_chunks, key=lambda x: x[4])
-        lowest_cosine = best_row[4]
-        print(f"⚠️ No chunks meet threshold {similarity_threshold}.")
-        print(f"   ↳ Highest available similarity = {lowest_cosine:.4f}, from doc_id={best_row[0]}")
-        user_input = input(
-            f"Do you want to use this chunk? (y/n) or specify a new minimum cosine value: "
-        ).strip().lower()
-        if user_input == "y":
-            filtered_chunks = [best_row]
-            similarity_threshold = lowest_cosine
-        else:
-            try:
-                new_threshold = float(user_input)
-                similarity_threshold = new_threshold
-                filtered_chunks = [row for row in doc_filtered_chunks if row[4] >= new_threshold]
-            except ValueError:
-                filtered_chunks = []
-
-    print(f"   ↳ Retrieved {len(filtered_chunks)} chunks (after cosine ≥ {similarity_threshold})")
+    Retrieve the top_k best chunks that pass the date/doc filters and the
+    similarity threshold. Filtering, ranking and the cutoff all run in SQL.
+    With query_text, ranking is hybrid (see pipeline.retrieval) per RETRIEVAL_MODE.
+
+    Args:
+        db: A cursor, or a pipeline.database.PgPool. With a pool every query runs
+            in its own pool.run() (retried on a fresh connection if the server
+            dropped ours), so no connection is held while the fallback waits on
+            stdin, and a dropped connection does not ask the user again.
+        fallback: What to do when no chunk passes the threshold: "ask" (prompt
+                  on stdin), "best" (use the single best chunk), "none", or a
+                  float (retry with that minimum similarity).
+
+    Returns:
+        list[tuple]: (id, content, report_date, placeholder, similarity) rows.
+    """
+    def _fetch(**kwargs):
+        def _query(cursor):
+            return fetch_chunks(cursor, query_embedding, report_dates, matched_docs, **kwargs)
+        if isinstance(db, PgPool):
+            return db.run(lambda conn: _query(conn.cursor()))
+        return _query(db)
+
+    filtered_chunks = _fetch(top_k=top_k, min_similarity=similarity_threshold, query_text=query_text)
+
+    # Fallback: offer the single best chunk that passes the filters
+    if not filtered_chunks and fallback != "none":
+        best_rows = _fetch(top_k=1, mode="vector")
+        if best_rows:
+            best_row = best_rows[0]
+            lowest_cosine = best_row[4]
+            logger.warning("⚠️ No chunks meet threshold %s.", similarity_threshold)
+            logger.info("   ↳ Highest available similarity = %.4f, from doc_id=%s", lowest_cosine, best_row[0])
+            telemetry.annotate(best_similarity=round(lowest_cosine, 4))
+            if fallback == "ask":
+                user_input = input(
+                    f"Do you want to use this chunk? (y/n) or specify a new minimum cosine value: "
+                ).strip().lower()
+            else:
+                user_input = "y" if fallback == "best" else str(fallback)
+            if user_input == "y":
+                filtered_chunks = [best_row]
+                similarity_threshold = lowest_cosine
+            else:
+                try:
+                    new_threshold = float(user_input)
+                    similarity_threshold = new_threshold
+                    filtered_chunks = _fetch(top_k=top_k, min_similarity=new_threshold, query_text=query_text)
+                except ValueError:
+                    filtered_chunks = []
+
+    unique_dates = sorted(set(row[2] for row in filtered_chunks if row[2] is not None))
+    telemetry.annotate(chunks=len(filtered_chunks), report_dates=unique_dates,
+                       min_similarity=similarity_threshold, top_k=top_k)
+    logger.info("✅ Unique report dates in filtered chunks: %s", unique_dates)
+    logger.info("   ↳ Retrieved %d chunks (after cosine ≥ %s, top_k=%d)",
+                len(filtered_chunks), similarity_threshold, top_k)
     return filtered_chunks
 
 
 
 # --------------------------
-# 6️⃣ Match figures from llamageneratedjson
+# 6️⃣ Match figures from the figure store
 # --------------------------
-def match_figures(retrieved_chunks, llamageneratedjson):
+@telemetry.traced()
+def match_figures(retrieved_chunks, figure_store):
+    """
+    Figures for the placeholders referenced by the retrieved chunks.
+
+    Args:
+        figure_store: pipeline.figure_store store (O(1) lookup by placeholder);
+                      a raw llama JSON list is indexed on the fly.
+    """
+    if isinstance(figure_store, list):
+        figure_store = FigureStore.from_nodes(figure_store)
+
     # Split multiple placeholders
     relevant_placeholders = []
     for chunk in retrieved_chunks:
-        ph_str = chunk.get("placeholder")
-        if ph_str:
-            # Remove curly braces and split by comma
-            ph_str = ph_str.strip("{}")
-            ph_list = [p.strip() for p in ph_str.split(",") if p.strip()]
-            relevant_placeholders.extend(ph_list)
-
-    # Now match each placeholder individually
-    matching_nodes = [node for node in llamageneratedjson if node["placeholder"] in relevant_placeholders]
-    print(f"   ↳ Found {len(matching_nodes)} matching nodes in llamageneratedjson")
-
-    figures_to_pass = []
-    for node in matching_nodes:
-        for fig in node.get("figures", []):
-            fig_copy = fig.copy() if isinstance(fig, dict) else {"text": fig}
-            fig_copy["placeholder"] = node.get("placeholder", "Unknown")
-            figures_to_pass.append(fig_copy)
+        relevant_placeholders.extend(split_placeholders(chunk.get("placeholder")))
+
+    # Figures come back already tagged with their placeholder
+    figures_to_pass = figure_store.figures_for(relevant_placeholders)
     #figures_to_pass = figures_to_pass[:2]
-    print(f"   ↳ Passing {len(figures_to_pass)} figures to LLM")
+    telemetry.annotate(placeholders=len(relevant_placeholders), figures=len(figures_to_pass))
+    logger.info("   ↳ Matched %d figures", len(figures_to_pass))
     return figures_to_pass
 
 # --------------------------
 # 7️⃣ Build LLM prompt
 # --------------------------
-def build_prompt(query_text, retrieved_chunks, figures_to_pass):
+@telemetry.traced()
+def build_prompt(query_text, retrieved_chunks, figures_to_pass, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Answer prompt with the best chunks and figures that fit `token_budget`
+    (see pipeline.context_packing); logs the estimated tokens per section.
+    """
+    packed = pack_context(retrieved_chunks, figures_to_pass, token_budget)
     prompt = f"""
 You are given:
 
-1️⃣ Retrieved text chunks, with source and report_date metadata.
-2️⃣ Figures in JSON format, each with its original placeholder.
+1️⃣ Retrieved text chunks (one JSON object per line, most relevant first), with source and report_date metadata.
+2️⃣ Figures in JSON format (one per line), each with its original placeholder.
 
 Task:
 For Retrieved text chunks:
@@ -166,65 +171,278 @@ For Figures in JSON format:
 - Important is always have year or quarter or any time period as column headers.
 
 === Retrieved Chunks ===
-{json.dumps(retrieved_chunks, indent=2)}
+{packed["chunks_text"]}
 
 === Figures JSON ===
-{json.dumps(figures_to_pass, indent=2)}
+{packed["figures_text"]}
 
 Question: {query_text}
 """
-    print(f"   ↳ Prompt length: {len(prompt)} chars")
+    tokens, dropped = packed["tokens"], packed["dropped"]
+    total = estimate_tokens(prompt)
+    telemetry.annotate(tokens=total, chunk_tokens=tokens["chunks"], figure_tokens=tokens["figures"],
+                       chunks=len(packed["chunks"]), figures=len(packed["figures"]), budget=token_budget,
+                       dropped=dropped, trimmed_chars=packed["trimmed_chars"])
+    logger.info("   ↳ Prompt: ~%d tokens (instructions ~%d, chunks ~%d [%d/%d], figures ~%d [%d/%d], budget %d)",
+                total, total - tokens["chunks"] - tokens["figures"],
+                tokens["chunks"], len(packed["chunks"]), len(retrieved_chunks),
+                tokens["figures"], len(packed["figures"]), len(figures_to_pass), token_budget)
+    if any(dropped.values()) or packed["trimmed_chars"]:
+        logger.info("   ↳ Left out: %d duplicate chunks, %d chunks and %d figures over budget, "
+                    "%d chunks fully covered by overlapping neighbours, %d figures of left-out chunks; "
+                    "%d overlapping chars trimmed",
+                    dropped["duplicate_chunks"], dropped["chunks"], dropped["figures"], dropped["trimmed_chunks"],
+                    dropped["unreferenced_figures"], packed["trimmed_chars"])
     return prompt
 
 # --------------------------
 # 8️⃣ Send prompt to Gemini
 # --------------------------
 def send_to_gemini(prompt, client):
-    print("🔹 Step 10: Sending to Gemini...")
-    resp = client.models.generate_content(model="gemini-2.5-flash", contents=prompt)
-    answer = resp.text.strip()
-    print("   ↳ Gemini response received!")
+    logger.info("🔹 Step 10: Sending to Gemini...")
+    with telemetry.external("gemini", "generate", tokens_in=estimate_tokens(prompt)) as call:
+        resp = client.models.generate_content(model="gemini-2.5-flash", contents=prompt)
+        answer = resp.text.strip()
+        call.set(tokens_out=estimate_tokens(answer))
+    logger.info("   ↳ Gemini response received!")
     return answer
 
+
+def stream_gemini_text(client, contents, timer=None, model="gemini-2.5-flash"):
+    """
+    Yield text chunks from the streaming generation API as they arrive.
+    Time to first token is recorded on `timer` as "ttft", the whole call as "generation".
+    """
+    start = time.perf_counter()
+    first = True
+    tokens_out = 0
+    call = telemetry.external("gemini", "generate_stream", trace=timer.trace if timer else None,
+                              tokens_in=estimate_tokens(contents) if isinstance(contents, str) else 0)
+    try:
+        with call:
+            for chunk in client.models.generate_content_stream(model=model, contents=contents):
+                text = chunk.text
+                if not text:
+                    continue
+                if first:
+                    first = False
+                    if timer:
+                        timer.record("ttft", time.perf_counter() - start)
+                    call.set(ttft_ms=round((time.perf_counter() - start) * 1000, 1))
+                tokens_out += estimate_tokens(text)
+                yield text
+    finally:
+        call.set(tokens_out=tokens_out)
+        if timer:
+            timer.record("generation", time.perf_counter() - start)
+
+
+def send_to_gemini_stream(prompt, client, timer=None):
+    """Streaming send_to_gemini: yields the answer in chunks."""
+    logger.info("🔹 Step 10: Streaming from Gemini...")
+    yield from stream_gemini_text(client, prompt, timer)
+
 # --------------------------
 # 9️⃣ Main pipeline
 # --------------------------
-def run_query_pipeline(query_text, query_embedding,conn, llamageneratedjson,client):
-
-    cursor = conn.cursor()
-
-    print("🔹 Step 2: Extracting report dates...")
+def _query_report_dates(query_text):
+    logger.info("🔹 Step 2: Extracting report dates...")
     report_dates = extract_report_dates(query_text)
     if not report_dates:
         report_dates = ["LATEST"]
-    print(f"   ↳ Extracted report_dates: {report_dates}")
-
-    print("🔹 Step 4: Extracting keywords via Gemini...")
-    keywords = extract_doc_keywords_gemini(query_text)
-
-    print("🔹 Step 5: Loading available document IDs...")
-    available_ids = get_available_ids(cursor)
-    matched_docs = []
-    for kw in keywords:
-        for original_id in available_ids:
-            if kw.lower() in original_id.lower():
-                matched_docs.append(original_id)
-    print(f"   ↳ Extracted keywords: {keywords}")
-    print(f"   ↳ Matched docs: {matched_docs}")
-
-    retrieved_chunks = retrieve_chunks(cursor, query_embedding, report_dates, matched_docs)
-    print(retrieved_chunks)
+    telemetry.annotate(report_dates=report_dates)
+    logger.info("   ↳ Extracted report_dates: %s", report_dates)
+    return report_dates
+
+
+def _resolve_latest(catalog, report_dates):
+    """LATEST -> the newest report date in the catalog (if any)."""
+    if report_dates == ["LATEST"] and catalog.latest_report_date():
+        return [catalog.latest_report_date()]
+    return report_dates
+
+
+def _match_documents(catalog, keywords):
+    """Keyword -> document ids via the catalog."""
+    logger.info("🔹 Step 5: Matching keywords against the document catalog...")
+    matched_docs = catalog.match(keywords)
+    telemetry.annotate(keywords=keywords, matched_docs=matched_docs)
+    logger.info("   ↳ Extracted keywords: %s", keywords)
+    logger.info("   ↳ Matched docs: %s", matched_docs)
+    return matched_docs
+
+
+def _check_answer_cache(answer_cache, catalog, query_text, query_embedding, report_dates, matched_docs, timer):
+    """
+    Returns (cached answer or None, on_answer) where on_answer(answer) stores a
+    freshly generated answer under the current catalog version of the dates.
+    Hits need the same report dates and matched documents as the cached query.
+    """
+    if not answer_cache:
+        return None, None
+    with timer.stage("answer_cache"):
+        versions = catalog.date_versions(report_dates)
+        hit = answer_cache.lookup(query_embedding, report_dates, matched_docs, versions)
+    timer.annotate(answer_cache="hit" if hit else "miss")
+    if hit:
+        timer.annotate(answer_cache_similarity=round(hit["similarity"], 3))
+        logger.info("💾 Answer cache hit (similarity %.3f to: %r), saved ~%.1fs",
+                    hit["similarity"], hit["query"], hit["latency"])
+        timer.log()
+        return hit["answer"], None
+
+    def on_answer(answer):
+        answer_cache.store(query_text, query_embedding, report_dates, matched_docs, answer, timer.total(), versions)
+    return None, on_answer
+
+
+def _stream_answer(prompt, client, timer, on_answer=None):
+    parts = []
+    for chunk in send_to_gemini_stream(prompt, client, timer):
+        parts.append(chunk)
+        yield chunk
+    answer = "".join(parts).strip()
+    logger.info("   ↳ Gemini response streamed (%d chars)", len(answer))
+    timer.log(answer_chars=len(answer))
+    if on_answer and answer:
+        on_answer(answer)
+
+
+def _retrieve_and_answer(query_text, query_embedding, report_dates, matched_docs, pool, figure_store, client, timer,
+                         stream=False, on_answer=None, fallback="ask"):
+    reranker = get_reranker()
+    # Each SQL query gets its own pooled (and retried) connection; the fallback decision runs outside them
+    with timer.stage("retrieval"):
+        if reranker:
+            # Top-N candidates without a cosine cutoff; the reranker picks the final top-k
+            retrieved_chunks = retrieve_chunks(pool, query_embedding, report_dates, matched_docs,
+                                               similarity_threshold=None, top_k=RERANK_CANDIDATES,
+                                               query_text=query_text, fallback=fallback)
+        else:
+            retrieved_chunks = retrieve_chunks(pool, query_embedding, report_dates, matched_docs,
+                                               query_text=query_text, fallback=fallback)
     retrieved_chunks_with_sources = [
         {"id": row[0], "content": row[1], "report_date": row[2], "placeholder": row[3], "similarity": row[4]}
         for row in retrieved_chunks
     ]
+    if reranker:
+        with timer.stage("rerank"):
+            retrieved_chunks_with_sources = reranker.rerank(query_text, retrieved_chunks_with_sources, RERANK_TOP_K)
 
-    figures_to_pass = match_figures(retrieved_chunks_with_sources, llamageneratedjson)
-    prompt = build_prompt(query_text, retrieved_chunks_with_sources, figures_to_pass)
-    answer = send_to_gemini(prompt, client)
-
-    print("\n=== Question ===")
-    print(query_text)
-    print("\n=== Answer ===")
-    print(answer)
+    with timer.stage("prompt"):
+        figures_to_pass = match_figures(retrieved_chunks_with_sources, figure_store)
+        prompt = build_prompt(query_text, retrieved_chunks_with_sources, figures_to_pass)
+    if stream:
+        return _stream_answer(prompt, client, timer, on_answer)
+    with timer.stage("generation"):
+        answer = send_to_gemini(prompt, client)
+    timer.log(answer_chars=len(answer))
+    if on_answer and answer:
+        on_answer(answer)
     return answer
+
+
+def run_query_pipeline(query_text, query_embedding, pool, figure_store, client, timer=None, stream=False,
+                       answer_cache=None, fallback="ask"):
+    """
+    Full RAG query. `pool` is a pipeline.database.PgPool; a connection is only
+    checked out for the database steps, not while waiting on Gemini.
+    `figure_store` comes from pipeline.figure_store.open_figure_store.
+
+    Args:
+        query_embedding: Query vector, or None to embed query_text here.
+        timer (StageTimer): Receives per-stage timings (a new one if None).
+        stream (bool): Return an iterator of answer text chunks instead of the
+                       full answer; retrieval still happens before this returns.
+        answer_cache (SemanticAnswerCache | False | None): None = process-wide
+                       cache, False = always run the full pipeline.
+        fallback: When no chunk passes the similarity threshold, see retrieve_chunks
+                  ("ask" prompts on stdin; services pass "best", "none" or a float).
+    """
+    timer = timer or StageTimer()
+    timer.annotate(**telemetry.text_attrs("query", query_text))
+    answer_cache = get_answer_cache() if answer_cache is None else (answer_cache or None)
+    if query_embedding is None:
+        with timer.stage("embedding"):
+            query_embedding = embed_query(client, query_text)
+    with timer.stage("dates"):
+        report_dates = _query_report_dates(query_text)
+    with timer.stage("catalog"):
+        catalog = get_document_catalog(pool)
+        report_dates = _resolve_latest(catalog, report_dates)
+
+    logger.info("🔹 Step 4: Extracting keywords via Gemini...")
+    with timer.stage("keywords"):
+        keywords = extract_doc_keywords_gemini(query_text, client)
+    with timer.stage("match_documents"):
+        matched_docs = _match_documents(catalog, keywords)
+
+    cached, on_answer = _check_answer_cache(answer_cache, catalog, query_text, query_embedding, report_dates,
+                                            matched_docs, timer)
+    if cached is not None:
+        return iter([cached]) if stream else cached
+
+    return _retrieve_and_answer(query_text, query_embedding, report_dates, matched_docs,
+                                pool, figure_store, client, timer, stream=stream, on_answer=on_answer,
+                                fallback=fallback)
+
+
+_fanout_executor = None
+_fanout_lock = threading.Lock()
+
+
+def _get_fanout_executor():
+    global _fanout_executor
+    if _fanout_executor is None:
+        with _fanout_lock:
+            if _fanout_executor is None:
+                _fanout_executor = ThreadPoolExecutor(max_workers=QUERY_FANOUT_WORKERS, thread_name_prefix="query")
+    return _fanout_executor
+
+
+def run_query_pipeline_concurrent(query_text, query_embedding, pool, figure_store, client, timer=None, stream=False,
+                                  answer_cache=None, fallback="ask"):
+    """
+    Same as run_query_pipeline, but the independent steps run at the same time:
+    query embedding (if query_embedding is None), Gemini keyword extraction and
+    the catalog refresh go to a thread pool while dates are parsed here. Then
+    retrieval and generation run on the joined results, so latency is about
+    max(embedding, keywords) + retrieval + generation. The answer cache is
+    checked once the keywords have matched documents (hits are per document
+    set), so a hit costs about max(embedding, keywords).
+    """
+    timer = timer or StageTimer()
+    timer.annotate(**telemetry.text_attrs("query", query_text))
+    answer_cache = get_answer_cache() if answer_cache is None else (answer_cache or None)
+    executor = _get_fanout_executor()
+    catalog = get_document_catalog(pool)
+
+    logger.info("🔹 Step 1: Embedding query, extracting keywords and refreshing the catalog concurrently...")
+    embedding_future = None
+    if query_embedding is None:
+        embedding_future = executor.submit(timer.timed("embedding", embed_query), client, query_text)
+    keywords_future = executor.submit(timer.timed("keywords", extract_doc_keywords_gemini), query_text, client)
+    catalog_future = executor.submit(timer.timed("catalog", catalog.refresh))
+
+    with timer.stage("dates"):
+        report_dates = _query_report_dates(query_text)
+
+    with timer.stage("join"):
+        catalog_future.result()
+        if embedding_future is not None:
+            query_embedding = embedding_future.result()
+    report_dates = _resolve_latest(catalog, report_dates)
+
+    with timer.stage("join"):
+        keywords = keywords_future.result()
+    with timer.stage("match_documents"):
+        matched_docs = _match_documents(catalog, keywords)
+
+    cached, on_answer = _check_answer_cache(answer_cache, catalog, query_text, query_embedding, report_dates,
+                                            matched_docs, timer)
+    if cached is not None:
+        return iter([cached]) if stream else cached
+
+    return _retrieve_and_answer(query_text, query_embedding, report_dates, matched_docs,
+                                pool, figure_store, client, timer, stream=stream, on_answer=on_answer,
+                                fallback=fallback)
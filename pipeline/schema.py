@@ -0,0 +1,311 @@
+"""
+Schema and ANN index management for the pgvector chunk table.
+
+Creates / rebuilds HNSW or IVFFlat indexes on `embedding`, picks index
+parameters from the table size, and sets the per-query search knobs
+(`hnsw.ef_search` / `ivfflat.probes`, plus iterative scans on pgvector >= 0.8)
+so retrieval can use an index scan.
+Also maintains the generated tsvector column + GIN index used by hybrid retrieval.
+"""
+import math
+from contextlib import contextmanager
+
+DEFAULT_TABLE = "pdf_chunks_768"
+
+# metric -> (distance operator, index operator class)
+METRICS = {
+    "l2": ("<->", "vector_l2_ops"),
+    "cosine": ("<=>", "vector_cosine_ops"),
+    "ip": ("<#>", "vector_ip_ops"),
+}
+INDEX_METHODS = ("hnsw", "ivfflat")
+
+
+def distance_operator(metric):
+    """Return the pgvector operator that matches `metric`."""
+    if metric not in METRICS:
+        raise ValueError(f"Unknown vector metric {metric!r}, expected one of {sorted(METRICS)}")
+    return METRICS[metric][0]
+
+
+def similarity_sql(metric, distance_expr):
+    """SQL expression turning a distance into a 'higher is better' similarity."""
+    if metric == "ip":
+        return f"-({distance_expr})"  # <#> returns the negative inner product
+    return f"1 - ({distance_expr})"
+
+
+def max_distance_for(metric, min_similarity):
+    """Inverse of similarity_sql: the largest distance that still passes `min_similarity`."""
+    if metric == "ip":
+        return -float(min_similarity)
+    return 1 - float(min_similarity)
+
+
+def index_name(table_name, method, metric):
+    return f"{table_name}_embedding_{method}_{metric}_idx"
+
+
+# --------------------------
+# Table size & parameter selection
+# --------------------------
+def estimate_row_count(cursor, table_name=DEFAULT_TABLE):
+    """Cheap row estimate from pg_class; falls back to count(*) for never-analyzed tables."""
+    cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass;", (table_name,))
+    row = cursor.fetchone()
+    if row and row[0] is not None and row[0] >= 0:
+        return int(row[0])
+    cursor.execute(f"SELECT count(*) FROM {table_name};")
+    return int(cursor.fetchone()[0])
+
+
+def recommend_index_params(row_count, method="hnsw", top_k=50):
+    """
+    Pick index build/search parameters from the table size, following the
+    pgvector guidance (lists = rows/1000 up to 1M rows, sqrt(rows) above;
+    probes = sqrt(lists); larger m / ef_construction for bigger graphs).
+
+    Returns:
+        dict: build params (m, ef_construction or lists) and search params
+              (ef_search or probes).
+    """
+    row_count = max(int(row_count), 1)
+    if method == "ivfflat":
+        lists = row_count // 1000 if row_count <= 1_000_000 else int(math.sqrt(row_count))
+        lists = max(lists, 1)
+        return {"lists": lists, "probes": max(1, int(math.sqrt(lists)))}
+    if method == "hnsw":
+        if row_count < 100_000:
+            m, ef_construction = 16, 64
+        elif row_count < 1_000_000:
+            m, ef_construction = 24, 128
+        else:
+            m, ef_construction = 32, 200
+        return {"m": m, "ef_construction": ef_construction, "ef_search": max(40, 2 * top_k)}
+    raise ValueError(f"Unknown index method {method!r}, expected one of {INDEX_METHODS}")
+
+
+def _resolve_params(cursor, table_name, method, overrides):
+    params = recommend_index_params(estimate_row_count(cursor, table_name), method)
+    params.update({k: v for k, v in overrides.items() if v is not None})
+    return params
+
+
+# --------------------------
+# Index DDL
+# --------------------------
+def _index_ddl(name, table_name, method, metric, params, concurrently):
+    opclass = METRICS[metric][1]
+    if method == "hnsw":
+        with_sql = f"WITH (m = {int(params['m'])}, ef_construction = {int(params['ef_construction'])})"
+    else:
+        with_sql = f"WITH (lists = {int(params['lists'])})"
+    conc = "CONCURRENTLY " if concurrently else ""
+    return f"CREATE INDEX {conc}IF NOT EXISTS {name} ON {table_name} USING {method} (embedding {opclass}) {with_sql};"
+
+
+def get_vector_indexes(cursor, table_name=DEFAULT_TABLE):
+    """
+    List ANN indexes on `embedding`.
+
+    Returns:
+        list[tuple[str, str, str]]: (index_name, method, metric)
+    """
+    cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s;", (table_name,))
+    found = []
+    for name, indexdef in cursor.fetchall():
+        lower = indexdef.lower()
+        method = next((m for m in INDEX_METHODS if f"using {m}" in lower), None)
+        metric = next((k for k, (_, opclass) in METRICS.items() if opclass in lower), None)
+        if method and metric:
+            found.append((name, method, metric))
+    return found
+
+
+def create_vector_index(conn, table_name=DEFAULT_TABLE, method="hnsw", metric="cosine",
+                        m=None, ef_construction=None, lists=None, concurrently=False):
+    """
+    Create an HNSW or IVFFlat index on `embedding` (no-op if it already exists).
+    Unset build parameters are picked from the table size.
+
+    Args:
+        concurrently (bool): Build without blocking writes (runs outside a transaction).
+
+    Returns:
+        str: Index name.
+    """
+    distance_operator(metric)
+    cursor = conn.cursor()
+    params = _resolve_params(cursor, table_name, method,
+                             {"m": m, "ef_construction": ef_construction, "lists": lists})
+    name = index_name(table_name, method, metric)
+    ddl = _index_ddl(name, table_name, method, metric, params, concurrently)
+    _run_ddl(conn, cursor, [ddl], concurrently)
+    print(f"✅ Vector index ready: {name} {params}")
+    return name
+
+
+def rebuild_vector_index(conn, table_name=DEFAULT_TABLE, method="hnsw", metric="cosine",
+                         m=None, ef_construction=None, lists=None, concurrently=True):
+    """
+    Rebuild the ANN index with fresh parameters (e.g. after the table has grown
+    enough that IVFFlat lists are stale). The new index is built under a temporary
+    name, then swapped in, so queries keep an index available while it builds.
+    Any other ANN index on `embedding` (different method/metric) is dropped.
+    """
+    distance_operator(metric)
+    cursor = conn.cursor()
+    params = _resolve_params(cursor, table_name, method,
+                             {"m": m, "ef_construction": ef_construction, "lists": lists})
+    name = index_name(table_name, method, metric)
+    tmp_name = f"{name}_new"
+    conc = "CONCURRENTLY " if concurrently else ""
+
+    statements = [f"DROP INDEX {conc}IF EXISTS {tmp_name};",
+                  _index_ddl(tmp_name, table_name, method, metric, params, concurrently)]
+    for old_name, _, _ in get_vector_indexes(cursor, table_name):
+        if old_name != tmp_name:
+            statements.append(f"DROP INDEX {conc}IF EXISTS {old_name};")
+    statements.append(f"ALTER INDEX {tmp_name} RENAME TO {name};")
+    _run_ddl(conn, cursor, statements, concurrently)
+    print(f"✅ Rebuilt vector index {name} {params}")
+    return name
+
+
+def ensure_vector_index(conn, table_name=DEFAULT_TABLE, method="hnsw", metric="cosine", **build_params):
+    """Create the index for (method, metric) if the table does not have one yet."""
+    cursor = conn.cursor()
+    if (method, metric) in {(mth, mtr) for _, mth, mtr in get_vector_indexes(cursor, table_name)}:
+        return index_name(table_name, method, metric)
+    return create_vector_index(conn, table_name, method, metric, **build_params)
+
+
+def _run_ddl(conn, cursor, statements, concurrently):
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block
+    if concurrently:
+        conn.commit()
+        previous = conn.autocommit
+        conn.autocommit = True
+        try:
+            for stmt in statements:
+                cursor.execute(stmt)
+        finally:
+            conn.autocommit = previous
+    else:
+        for stmt in statements:
+            cursor.execute(stmt)
+        conn.commit()
+
+
+# --------------------------
+# Full-text index (hybrid retrieval)
+# --------------------------
+TEXT_SEARCH_COLUMN = "content_tsv"
+
+
+def has_text_search(cursor, table_name=DEFAULT_TABLE):
+    """True if the table has the generated tsvector column."""
+    cursor.execute(
+        "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = %s;",
+        (table_name, TEXT_SEARCH_COLUMN),
+    )
+    return cursor.fetchone() is not None
+
+
+def ensure_text_search(conn, table_name=DEFAULT_TABLE, config="english"):
+    """
+    Add a generated tsvector column over `content` and a GIN index on it.
+    Postgres computes the column on every insert/update, so the loaders
+    (COPY + upsert) keep it in sync without changes. Adding the column
+    rewrites the table once.
+    """
+    cursor = conn.cursor()
+    name = f"{table_name}_{TEXT_SEARCH_COLUMN}_gin_idx"
+    if not has_text_search(cursor, table_name):
+        print(f"🔤 Adding {TEXT_SEARCH_COLUMN} to {table_name} (one-time table rewrite)...")
+        cursor.execute(
+            f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {TEXT_SEARCH_COLUMN} tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('{config}'::regconfig, coalesce(content, ''))) STORED;"
+        )
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table_name} USING gin ({TEXT_SEARCH_COLUMN});")
+    conn.commit()
+    return name
+
+
+# --------------------------
+# Query-time search parameters
+# --------------------------
+_ivfflat_probes_cache = {}
+_pgvector_version = None
+ITERATIVE_SCAN_MODES = ("off", "relaxed_order", "strict_order")
+
+
+def pgvector_version(cursor):
+    """Installed pgvector version as a tuple, e.g. (0, 8, 0); looked up once per process."""
+    global _pgvector_version
+    if _pgvector_version is None:
+        cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector';")
+        row = cursor.fetchone()
+        _pgvector_version = tuple(int(p) for p in row[0].split(".")) if row else (0,)
+    return _pgvector_version
+
+
+def supports_iterative_scan(cursor):
+    """pgvector 0.8 added iterative index scans for filtered ANN queries."""
+    return pgvector_version(cursor) >= (0, 8, 0)
+
+
+def apply_search_params(cursor, method="hnsw", ef_search=None, probes=None, top_k=50,
+                        table_name=DEFAULT_TABLE, iterative_scan="off", max_scan_tuples=None, max_probes=None):
+    """
+    Set the ANN search knobs for the current transaction. hnsw.ef_search must be
+    at least top_k, otherwise the index scan returns fewer than top_k rows.
+    Unset ivfflat probes are derived from the table size once per process.
+
+    WHERE filters are applied to the candidates the index returns, so a selective
+    filter can still leave fewer than top_k rows. `iterative_scan` ("relaxed_order"
+    or "strict_order") makes pgvector >= 0.8 keep scanning until enough rows pass,
+    bounded by hnsw.max_scan_tuples / ivfflat.max_probes.
+
+    Returns:
+        bool: True if an iterative scan is on (filtered results fill up by themselves);
+              False means the caller has to handle short filtered results (see exact_search).
+    """
+    if iterative_scan not in ITERATIVE_SCAN_MODES:
+        raise ValueError(f"Unknown iterative scan mode {iterative_scan!r}, expected one of {ITERATIVE_SCAN_MODES}")
+    supported = supports_iterative_scan(cursor)
+    iterative = iterative_scan != "off" and supported
+    if method == "hnsw":
+        ef = max(int(ef_search or recommend_index_params(1, "hnsw", top_k)["ef_search"]), int(top_k))
+        cursor.execute(f"SET LOCAL hnsw.ef_search = {ef};")
+        if supported:
+            cursor.execute(f"SET LOCAL hnsw.iterative_scan = {iterative_scan};")
+            if iterative and max_scan_tuples:
+                cursor.execute(f"SET LOCAL hnsw.max_scan_tuples = {int(max_scan_tuples)};")
+    elif method == "ivfflat":
+        if not probes:
+            if table_name not in _ivfflat_probes_cache:
+                rows = estimate_row_count(cursor, table_name)
+                _ivfflat_probes_cache[table_name] = recommend_index_params(rows, "ivfflat")["probes"]
+            probes = _ivfflat_probes_cache[table_name]
+        cursor.execute(f"SET LOCAL ivfflat.probes = {int(probes)};")
+        if supported:
+            # IVFFlat only supports relaxed ordering
+            cursor.execute(f"SET LOCAL ivfflat.iterative_scan = {'relaxed_order' if iterative else 'off'};")
+            if iterative and max_probes:
+                cursor.execute(f"SET LOCAL ivfflat.max_probes = {int(max_probes)};")
+    return iterative
+
+
+@contextmanager
+def exact_search(cursor):
+    """
+    Run the enclosed queries without index scans, so ORDER BY distance is an
+    exact scan over the filtered rows. The previous setting is restored on exit
+    (after an error the transaction is aborted, which undoes the SET LOCAL anyway).
+    """
+    cursor.execute("SELECT current_setting('enable_indexscan');")
+    previous = cursor.fetchone()[0]
+    cursor.execute("SET LOCAL enable_indexscan = off;")
+    yield
+    cursor.execute(f"SET LOCAL enable_indexscan = {previous};")
@@ -0,0 +1,366 @@
+"""
+Non-interactive HTTP query service (aiohttp) around the query pipeline.
+
+Endpoints (JSON bodies; the /stream variants answer with NDJSON lines
+{"delta": "..."} followed by one {"done": true, ...} line):
+
+    POST   /query          {"query", "fallback"?}
+                           -> {"answer", "timings"}
+    POST   /query/stream
+    POST   /chat           {"message", "session_id"?, "run_query"?, "query"?, "fallback"?}
+                           -> {"session_id", "answer", "needed_query", "timings"}
+    POST   /chat/stream
+    DELETE /sessions/{session_id}
+    GET    /health
+    GET    /metrics        Prometheus text format (pipeline.telemetry)
+
+The pipeline is blocking (psycopg2, google-genai), so every request runs on a
+worker thread. An asyncio semaphore caps how many run at once
+(SERVICE_MAX_CONCURRENT), and each request is bounded by
+SERVICE_REQUEST_TIMEOUT_SECS. The pgvector pool, figure store, Gemini client
+and intent router are shared. Each chat session has its own ChatbotWrapper
+(conversation memory) in an LRU SessionStore and answers one turn at a time:
+a message for a session that is still busy (including one whose previous
+request timed out but whose worker is still running) gets 409. The CLI's stdin prompts are request parameters here: `fallback`
+for the retrieval threshold fallback, and `run_query` / `query` for the chat
+"run a query for this?" confirmation.
+"""
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from pipeline.chatbot import ChatbotWrapper
+from pipeline.intent import IntentRouter
+from pipeline.run_query import run_query_pipeline_concurrent
+from pipeline.timing import StageTimer
+from pipeline.telemetry import prometheus_text
+from config import (
+    SERVICE_MAX_CONCURRENT, SERVICE_REQUEST_TIMEOUT_SECS, SERVICE_MAX_SESSIONS, SERVICE_SESSION_TTL_SECS,
+    SERVICE_RETRIEVAL_FALLBACK, INTENT_ROUTER_ENABLED,
+)
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class SessionBusy(RuntimeError):
+    pass
+
+
+class ServiceTimeout(Exception):
+    """The request's own deadline (SERVICE_REQUEST_TIMEOUT_SECS) passed; the pipeline itself did not fail."""
+
+
+def parse_fallback(value):
+    """Request `fallback` -> retrieve_chunks fallback ("ask" is not allowed in a service)."""
+    if value is None:
+        return SERVICE_RETRIEVAL_FALLBACK
+    if value in ("best", "none"):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise BadRequest('fallback must be "best", "none" or a minimum similarity') from None
+
+
+class SessionStore:
+    def __init__(self, factory, max_sessions=SERVICE_MAX_SESSIONS, ttl_secs=SERVICE_SESSION_TTL_SECS):
+        """
+        LRU of chat sessions; only touched from the event loop thread.
+
+        Args:
+            factory: Callable returning a new ChatbotWrapper.
+            max_sessions (int): Least recently used sessions beyond this are dropped.
+            ttl_secs (float): Sessions idle for longer are dropped.
+        """
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.ttl_secs = ttl_secs
+        self._sessions = OrderedDict()  # session_id -> [chatbot, asyncio.Lock, last used]
+
+    def _expire(self, now):
+        while self._sessions:
+            session_id, (_, lock, last_used) = next(iter(self._sessions.items()))
+            if now - last_used <= self.ttl_secs or lock.locked():
+                break
+            del self._sessions[session_id]
+
+    def get(self, session_id=None):
+        """(session_id, chatbot, lock) for an existing session, or a new one."""
+        now = time.monotonic()
+        self._expire(now)
+        if session_id in self._sessions:
+            self._sessions.move_to_end(session_id)
+            entry = self._sessions[session_id]
+            entry[2] = now
+            return session_id, entry[0], entry[1]
+        session_id = session_id or uuid.uuid4().hex
+        self._sessions[session_id] = [self.factory(), asyncio.Lock(), now]
+        while len(self._sessions) > self.max_sessions:
+            # Least recently used idle session; one mid-turn is kept (its worker still uses the chatbot)
+            idle = next((sid for sid, (_, lock, _) in self._sessions.items()
+                         if sid != session_id and not lock.locked()), None)
+            if idle is None:
+                break
+            del self._sessions[idle]
+        return session_id, self._sessions[session_id][0], self._sessions[session_id][1]
+
+    def drop(self, session_id):
+        return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class QueryService:
+    def __init__(self, pool, figure_store, client, pipeline_func=run_query_pipeline_concurrent,
+                 max_concurrent=SERVICE_MAX_CONCURRENT, timeout_secs=SERVICE_REQUEST_TIMEOUT_SECS,
+                 max_sessions=SERVICE_MAX_SESSIONS, session_ttl_secs=SERVICE_SESSION_TTL_SECS):
+        self.pool = pool
+        self.figure_store = figure_store
+        self.client = client
+        self.pipeline_func = pipeline_func
+        self.timeout_secs = timeout_secs
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="service")
+        self.router = IntentRouter() if INTENT_ROUTER_ENABLED else False
+        self.sessions = SessionStore(self._new_chatbot, max_sessions, session_ttl_secs)
+        self.max_concurrent = max_concurrent
+        self._slots = None  # created on the event loop
+        self.in_flight = 0
+        self.completed = 0
+        self.timeouts = 0
+
+    def _new_chatbot(self):
+        return ChatbotWrapper(self.pipeline_func, self.pool, self.figure_store, self.client,
+                              concurrent=True, router=self.router, retrieval_fallback=SERVICE_RETRIEVAL_FALLBACK)
+
+    # -----------------------------
+    # Running blocking work
+    # -----------------------------
+    async def _start(self, func, on_done=None):
+        """
+        Submit func to a worker once a slot is free; the slot is held until the thread finishes.
+        on_done() is called once the thread has finished (or if the request is cancelled while waiting for a slot).
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        try:
+            await self._slots.acquire()
+        except BaseException:
+            if on_done:
+                on_done()
+            raise
+        self.in_flight += 1
+        future = asyncio.get_running_loop().run_in_executor(self.executor, func)
+
+        def _done(f):
+            self.in_flight -= 1
+            self.completed += 1
+            self._slots.release()
+            if on_done:
+                on_done()
+            if not f.cancelled():
+                f.exception()  # retrieved, so a timed-out failure is not logged as unhandled
+
+        future.add_done_callback(_done)
+        return future
+
+    async def run_blocking(self, func, on_done=None):
+        future = await self._start(func, on_done)
+        # asyncio.wait does not cancel the worker's future, and a TimeoutError raised by the
+        # pipeline (DB / API timeout) stays an error of the pipeline rather than our deadline
+        done, _ = await asyncio.wait({future}, timeout=self.timeout_secs)
+        if not done:
+            # The worker cannot be interrupted; it keeps its slot (and session) until it returns
+            self.timeouts += 1
+            raise ServiceTimeout()
+        return future.result()
+
+    async def stream_blocking(self, request, make_chunks, finish, on_done=None):
+        """
+        Run a blocking chunk generator on a worker and relay it as NDJSON.
+        `finish()` (called on the worker after the last chunk) returns the final fields;
+        `on_done()` is called once the worker has finished.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def produce():
+            try:
+                chunks = make_chunks()
+                try:
+                    for chunk in chunks:
+                        if stop.is_set():
+                            break
+                        loop.call_soon_threadsafe(queue.put_nowait, {"delta": chunk})
+                finally:
+                    close = getattr(chunks, "close", None)
+                    if close:
+                        close()
+                loop.call_soon_threadsafe(queue.put_nowait, dict(finish(), done=True))
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, {"error": str(e), "done": True})
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        try:
+            await response.prepare(request)
+        except BaseException:
+            if on_done:
+                on_done()
+            raise
+        await self._start(produce, on_done)
+        deadline = loop.time() + self.timeout_secs
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    item = {"error": "timeout", "done": True}
+                await response.write((json.dumps(item, default=str) + "\n").encode("utf-8"))
+                if item.get("done"):
+                    break
+        finally:
+            stop.set()  # client gone or timed out: stop relaying after the current chunk
+        await response.write_eof()
+        return response
+
+    # -----------------------------
+    # Handlers
+    # -----------------------------
+    @staticmethod
+    async def _json(request):
+        try:
+            body = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise BadRequest("body must be JSON") from None
+        if not isinstance(body, dict):
+            raise BadRequest("body must be a JSON object")
+        return body
+
+    @staticmethod
+    def _text(body, key, required=True):
+        value = body.get(key)
+        if value is None and not required:
+            return None
+        if not isinstance(value, str) or not value.strip():
+            raise BadRequest(f"{key} must be a non-empty string")
+        return value.strip()
+
+    def _query_call(self, body, stream):
+        query_text = self._text(body, "query")
+        fallback = parse_fallback(body.get("fallback"))
+        timer = StageTimer("query", endpoint="/query/stream" if stream else "/query")
+
+        def call():
+            return self.pipeline_func(query_text, None, self.pool, self.figure_store, self.client,
+                                      timer=timer, stream=stream, fallback=fallback)
+        return call, timer
+
+    async def query(self, request):
+        call, timer = self._query_call(await self._json(request), stream=False)
+        answer = await self.run_blocking(call)
+        return web.json_response({"answer": answer, "timings": timer.summary(), "trace_id": timer.trace_id})
+
+    async def query_stream(self, request):
+        call, timer = self._query_call(await self._json(request), stream=True)
+        return await self.stream_blocking(request, call,
+                                          lambda: {"timings": timer.summary(), "trace_id": timer.trace_id})
+
+    def _chat_call(self, body, stream):
+        message = self._text(body, "message")
+        run_query = bool(body.get("run_query", False))
+        query_text = self._text(body, "query", required=False)
+        fallback = parse_fallback(body.get("fallback"))
+        session_id, chatbot, lock = self.sessions.get(self._text(body, "session_id", required=False))
+        if lock.locked():
+            raise SessionBusy(f"session {session_id} is still answering a previous message")
+
+        def confirm(_):
+            return run_query, query_text
+
+        def call():
+            chatbot.last_timings = None
+            chatbot.last_trace_id = None
+            chatbot.retrieval_fallback = fallback
+            if stream:
+                return chatbot.respond_stream(message, confirm=confirm)
+            return chatbot.respond(message, confirm=confirm)
+
+        def result():
+            return {"session_id": session_id, "needed_query": chatbot.last_needed_query,
+                    "timings": chatbot.last_timings, "trace_id": chatbot.last_trace_id}
+        return call, result, lock
+
+    # The session lock is taken right after _chat_call's busy check (uncontended, so without
+    # yielding) and released by the worker's completion, not by this request: after a timeout
+    # the next turn must not run next to the one still in the worker.
+    async def chat(self, request):
+        call, result, lock = self._chat_call(await self._json(request), stream=False)
+        await lock.acquire()
+        answer = await self.run_blocking(call, on_done=lock.release)
+        return web.json_response(dict(result(), answer=answer))
+
+    async def chat_stream(self, request):
+        call, result, lock = self._chat_call(await self._json(request), stream=True)
+        await lock.acquire()
+        return await self.stream_blocking(request, call, result, on_done=lock.release)
+
+    async def drop_session(self, request):
+        return web.json_response({"dropped": self.sessions.drop(request.match_info["session_id"])})
+
+    async def metrics(self, request):
+        return web.Response(text=prometheus_text(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Prometheus-Format": "0.0.4"})
+
+    async def health(self, request):
+        return web.json_response({
+            "status": "ok",
+            "sessions": len(self.sessions),
+            "in_flight": self.in_flight,
+            "max_concurrent": self.max_concurrent,
+            "completed": self.completed,
+            "timeouts": self.timeouts,
+        })
+
+
+@web.middleware
+async def _errors(request, handler):
+    try:
+        return await handler(request)
+    except BadRequest as e:
+        return web.json_response({"error": str(e)}, status=400)
+    except SessionBusy as e:
+        return web.json_response({"error": str(e)}, status=409)
+    except ServiceTimeout:
+        return web.json_response({"error": "timeout"}, status=504)
+    except TimeoutError as e:
+        # Raised inside the pipeline (DB / API timeout); aiohttp would otherwise answer 504 as if it were our deadline
+        return web.json_response({"error": f"pipeline timeout: {e}"}, status=500)
+
+
+def create_app(pool, figure_store, client, **service_kwargs):
+    """aiohttp application serving the pipeline; see the module docstring for the endpoints."""
+    service = QueryService(pool, figure_store, client, **service_kwargs)
+    app = web.Application(middlewares=[_errors])
+    app["service"] = service
+    app.router.add_post("/query", service.query)
+    app.router.add_post("/query/stream", service.query_stream)
+    app.router.add_post("/chat", service.chat)
+    app.router.add_post("/chat/stream", service.chat_stream)
+    app.router.add_delete("/sessions/{session_id}", service.drop_session)
+    app.router.add_get("/health", service.health)
+    app.router.add_get("/metrics", service.metrics)
+
+    async def _shutdown(app):
+        service.executor.shutdown(wait=False, cancel_futures=True)
+    app.on_cleanup.append(_shutdown)
+    return app
@@ -0,0 +1,88 @@
+"""
+Generator stages with bounded buffers for the ingestion pipeline.
+
+`prefetch` runs a generator on a background thread and hands its items over
+through a bounded queue; `bounded_map` applies a function on a thread pool with
+a fixed number of items in flight. Both only pull from their input when there
+is room, so a slow consumer throttles every stage upstream of it and memory
+stays proportional to the buffer sizes, not to the input.
+"""
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline import telemetry
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def prefetch(iterable, maxsize=1, name="prefetch"):
+    """
+    Iterate `iterable` on a background thread, at most `maxsize` items ahead.
+
+    Exceptions raised by the producer are re-raised in the consumer. Closing the
+    returned generator early stops the producer at its next item.
+    """
+    buffer = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce():
+        try:
+            for item in iterable:
+                if not _put(item):
+                    return
+            _put(_DONE)
+        except BaseException as e:
+            _put(_Failure(e))
+
+    thread = threading.Thread(target=telemetry.propagate(_produce), name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def bounded_map(func, iterable, max_in_flight=4, name="stage"):
+    """
+    Ordered, concurrent map: yield func(item) for each item, in input order,
+    with at most `max_in_flight` calls running or finished-but-unconsumed.
+    """
+    if max_in_flight <= 1:
+        for item in iterable:
+            yield func(item)
+        return
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix=name) as executor:
+        pending = deque()
+        try:
+            for item in iterable:
+                pending.append(executor.submit(telemetry.propagate(func), item))
+                if len(pending) >= max_in_flight:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
@@ -1,16 +1,40 @@
-from PIL import Image
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import cv2
-def summarize_image(client,img, prompt):
+from google.genai import types
+
+from pipeline.ratelimit import RateLimiter, call_with_retry, estimate_tokens
+from pipeline.cache import get_summary_cache
+from pipeline import telemetry
+from config import (
+    SUMMARY_MODEL, SUMMARY_MAX_IN_FLIGHT, SUMMARY_REQUESTS_PER_MINUTE, SUMMARY_TOKENS_PER_MINUTE,
+    SUMMARY_MAX_RETRIES, SUMMARY_MAX_IMAGE_SIDE, SUMMARY_IMAGE_FORMAT, SUMMARY_CACHE_KEY,
+)
+
+CHART_PROMPT = "Summarize chart in 3-4 sentences: include title, axes, main trends."
+TABLE_PROMPT = "Summarize table in 6-8 sentences including title, rows, columns, trends, highest/lowest values."
+
+# Gemini bills an image of up to 768x768 tiles at ~258 tokens each
+_IMAGE_TILE_TOKENS = 258
+
+# Shared by every caller in the process so concurrent runs respect one budget
+_summary_rate_limiter = RateLimiter(SUMMARY_REQUESTS_PER_MINUTE, SUMMARY_TOKENS_PER_MINUTE)
+
+
+def summarize_image(client,img, prompt, model=SUMMARY_MODEL):
     """
     Core Gemini summarization function.
-    img: PIL Image
+    img: PIL Image or google.genai types.Part
     prompt: str
     Returns summarized text
     """
-    resp = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=[prompt, img]  # list of str + image
-    )
+    with telemetry.external("gemini", "summarize_figure", tokens_in=estimate_tokens(prompt)) as call:
+        resp = client.models.generate_content(
+            model=model,
+            contents=[prompt, img]  # list of str + image
+        )
+        call.set(tokens_out=estimate_tokens(resp.text))
     text = " ".join(
         line.strip().replace("|", " ")
         for line in resp.text.strip().split("\n")
@@ -18,35 +42,127 @@ def summarize_image(client,img, prompt):
     )
     return text
 
-def summarize_all_table_chart_nodes_in_memory(client,table_chart_nodes):
+
+def encode_crop(img, max_side=SUMMARY_MAX_IMAGE_SIDE, fmt=SUMMARY_IMAGE_FORMAT):
+    """
+    Downscale a BGR crop so its longest side is at most max_side and encode it once.
+
+    Returns:
+        tuple: (encoded bytes, mime type, (height, width) after downscaling)
+    """
+    h, w = img.shape[:2]
+    scale = max_side / max(h, w)
+    if scale < 1:
+        img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    ext, mime = (".jpg", "image/jpeg") if fmt == "jpeg" else (".png", "image/png")
+    params = [cv2.IMWRITE_JPEG_QUALITY, 90] if fmt == "jpeg" else []
+    ok, buf = cv2.imencode(ext, img, params)
+    if not ok:
+        raise ValueError(f"Could not encode crop as {fmt}")
+    return buf.tobytes(), mime, img.shape[:2]
+
+
+def perceptual_hash(img, hash_size=8):
+    """64-bit difference hash (dHash) of a BGR image, as hex; robust to re-rendering noise."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return f"{int(''.join('1' if b else '0' for b in bits), 2):0{hash_size * hash_size // 4}x}"
+
+
+def image_key(img, encoded, key_mode=SUMMARY_CACHE_KEY):
+    """Cache identity of a crop: sha256 of the encoded bytes, or dHash + aspect ratio bucket."""
+    if key_mode == "perceptual":
+        h, w = img.shape[:2]
+        return f"dhash:{perceptual_hash(img)}:{round(w / h, 1)}"
+    return "sha256:" + hashlib.sha256(encoded).hexdigest()
+
+
+def _image_tokens(shape):
+    h, w = shape
+    return _IMAGE_TILE_TOKENS * max(1, -(-h // 768)) * max(1, -(-w // 768))
+
+
+def summarize_all_table_chart_nodes_in_memory(client,table_chart_nodes, max_workers=SUMMARY_MAX_IN_FLIGHT,
+                                              rate_limiter=None, max_retries=SUMMARY_MAX_RETRIES,
+                                              cache=None, model=SUMMARY_MODEL):
     """
     Summarizes all in-memory chart/table nodes using Gemini.
 
+    Crops are downscaled and encoded once, looked up in the summary cache, and
+    only the misses are sent to Gemini through a bounded thread pool with rate
+    limiting and retries. Each summary is cached as soon as it arrives, so a
+    failing crop does not lose the others: they are cache hits on the next run.
+
     table_chart_nodes: list of dicts, each dict has keys:
         - "img": numpy array (BGR from cv2)
         - "placeholder": string
         - "page_num": int
         - "node-type": "chart" or "table"
 
+    Returns:
+        list[dict]: Copies of the nodes, in order, with "text" added and "img" dropped.
     """
-    summarized_nodes = []
+    rate_limiter = rate_limiter or _summary_rate_limiter
+    cache = cache if cache is not None else get_summary_cache()
 
+    jobs = []
     for node in table_chart_nodes:
         # Choose prompt based on node type
-        prompt = (
-            "Summarize chart in 3-4 sentences: include title, axes, main trends."
-            if node["node-type"] == "chart"
-            else "Summarize table in 6-8 sentences including title, rows, columns, trends, highest/lowest values."
-        )
+        prompt = CHART_PROMPT if node["node-type"] == "chart" else TABLE_PROMPT
+        encoded, mime, shape = encode_crop(node["img"])
+        key = cache.key(model, prompt, image_key(node["img"], encoded)) if cache else None
+        jobs.append({"prompt": prompt, "bytes": encoded, "mime": mime, "shape": shape, "key": key})
+
+    summaries = [None] * len(jobs)
+    if cache:
+        cached = cache.lookup({job["key"] for job in jobs})
+        for i, job in enumerate(jobs):
+            if job["key"] in cached:
+                summaries[i] = cached[job["key"]]
 
-        # Convert OpenCV BGR numpy array to PIL RGB image
-        pil_img = Image.fromarray(cv2.cvtColor(node["img"], cv2.COLOR_BGR2RGB))
+    # Identical crops within this call are summarized once
+    pending = {}
+    for i, job in enumerate(jobs):
+        if summaries[i] is None:
+            pending.setdefault(job["key"] or i, []).append(i)
 
-        # Call Gemini
-        summary = summarize_image(client,pil_img, prompt)
+    def _summarize(i):
+        job = jobs[i]
+        part = types.Part.from_bytes(data=job["bytes"], mime_type=job["mime"])
 
-        # Create a copy of the node with the summary
-        node_copy = node.copy()
+        def _call():
+            rate_limiter.acquire(estimate_tokens(job["prompt"]) + _image_tokens(job["shape"]))
+            return summarize_image(client, part, job["prompt"], model=model)
+        summary = call_with_retry(_call, max_retries=max_retries)
+        if cache:
+            cache.store_summary(job["key"], summary)
+        return summary
+
+    errors = []
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as executor:
+            futures = {executor.submit(telemetry.propagate(_summarize), idxs[0]): idxs for idxs in pending.values()}
+            for future in as_completed(futures):
+                idxs = futures[future]
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    errors.append((table_chart_nodes[idxs[0]]["placeholder"], e))
+                    continue
+                for i in idxs:
+                    summaries[i] = summary
+    if len(jobs) > 1:
+        print(f"Summary cache: {len(jobs) - sum(len(v) for v in pending.values())} hits, "
+              f"{len(pending)} crops sent to Gemini")
+    if errors:
+        placeholder, first = errors[0]
+        raise RuntimeError(f"{len(errors)}/{len(pending)} summaries failed (first: {placeholder}: {first})") from first
+
+    summarized_nodes = []
+    for node, summary in zip(table_chart_nodes, summaries):
+        # Create a copy of the node with the summary; the crop is not needed downstream
+        node_copy = {k: v for k, v in node.items() if k != "img"}
         node_copy["text"] = summary
         summarized_nodes.append(node_copy)
 
@@ -0,0 +1,374 @@
+"""
+Lightweight tracing and metrics for the query and ingestion pipelines.
+
+Metrics (process-wide, thread-safe, Prometheus text format via prometheus_text()):
+    rag_stage_seconds{stage}                        histogram, StageTimer stages of a query
+    rag_span_seconds{span}                          histogram, other pipeline functions
+    rag_external_seconds{service,operation}         histogram, Gemini / Postgres / YOLO / cross-encoder calls
+    rag_external_calls_total{service,operation,status}
+    rag_tokens_total{service,operation,direction}   estimated tokens sent / received
+    rag_traces_total{name}
+
+Traces: every StageTimer starts one (its trace_id is the correlation id in
+the logs). Spans opened while a traced stage is running, in the same thread
+or in a thread pool task wrapped by StageTimer.timed / propagate(), are
+attached to it. A sampled trace (TELEMETRY_SAMPLE_RATE) is appended as one
+JSON line to TELEMETRY_LOG_PATH when the query finishes; the file is rotated
+to <path>.1 once it passes TELEMETRY_LOG_MAX_BYTES. User text is recorded
+through text_attrs(), which keeps only its length and hash unless
+TELEMETRY_LOG_QUERY_TEXT is on.
+
+With TELEMETRY_ENABLED off, span()/external() return a shared no-op object and
+the metric helpers return immediately.
+"""
+import bisect
+import contextvars
+import hashlib
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from functools import partial, wraps
+
+from config import (
+    TELEMETRY_ENABLED, TELEMETRY_SAMPLE_RATE, TELEMETRY_LOG_PATH, TELEMETRY_LOG_MAX_BYTES, TELEMETRY_LOG_QUERY_TEXT,
+)
+
+# Spans kept per trace (a large PDF makes thousands of API calls); the rest are only counted
+TRACE_MAX_SPANS = 2000
+
+# Seconds; covers sub-millisecond lookups up to long Gemini generations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_HELP = {
+    "rag_stage_seconds": ("histogram", "Query pipeline stage duration"),
+    "rag_span_seconds": ("histogram", "Pipeline function duration"),
+    "rag_external_seconds": ("histogram", "External call duration (Gemini, Postgres, YOLO, cross-encoder)"),
+    "rag_external_calls_total": ("counter", "External calls by outcome"),
+    "rag_tokens_total": ("counter", "Estimated tokens sent to / received from models"),
+    "rag_traces_total": ("counter", "Traces started"),
+}
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, /, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, /, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            hist[i] += 1
+            hist[-1] += value
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items:
+            return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+    def prometheus_text(self):
+        """Every metric in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+        lines, seen = [], set()
+
+        def _header(name):
+            if name not in seen:
+                seen.add(name)
+                kind, help_text = METRIC_HELP.get(name, ("untyped", name))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(counters.items()):
+            _header(name)
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), hist in sorted(histograms.items()):
+            _header(name)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), hist[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{self._labels(labels)} {hist[-1]:.6f}")
+            lines.append(f"{name}_count{self._labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """{"counters": {...}, "histograms": {...: {"count", "sum"}}} with labels flattened into the key."""
+        with self._lock:
+            return {
+                "counters": {name + self._labels(labels): value for (name, labels), value in self._counters.items()},
+                "histograms": {name + self._labels(labels): {"count": sum(hist[:-1]), "sum": round(hist[-1], 6)}
+                               for (name, labels), hist in self._histograms.items()},
+            }
+
+
+REGISTRY = MetricsRegistry()
+
+
+def inc(name, value=1, /, **labels):
+    if TELEMETRY_ENABLED:
+        REGISTRY.inc(name, value, **labels)
+
+
+def observe(name, value, /, **labels):
+    if TELEMETRY_ENABLED:
+        REGISTRY.observe(name, value, **labels)
+
+
+def prometheus_text():
+    return REGISTRY.prometheus_text()
+
+
+def write_prometheus(path):
+    """Write the metrics for the node_exporter textfile collector (atomic rename), e.g. after an ingestion run."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+
+# -----------------------------
+# Traces and spans
+# -----------------------------
+_span_ids = itertools.count(1)
+_active = contextvars.ContextVar("telemetry_active_span", default=None)  # (trace, span)
+_log_lock = threading.Lock()
+
+
+class Trace:
+    def __init__(self, name, sampled, **attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.sampled = sampled
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc)
+        self.spans = []
+        self.dropped_spans = 0
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def add_span(self, record):
+        with self._lock:
+            if len(self.spans) < TRACE_MAX_SPANS:
+                self.spans.append(record)
+            else:
+                self.dropped_spans += 1
+
+    def to_dict(self, **fields):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+        return dict({
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "start": self.started_at.isoformat(timespec="milliseconds"),
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "attrs": self.attrs,
+            "spans": spans,
+            "dropped_spans": self.dropped_spans,
+        }, **fields)
+
+    def finish(self, log_path=None, max_bytes=None, **fields):
+        """Append the trace to the JSON log (once, and only if sampled)."""
+        if self.finished:
+            return
+        self.finished = True
+        if not self.sampled:
+            return
+        log_path = log_path or TELEMETRY_LOG_PATH
+        max_bytes = TELEMETRY_LOG_MAX_BYTES if max_bytes is None else max_bytes
+        line = json.dumps(self.to_dict(**fields), default=str)
+        with _log_lock:
+            os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+            if max_bytes and os.path.exists(log_path) and os.path.getsize(log_path) >= max_bytes:
+                os.replace(log_path, log_path + ".1")
+            with open(log_path, "a") as f:
+                f.write(line + "\n")
+
+
+def text_attrs(name, text, keep_text=None):
+    """
+    Trace attributes for user text: {name: text} when TELEMETRY_LOG_QUERY_TEXT
+    is on, otherwise only {name_chars, name_sha1} (enough to group repeats).
+    """
+    keep_text = TELEMETRY_LOG_QUERY_TEXT if keep_text is None else keep_text
+    if keep_text:
+        return {name: text}
+    text = text or ""
+    return {f"{name}_chars": len(text), f"{name}_sha1": hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]}
+
+
+def start_trace(name, sample_rate=None, **attrs):
+    """New trace, or None when telemetry is disabled."""
+    if not TELEMETRY_ENABLED:
+        return None
+    sample_rate = TELEMETRY_SAMPLE_RATE if sample_rate is None else sample_rate
+    inc("rag_traces_total", name=name)
+    return Trace(name, random.random() < sample_rate, **attrs)
+
+
+def current_trace():
+    active = _active.get()
+    return active[0] if active else None
+
+
+class Span:
+    """Times a block; use via span() / external()."""
+    __slots__ = ("name", "trace", "attrs", "metric", "labels", "span_id", "parent_id", "start", "_token")
+
+    def __init__(self, name, trace=None, metric="rag_span_seconds", labels=None, **attrs):
+        self.name = name
+        self.trace = trace
+        self.attrs = attrs
+        self.metric = metric
+        self.labels = labels if labels is not None else {"span": name}
+        self._token = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def __enter__(self):
+        active = _active.get()
+        if self.trace is None and active:
+            self.trace = active[0]
+        self.parent_id = active[1].span_id if active and active[0] is self.trace else None
+        self.span_id = next(_span_ids)
+        if self.trace is not None:
+            self._token = _active.set((self.trace, self))
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        if self._token is not None:
+            try:
+                _active.reset(self._token)
+            except ValueError:
+                pass  # a generator finished in another context (e.g. closed by the garbage collector)
+        if self.metric:
+            REGISTRY.observe(self.metric, seconds, **self.labels)
+        self._finished(seconds, exc_type)
+        if self.trace is not None and self.trace.sampled:
+            record = {"name": self.name, "span_id": self.span_id, "parent_id": self.parent_id,
+                      "start_ms": round((self.start - self.trace.started) * 1000, 2),
+                      "duration_ms": round(seconds * 1000, 2)}
+            if self.attrs:
+                record["attrs"] = self.attrs
+            if exc_type is not None:
+                record["error"] = exc_type.__name__
+            self.trace.add_span(record)
+        return False
+
+    def _finished(self, seconds, exc_type):
+        pass
+
+
+class ExternalCall(Span):
+    """Span around a call to another system; also counts calls by status and tokens."""
+    __slots__ = ()
+
+    def __init__(self, service, operation, trace=None, **attrs):
+        super().__init__(f"{service}.{operation}", trace, "rag_external_seconds",
+                         {"service": service, "operation": operation}, **attrs)
+
+    def _finished(self, seconds, exc_type):
+        REGISTRY.inc("rag_external_calls_total", status="error" if exc_type else "ok", **self.labels)
+        for direction in ("tokens_in", "tokens_out"):
+            if self.attrs.get(direction):
+                REGISTRY.inc("rag_tokens_total", self.attrs[direction], direction=direction[len("tokens_"):],
+                             **self.labels)
+
+
+class _NoopSpan:
+    __slots__ = ()
+    trace = None
+
+    def set(self, **attrs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name, trace=None, metric="rag_span_seconds", **attrs):
+    """
+    Time a pipeline function:
+
+        with telemetry.span("match_figures") as s:
+            ...
+            s.set(figures=len(figures))
+    """
+    if not TELEMETRY_ENABLED:
+        return _NOOP
+    return Span(name, trace, metric, **attrs)
+
+
+def traced(name=None):
+    """Decorator: run every call of the function inside span(name or the function's name)."""
+    def decorate(func):
+        span_name = name or func.__name__
+
+        @wraps(func)
+        def _traced(*args, **kwargs):
+            if not TELEMETRY_ENABLED:
+                return func(*args, **kwargs)
+            with Span(span_name):
+                return func(*args, **kwargs)
+        return _traced
+    return decorate
+
+
+def annotate(**attrs):
+    """Add attributes to the innermost open span of the current trace (no-op outside one)."""
+    active = _active.get()
+    if active:
+        active[1].attrs.update(attrs)
+
+
+def propagate(func):
+    """
+    func bound to a copy of the caller's context, so spans it opens on a worker
+    thread join the caller's trace. Copy per submit: a context can only be
+    entered by one thread at a time.
+    """
+    if not TELEMETRY_ENABLED:
+        return func
+    return partial(contextvars.copy_context().run, func)
+
+
+def external(service, operation, **attrs):
+    """Time a call to Gemini / Postgres / YOLO / the cross-encoder; set tokens_in / tokens_out when known."""
+    if not TELEMETRY_ENABLED:
+        return _NOOP
+    return ExternalCall(service, operation, **attrs)
@@ -0,0 +1,76 @@
+"""
+Per-stage wall-clock timings for one query (thread-safe, so concurrent stages
+can record into the same timer).
+
+Each timer is also a telemetry trace (see pipeline.telemetry): stages become
+spans, their durations feed the rag_stage_seconds histogram, and log() writes
+the sampled trace to the JSON trace log under `trace_id`.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from pipeline import telemetry
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimer:
+    def __init__(self, name="query", **attrs):
+        """
+        Args:
+            name (str): Trace name ("query", "chat", ...).
+            attrs: Extra fields for the trace log (e.g. the query text).
+        """
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+        self.trace = telemetry.start_trace(name, **attrs)
+        self.trace_id = self.trace.trace_id if self.trace else None
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+        telemetry.observe("rag_stage_seconds", seconds, stage=name)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            with telemetry.span(name, trace=self.trace, metric=None):
+                yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def annotate(self, **attrs):
+        """Add fields to the trace log entry (query length/hash, cache hit, ...)."""
+        if self.trace:
+            self.trace.attrs.update(attrs)
+
+    def timed(self, name, func):
+        """Wrap func so each call is recorded under `name` (for executor.submit)."""
+        @wraps(func)
+        def _timed(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+        return _timed
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        """{stage: ms, ..., "total": ms}"""
+        with self._lock:
+            out = {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()}
+        out["total"] = round(self.total() * 1000, 1)
+        return out
+
+    def log(self, label="Stage timings", **fields):
+        """Log the stage timings and write the trace log (fields are added to it)."""
+        summary = self.summary()
+        trace = f" [trace {self.trace_id}]" if self.trace_id else ""
+        logger.info("⏱️ %s: %s%s", label, ", ".join(f"{name}={ms:.0f}ms" for name, ms in summary.items()), trace)
+        if self.trace:
+            self.trace.finish(stages_ms=summary, **fields)